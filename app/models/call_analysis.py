@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Literal
 
 class CallAnalysisRequest(BaseModel):
     transcription_filename: Optional[str] = Field(None, description="Имя файла транскрипции в директории transcription")
@@ -15,4 +15,54 @@ class CallAnalysisRequest(BaseModel):
 class CallAnalysisResponse(BaseModel):
     success: bool
     message: str
-    data: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = None
+
+class CriterionScore(BaseModel):
+    """Оценка работы администратора по одному критерию"""
+    score: float = Field(..., ge=0, le=10, description="Оценка по критерию (0-10)")
+    comment: str = Field(..., description="Разбор сильных и слабых сторон по критерию")
+
+class CallScores(BaseModel):
+    """Оценки по пунктам чеклиста"""
+    greeting: CriterionScore = Field(..., description="Приветствие")
+    needs_identification: CriterionScore = Field(..., description="Выявление потребностей")
+    solution_proposal: CriterionScore = Field(..., description="Презентация врача, клиники и услуг")
+    objection_handling: CriterionScore = Field(..., description="Работа с возражениями")
+    call_closing: CriterionScore = Field(..., description="Закрытие продажи")
+    overall_score: CriterionScore = Field(..., description="Общая оценка с учетом всех факторов")
+
+# Отметка подкритерия: ✅ - выполнен, ± - выполнен частично, ! - не выполнен
+SubcriterionMark = Optional[Literal["✅", "±", "!"]]
+
+class StructuredSubcriteria(BaseModel):
+    """Подкритерии в ответе LLM (поля CallSubcriteria); null - подкритерий не применим"""
+    greeting: SubcriterionMark = Field(None, description="Оценка приветствия")
+    patient_name: SubcriterionMark = Field(None, description="Выяснение имени пациента")
+    need_identification: SubcriterionMark = Field(None, description="Выявление потребностей")
+    clinic_presentation: SubcriterionMark = Field(None, description="Презентация клиники")
+    service_presentation: SubcriterionMark = Field(None, description="Презентация услуг")
+    doctor_presentation: SubcriterionMark = Field(None, description="Презентация врачей")
+    appointment: SubcriterionMark = Field(None, description="Запись на приём")
+    price: SubcriterionMark = Field(None, description="Обсуждение цены")
+    address: SubcriterionMark = Field(None, description="Предоставление адреса")
+    passport: SubcriterionMark = Field(None, description="Напоминание о паспорте")
+    objection_handling: SubcriterionMark = Field(None, description="Работа с возражениями")
+    next_step: SubcriterionMark = Field(None, description="Обсуждение следующего шага")
+    speech_quality: SubcriterionMark = Field(None, description="Качество речи")
+    initiative: SubcriterionMark = Field(None, description="Проявление инициативы")
+    recall_appeal: SubcriterionMark = Field(None, description="Апелляция к предыдущему звонку")
+    clarification: SubcriterionMark = Field(None, description="Уточнение вопроса")
+
+class StructuredCallAnalysis(BaseModel):
+    """Схема ответа LLM: классификация, оценки и метрики звонка одним запросом"""
+    category_code: int = Field(..., ge=1, le=8, description="Код категории звонка (1-8)")
+    scores: CallScores = Field(..., description="Оценки по пунктам чеклиста")
+    subcriteria: StructuredSubcriteria = Field(..., description="Выполнение подкритериев: ✅ - выполнено, ± - частично, ! - не выполнено, null - не применимо")
+    tone: Literal["positive", "neutral", "negative"] = Field(..., description="Тональность разговора")
+    customer_satisfaction: Literal["high", "medium", "low"] = Field(..., description="Удовлетворенность клиента")
+    conversion: bool = Field(..., description="Клиент записался на прием")
+    call_type: Optional[Literal["входящий", "исходящий"]] = Field(None, description="Тип звонка")
+    call_category: Optional[Literal["первичка_1", "первичка_перезвон", "подтверждение", "вторичка"]] = Field(None, description="Категория звонка")
+    traffic_source: Optional[str] = Field(None, description="Источник трафика, если клиент его назвал")
+    client_request: Optional[str] = Field(None, description="Запрос клиента (краткое описание)")
+    recommendations: List[str] = Field(..., description="3-5 конкретных рекомендаций по улучшению")
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+
+class JobResponse(BaseModel):
+    success: bool
+    message: str
+    data: Optional[Dict[str, Any]] = None
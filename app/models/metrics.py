@@ -100,6 +100,7 @@ class CallMetricsRecord(BaseModel):
     comments: Optional[str] = Field(None, description="Комментарии к оценке")
     recommendations: Optional[List[str]] = Field(None, description="Рекомендации по улучшению")
     call_classification: int = Field(..., description="Классификация звонка (1-8)")
+    prompt_version: Optional[str] = Field(None, description="Версия промпта, по которому выполнен анализ")
     crm_link: Optional[str] = Field(None, description="Ссылка на карточку в CRM")
     transcription_link: Optional[str] = Field(None, description="Ссылка на транскрибацию")
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat(), description="Дата создания записи")
@@ -4,11 +4,22 @@ from datetime import datetime
 
 class TranscriptionRequest(BaseModel):
     audio_filename: str = Field(..., description="Имя файла в папке audio для транскрибации")
+    client_id: Optional[str] = Field(None, description="ID клиента AmoCRM (клиники), к которой относится запись")
     phone: Optional[str] = Field(None, description="Номер телефона для имени файла результата")
     note_id: Optional[int] = Field(None, description="ID заметки для связи с записью звонка")
     num_speakers: int = Field(2, description="Количество говорящих для распознавания")
     diarize: bool = Field(True, description="Включить диаризацию (разделение по говорящим)")
     administrator_id: Optional[str] = Field(None, description="ID администратора для обновления лимитов")
+    chunked: Optional[bool] = Field(None, description="Распознавать длинную запись параллельно по фрагментам")
+    preprocess: Optional[bool] = Field(None, description="Сжать запись перед распознаванием (моно, 16 кГц, без длинных пауз)")
+    
+class BulkTranscribeRequest(BaseModel):
+    client_id: str = Field(..., description="ID клиента AmoCRM (клиники)")
+    note_ids: Optional[List[int]] = Field(None, description="ID заметок о звонках")
+    date_from: Optional[str] = Field(None, description="Начало периода в формате ДД.ММ.ГГГГ (если note_ids не указаны)")
+    date_to: Optional[str] = Field(None, description="Конец периода в формате ДД.ММ.ГГГГ (по умолчанию равен date_from)")
+    num_speakers: int = Field(2, description="Количество говорящих для распознавания")
+    analyze: bool = Field(False, description="Поставить анализ звонков в очередь после транскрибации")
     
 class TranscriptionResponse(BaseModel):
     success: bool
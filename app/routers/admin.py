@@ -10,6 +10,7 @@ from ..services.clinic_service import ClinicService
 from ..services.limits_service import LimitsService
 # from ..services.amocrm_service import AsyncAmoCRMClient
 from mlab_amo_async.amocrm_client import AsyncAmoCRMClient
+from ..services.amocrm_client_registry import amocrm_clients
 from motor.motor_asyncio import AsyncIOMotorClient
 
 
@@ -171,6 +172,7 @@ async def refresh_amocrm_token(
                         data["refresh_token"], 
                         clinic["amocrm_subdomain"]
                     )
+                    await amocrm_clients.invalidate(clinic["client_id"])
                     
                     return ApiResponse(
                         success=True,
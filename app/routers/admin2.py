@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, status
 from typing import Optional
 from ..models.amocrm import AmoCRMAuthRequest, APIResponse
 from mlab_amo_async.amocrm_client import AsyncAmoCRMClient
+from ..services.amocrm_client_registry import amocrm_clients
 import logging
 
 # Настраиваем логирование
@@ -36,6 +37,7 @@ async def authenticate_amocrm(request: AmoCRMAuthRequest):
         
         # Инициализируем токены
         await client.init_token(request.auth_code)
+        await amocrm_clients.invalidate(request.client_id)
         
         logger.info(f"Успешная авторизация в AmoCRM для client_id={request.client_id}")
         
@@ -171,6 +173,7 @@ async def refresh_amocrm_token(
                             data["refresh_token"], 
                             subdomain
                         )
+                        await amocrm_clients.invalidate(client_id)
                         
                         return {
                             "success": True,
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, status, Request, BackgroundTasks, Response
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import logging
@@ -8,10 +8,9 @@ import json
 import time
 import asyncio
 import aiofiles
-import aiohttp
 import re
-import ssl
 import traceback
+from urllib.parse import parse_qsl
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from ..models.amocrm import (
@@ -22,10 +21,18 @@ from ..models.amocrm import (
     ContactResponse, 
     CallResponse
 )
-from mlab_amo_async.amocrm_client import AsyncAmoCRMClient
+from ..services.amocrm_client_registry import amocrm_clients
+from ..services.amocrm_cache import amocrm_cache
 from ..utils.helpers import convert_date_to_timestamps, cleanup_temp_file
-from ..settings.paths import AUDIO_DIR
+from ..utils.downloads import stream_to_file, DownloadError
+from ..services.download_client import download_client
+from ..settings.storage import audio_storage
 from ..services.clinic_service import ClinicService
+from ..services.audio_catalog_service import audio_catalog_service
+from ..services.note_resolver_service import note_resolver_service
+from ..services.amocrm_pager import iter_pages
+from ..services.call_ingest_service import find_call_link
+from ..services.webhook_service import amocrm_webhook_service, parse_webhook_form
 
 
 logger = logging.getLogger(__name__)
@@ -236,6 +243,30 @@ DB_NAME = "medai"
 #         # Далее идет оригинальный код...
 
 
+def _leads_filter(start_timestamp: int, end_timestamp: int) -> Dict[str, Any]:
+    """Параметры фильтрации сделок AmoCRM по дате создания"""
+    return {
+        "filter[created_at][from]": start_timestamp,
+        "filter[created_at][to]": end_timestamp
+    }
+
+
+def _format_lead(lead: Dict[str, Any]) -> Dict[str, Any]:
+    """Данные о сделке в читаемом виде"""
+    created_at = lead.get("created_at")
+    created_date = datetime.fromtimestamp(created_at).strftime("%d.%m.%Y %H:%M:%S") if created_at else "Неизвестно"
+    return {
+        "id": lead.get("id"),
+        "name": lead.get("name", "Без названия"),
+        "created_at": created_at,
+        "created_date": created_date,
+        "pipeline_id": lead.get("pipeline_id"),
+        "status_id": lead.get("status_id"),
+        "responsible_user_id": lead.get("responsible_user_id"),
+        "price": lead.get("price", 0)
+    }
+
+
 @router.post("/api/amocrm/leads/by-date", response_model=APIResponse)
 async def get_leads_by_date(request: LeadsByDateRequest):
     """
@@ -267,83 +298,21 @@ async def get_leads_by_date(request: LeadsByDateRequest):
             )
         
         # Создаем экземпляр клиента с данными из клиники
-        client = AsyncAmoCRMClient(
-            client_id=clinic["client_id"],
-            client_secret=clinic["client_secret"],  
-            subdomain=clinic["amocrm_subdomain"],      
-            redirect_url=clinic["redirect_url"],   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
-        
-        # Получаем все сделки с пагинацией
-        all_leads = []
-        page = 1
-        
-        while True:
-            # Параметры фильтрации для AmoCRM
-            filter_params = {
-                "filter[created_at][from]": start_timestamp,
-                "filter[created_at][to]": end_timestamp,
-                "page": page,
-                "limit": 250  # Максимальное количество результатов на страницу
-            }
-            
-            # Получаем сделки с фильтрацией по дате
-            leads_response, status_code = await client.leads.request(
-                "get",
-                "leads",
-                params=filter_params
-            )
-            
-            # Проверяем успешность запроса
-            if status_code != 200:
-                logger.error(f"Ошибка при запросе сделок (страница {page}): HTTP {status_code}")
-                break
-            
-            # Извлекаем сделки из ответа
-            if "_embedded" in leads_response and "leads" in leads_response["_embedded"]:
-                leads = leads_response["_embedded"]["leads"]
-                all_leads.extend(leads)
-                logger.info(f"Получено {len(leads)} сделок на странице {page}")
-                
-                # Проверяем, есть ли следующая страница
-                if "_links" in leads_response and "next" in leads_response["_links"]:
-                    page += 1
-                else:
-                    break
-            else:
-                break
-        
-        logger.info(f"Всего найдено {len(all_leads)} сделок за {request.date}")
+        client = await amocrm_clients.get(clinic["client_id"])
         
-        # Форматируем данные для ответа
+        # Страницы сделок загружаются по очереди, до последней
         formatted_leads = []
-        for lead in all_leads:
-            # Форматируем данные о сделке для более читаемого вида
-            created_at = lead.get("created_at")
-            created_date = datetime.fromtimestamp(created_at).strftime("%d.%m.%Y %H:%M:%S") if created_at else "Неизвестно"
-            
-            # Базовая информация о сделке
-            formatted_lead = {
-                "id": lead.get("id"),
-                "name": lead.get("name", "Без названия"),
-                "created_at": created_at,
-                "created_date": created_date,
-                "pipeline_id": lead.get("pipeline_id"),
-                "status_id": lead.get("status_id"),
-                "responsible_user_id": lead.get("responsible_user_id"),
-                "price": lead.get("price", 0)
-            }
-            
-            formatted_leads.append(formatted_lead)
+        async for leads in iter_pages(client, "leads", _leads_filter(start_timestamp, end_timestamp), "leads"):
+            formatted_leads.extend(_format_lead(lead) for lead in leads)
+        
+        logger.info(f"Всего найдено {len(formatted_leads)} сделок за {request.date}")
         
         return APIResponse(
             success=True,
-            message=f"Найдено {len(all_leads)} сделок за {request.date}",
+            message=f"Найдено {len(formatted_leads)} сделок за {request.date}",
             data={
                 "date": request.date,
-                "total_leads": len(all_leads),
+                "total_leads": len(formatted_leads),
                 "leads": formatted_leads
             }
         )
@@ -355,9 +324,75 @@ async def get_leads_by_date(request: LeadsByDateRequest):
             message=error_msg,
             data=None
         )
-    finally:
-        if 'client' in locals():
-            await client.close()
+
+@router.post("/leads/by-date/stream")
+async def stream_leads_by_date(request: LeadsByDateRequest):
+    """
+    Потоковое получение сделок по дате создания в формате NDJSON.
+    Каждая строка - {"lead": {...}} и отправляется сразу по мере загрузки страниц,
+    последняя строка - {"done": true, "total_leads": N} или {"error": "..."}.
+    """
+    logger.info(f"Потоковый запрос сделок по дате: client_id={request.client_id}, date={request.date}")
+    
+    clinic = await ClinicService().find_clinic_by_client_id(request.client_id)
+    if not clinic:
+        return APIResponse(
+            success=False,
+            message=f"Клиника с client_id={request.client_id} не найдена",
+            data=None
+        )
+    
+    try:
+        start_timestamp, end_timestamp = convert_date_to_timestamps(request.date)
+    except ValueError as e:
+        return APIResponse(success=False, message=str(e), data=None)
+    
+    client = await amocrm_clients.get(clinic["client_id"])
+    
+    async def ndjson_lines():
+        total = 0
+        try:
+            async for leads in iter_pages(client, "leads", _leads_filter(start_timestamp, end_timestamp), "leads"):
+                total += len(leads)
+                yield "".join(json.dumps({"lead": _format_lead(lead)}, ensure_ascii=False) + "\n" for lead in leads)
+            logger.info(f"Отправлено {total} сделок за {request.date}")
+            yield json.dumps({"done": True, "date": request.date, "total_leads": total}) + "\n"
+        except Exception as e:
+            # Заголовки уже отправлены, поэтому ошибка передается последней строкой
+            logger.error(f"Ошибка при потоковой выдаче сделок: {e}", exc_info=True)
+            yield json.dumps({"error": f"Ошибка при получении сделок по дате: {str(e)}", "total_leads": total}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@router.post("/webhook/{client_id}")
+async def amocrm_webhook(client_id: str, request: Request, response: Response):
+    """
+    Прием вебхуков AmoCRM (application/x-www-form-urlencoded).
+    Новые заметки о звонках со ссылкой на запись ставятся в очередь транскрибации,
+    повторные доставки одной заметки отбрасываются. Ответ возвращается сразу,
+    скачивание и транскрибация выполняются воркером.
+    """
+    try:
+        body = await request.body()
+        payload = parse_webhook_form(parse_qsl(body.decode("utf-8", errors="replace"), keep_blank_values=True))
+        summary = await amocrm_webhook_service.handle(client_id, payload)
+        return {
+            "success": True,
+            "message": f"Принято звонков: {summary['accepted']}",
+            "data": summary
+        }
+    except LookupError as e:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"success": False, "message": str(e), "data": None}
+    except PermissionError as e:
+        response.status_code = status.HTTP_403_FORBIDDEN
+        return {"success": False, "message": str(e), "data": None}
+    except Exception as e:
+        error_msg = f"Ошибка при обработке вебхука AmoCRM: {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {"success": False, "message": error_msg, "data": None}
+
 
 @router.post("/leads/get", response_model=APIResponse)
 async def get_lead(request: LeadRequest):
@@ -369,14 +404,7 @@ async def get_lead(request: LeadRequest):
         logger.info(f"Запрос сделки из AmoCRM: client_id={request.client_id}, lead_id={request.lead_id}")
         
         # Создаем экземпляр клиента
-        client = AsyncAmoCRMClient(
-            client_id=request.client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(request.client_id)
         
         # Получаем сделку
         lead = await client.get_lead(request.lead_id)
@@ -410,9 +438,6 @@ async def get_lead(request: LeadRequest):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=error_msg
         )
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.post("/lead/contact", response_model=APIResponse)
 async def get_contact_from_lead(request: LeadRequest):
@@ -422,14 +447,7 @@ async def get_contact_from_lead(request: LeadRequest):
     try:
         logger.info(f"Запрос контакта из сделки: client_id={request.client_id}, lead_id={request.lead_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=request.client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(request.client_id)
         
         # Получаем контакт из сделки
         contact = await client.get_contact_from_lead(request.lead_id)
@@ -455,9 +473,6 @@ async def get_contact_from_lead(request: LeadRequest):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=error_msg
         )
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.post("/contact/call-link", response_model=APIResponse)
 async def get_call_link(request: ContactRequest):
@@ -467,18 +482,11 @@ async def get_call_link(request: ContactRequest):
     try:
         logger.info(f"Запрос ссылки на звонок: client_id={request.client_id}, contact_id={request.contact_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=request.client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(request.client_id)
         
         # Проверяем существование контакта
         try:
-            contact = await client.get_contact(request.contact_id)
+            contact = await amocrm_cache.get_contact(client, request.client_id, request.contact_id)
             logger.info(f"Контакт #{request.contact_id} существует")
         except Exception as e:
             logger.error(f"Ошибка при получении контакта #{request.contact_id}: {e}")
@@ -523,9 +531,6 @@ async def get_call_link(request: ContactRequest):
             message=error_msg,
             data={"contact_id": request.contact_id, "has_call_link": False}
         )
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.get("/contact/{contact_id}/download-call")
 async def download_call(
@@ -540,14 +545,7 @@ async def download_call(
     try:
         logger.info(f"Запрос на скачивание звонка: client_id={client_id}, contact_id={contact_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(client_id)
         
         # Сначала проверяем существование ссылки на запись
         call_link = await client.get_call_link(contact_id)
@@ -563,7 +561,7 @@ async def download_call(
         
         # Скачиваем запись звонка
         logger.info(f"Скачиваем запись звонка по ссылке: {call_link}")
-        file_path = await client.download_call_recording(contact_id, AUDIO_DIR)
+        file_path = await client.download_call_recording(contact_id, audio_storage.partition_dir(client_id))
         
         if not file_path or not os.path.exists(file_path):
             logger.error(f"Ошибка при скачивании записи звонка для контакта #{contact_id}")
@@ -587,6 +585,8 @@ async def download_call(
                 "data": {"call_link": call_link}
             }
         
+        await audio_catalog_service.register(file_path, contact_id=contact_id, client_id=client_id)
+        
         logger.info(f"Отправка файла пользователю: {file_path}")
         
         # Возвращаем файл пользователю
@@ -605,9 +605,6 @@ async def download_call(
             "message": error_msg,
             "data": {"contact_id": contact_id}
         }
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.post("/lead/calls", response_model=APIResponse)
 async def get_lead_calls(request: LeadRequest):
@@ -617,18 +614,11 @@ async def get_lead_calls(request: LeadRequest):
     try:
         logger.info(f"Запрос списка звонков сделки: client_id={request.client_id}, lead_id={request.lead_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=request.client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(request.client_id)
         
         # Проверяем существование сделки
         try:
-            lead = await client.get_lead(request.lead_id)
+            lead = await amocrm_cache.get_lead(client, request.client_id, request.lead_id)
             logger.info(f"Сделка #{request.lead_id} существует")
         except Exception as e:
             logger.error(f"Ошибка при получении сделки #{request.lead_id}: {e}")
@@ -725,9 +715,6 @@ async def get_lead_calls(request: LeadRequest):
             message=error_msg,
             data={"lead_id": request.lead_id, "has_call_link": False}
         )
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.get("/lead/{lead_id}/note/{note_id}/download")
 async def download_lead_note_call(
@@ -743,18 +730,11 @@ async def download_lead_note_call(
     try:
         logger.info(f"Запрос на скачивание звонка из заметки сделки: client_id={client_id}, lead_id={lead_id}, note_id={note_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(client_id)
         
         # Скачиваем запись звонка
         logger.info(f"Скачиваем запись звонка для заметки {note_id} сделки {lead_id}")
-        file_path = await client.download_call_recording_from_lead(lead_id, AUDIO_DIR, note_id=note_id)
+        file_path = await client.download_call_recording_from_lead(lead_id, audio_storage.partition_dir(client_id), note_id=note_id)
         
         if not file_path or not os.path.exists(file_path):
             logger.error(f"Ошибка при скачивании записи звонка для заметки {note_id} сделки {lead_id}")
@@ -804,9 +784,6 @@ async def download_lead_note_call(
             "message": error_msg,
             "data": None
         }
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.post("/lead/{lead_id}/download-call")
 async def download_call_from_lead(
@@ -823,17 +800,10 @@ async def download_call_from_lead(
     try:
         logger.info(f"Запрос на скачивание звонка из сделки: client_id={client_id}, lead_id={lead_id}, note_id={note_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(client_id)
         
         # Скачиваем запись звонка из сделки
-        file_path = await client.download_call_recording_from_lead(lead_id, AUDIO_DIR, note_id=note_id)
+        file_path = await client.download_call_recording_from_lead(lead_id, audio_storage.partition_dir(client_id), note_id=note_id)
         
         if not file_path or not os.path.exists(file_path):
             logger.error(f"Ошибка при скачивании записи звонка для сделки #{lead_id}")
@@ -868,9 +838,6 @@ async def download_call_from_lead(
             "message": error_msg,
             "data": None
         }
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.post("/contact/calls", response_model=APIResponse)
 async def get_contact_calls(request: ContactRequest):
@@ -881,17 +848,10 @@ async def get_contact_calls(request: ContactRequest):
     try:
         logger.info(f"Запрос списка звонков контакта: client_id={request.client_id}, contact_id={request.contact_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=request.client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(request.client_id)
         
         # Получаем контакт для получения связанных сделок
-        contact = await client.get_contact(request.contact_id)
+        contact = await amocrm_cache.get_contact(client, request.client_id, request.contact_id)
         
         # Проверяем, есть ли у контакта заметки напрямую
         call_links = await client.get_call_links(request.contact_id)
@@ -901,13 +861,9 @@ async def get_contact_calls(request: ContactRequest):
             logger.info(f"У контакта {request.contact_id} нет заметок напрямую, ищем связанные сделки")
             
             # Для поиска сделок нужно использовать API
-            leads_response, _ = await client.contacts.request(
-                "get",
-                f"contacts/{request.contact_id}/leads"
-            )
+            leads = await amocrm_cache.get_contact_leads(client, request.client_id, request.contact_id)
             
-            if leads_response and "_embedded" in leads_response and "leads" in leads_response["_embedded"]:
-                leads = leads_response["_embedded"]["leads"]
+            if leads:
                 logger.info(f"Найдено {len(leads)} связанных сделок для контакта {request.contact_id}")
                 
                 # Получаем все звонки из всех связанных сделок
@@ -1015,9 +971,6 @@ async def get_contact_calls(request: ContactRequest):
             message=error_msg,
             data=None
         )
-    finally:
-        if 'client' in locals():
-            await client.close()
 
 @router.get("/contact/call/{note_id}/download")
 async def download_call_by_note_id(
@@ -1033,94 +986,10 @@ async def download_call_by_note_id(
     try:
         logger.info(f"Запрос на скачивание звонка по ID заметки: client_id={client_id}, note_id={note_id}, contact_id={contact_id}")
         
-        client = AsyncAmoCRMClient(
-            client_id=client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
-        
-        # Получаем заметку напрямую из API
-        note = await client.get_note_by_id(note_id)
-        
-        if not note:
-            # Если не нашли заметку напрямую, и указан контакт, попробуем найти в заметках контакта
-            if contact_id:
-                logger.info(f"Ищем заметку в контакте {contact_id}")
-                notes = await client.get_contact_notes(contact_id)
-                
-                for n in notes:
-                    if n.get("id") == note_id:
-                        note = n
-                        logger.info(f"Найдена заметка {note_id} в контакте {contact_id}")
-                        break
-        
-        # Если и в контакте не нашли, возможно заметка в сделке, ищем среди всех сделок контакта
-        if not note and contact_id:
-            logger.info(f"Ищем связанные сделки для контакта {contact_id}")
-            
-            # Получаем список связанных сделок
-            leads_response, _ = await client.contacts.request(
-                "get",
-                f"contacts/{contact_id}/leads"
-            )
-            
-            if leads_response and "_embedded" in leads_response and "leads" in leads_response["_embedded"]:
-                leads = leads_response["_embedded"]["leads"]
-                logger.info(f"Найдено {len(leads)} связанных сделок для контакта {contact_id}")
-                
-                # Ищем заметку в каждой сделке
-                for lead in leads:
-                    lead_id = lead.get("id")
-                    logger.info(f"Проверяем заметки в сделке {lead_id}")
-                    
-                    lead_notes = await client.get_lead_notes(lead_id)
-                    for n in lead_notes:
-                        if n.get("id") == note_id:
-                            note = n
-                            logger.info(f"Найдена заметка {note_id} в сделке {lead_id}")
-                            break
-                    
-                    if note:
-                        break
-        
-        # Если и в сделках не нашли, пробуем поиск по всем сущностям
-        if not note:
-            logger.info(f"Пробуем найти заметку {note_id} среди всех сущностей")
-            
-            # Поиск осуществляем через API без указания сущности
-            search_path = "notes"
-            search_params = {
-                "filter[id]": note_id
-            }
-            
-            search_response, search_status = await client.contacts.request(
-                "get", 
-                search_path, 
-                params=search_params
-            )
-            
-            if search_status == 200 and "_embedded" in search_response and "notes" in search_response["_embedded"]:
-                notes = search_response["_embedded"]["notes"]
-                if notes:
-                    note = notes[0]
-                    logger.info(f"Найдена заметка {note_id} через общий поиск")
+        client = await amocrm_clients.get(client_id)
         
-        # Если заметку так и не нашли, пробуем прямой запрос к конкретной заметке
-        if not note:
-            logger.warning(f"Заметка {note_id} не найдена через API поиска, пробуем прямой запрос")
-            
-            try:
-                # Пробуем прямой запрос к API заметок
-                note_response, status_code = await client.contacts.request("get", f"notes/{note_id}")
-                
-                if status_code == 200:
-                    note = note_response
-                    logger.info(f"Найдена заметка {note_id} через прямой запрос")
-            except Exception as e:
-                logger.error(f"Ошибка при прямом запросе заметки {note_id}: {e}")
+        # Ищем заметку: кэш, затем способы поиска по очереди
+        note = await note_resolver_service.resolve(client, client_id, note_id, contact_id=contact_id)
         
         if not note:
             logger.warning(f"Заметка {note_id} не найдена ни одним способом")
@@ -1139,36 +1008,7 @@ async def download_call_by_note_id(
         user_id = note.get("created_by")
         
         # Получаем ссылку на запись звонка
-        params = note.get("params", {})
-        call_link = None
-        
-        # 1. Прямая проверка наличия ссылки в параметрах
-        if params and "link" in params and params["link"]:
-            call_link = params["link"]
-            logger.info(f"Найдена ссылка на запись звонка в parameters.link: {call_link}")
-        
-        # 2. Для телефонии uiscom/calltouch ссылка может быть в других полях
-        if not call_link and params:
-            # Может быть в telephone.link
-            telephone = params.get("telephone", {})
-            if isinstance(telephone, dict) and telephone.get("link"):
-                call_link = telephone.get("link")
-                logger.info(f"Найдена ссылка в parameters.telephone.link: {call_link}")
-        
-        # 3. Для comagic/voximplant может быть другое поле
-        if not call_link and params:
-            # Проверяем все поля на наличие ссылок
-            for key, value in params.items():
-                if isinstance(value, str) and (value.startswith("http") and (".mp3" in value or "media.comagic.ru" in value or "voximplant" in value)):
-                    call_link = value
-                    logger.info(f"Найдена ссылка в parameters.{key}: {call_link}")
-                    break
-        
-        # 4. Использование рекурсивного поиска ссылок
-        if not call_link:
-            call_link = client._find_link_in_dict(note, max_depth=5)
-            if call_link:
-                logger.info(f"Найдена ссылка в структуре заметки: {call_link}")
+        call_link = find_call_link(client, note)
         
         if not call_link:
             logger.warning(f"В заметке {note_id} нет ссылки на запись звонка")
@@ -1196,152 +1036,159 @@ async def download_call_by_note_id(
                 
         logger.info(f"Итоговая ссылка на запись звонка: {call_link}")
         
-        # Создаем директорию для файлов, если она не существует
-        os.makedirs(AUDIO_DIR, exist_ok=True)
-        
-        # Формируем путь для сохранения файла
-        file_path = os.path.join(AUDIO_DIR, f"call_{note_id}.mp3")
-        
-        # Создаем SSL-контекст с отключенной проверкой сертификата
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Заголовки для имитации браузера
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5",
-            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-            "Referer": "https://amocrm.mango-office.ru/",
-            "Origin": "https://amocrm.mango-office.ru"
-        }
+        # Формируем путь для сохранения файла в разделе клиники
+        file_path = audio_storage.path_for(f"call_{note_id}.mp3", clinic_id=client_id)
         
-        # Скачиваем файл с повторными попытками
+        # Скачиваем файл с повторными попытками через общую сессию:
+        # соединения и cookies провайдера переиспользуются между запросами
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 logger.info(f"Попытка {attempt+1}/{max_retries} скачать файл")
                 
-                connector = aiohttp.TCPConnector(ssl=ssl_context)
-                async with aiohttp.ClientSession(connector=connector, headers=headers, cookie_jar=aiohttp.CookieJar()) as session:
-                    # Первый запрос для получения cookies
-                    async with session.get("https://amocrm.mango-office.ru/") as init_response:
-                        logger.info(f"Инициализация сессии: HTTP {init_response.status}")
+                session = await download_client.get_session()
+                # Cookies Mango Office запрашиваются заново, только если истек их срок
+                await download_client.ensure_cookies()
+                
+                # Скачиваем файл
+                async with session.get(call_link, allow_redirects=True) as download_response:
+                    status_code = download_response.status
+                    logger.info(f"Статус ответа: {status_code}")
                     
-                    # Скачиваем файл
-                    async with session.get(call_link, allow_redirects=True) as download_response:
-                        status_code = download_response.status
-                        logger.info(f"Статус ответа: {status_code}")
+                    if status_code == 200:
+                        # Скачиваем потоково во временный файл: HTML вместо аудио распознается
+                        # по первому блоку, размер ограничен MAX_AUDIO_DOWNLOAD_SIZE
+                        content_type = download_response.headers.get("Content-Type", "")
+                        try:
+                            download_result = await stream_to_file(download_response, file_path)
+                        except DownloadError as e:
+                            download_result = None
+                            download_error = e
                         
-                        if status_code == 200:
-                            data = await download_response.read()
-                            data_size = len(data)
-                            
-                            logger.info(f"Получено {data_size} байт данных")
-                            
-                            # Проверяем, не получили ли мы HTML вместо аудио
-                            content_type = download_response.headers.get("Content-Type", "")
-                            if content_type.startswith("text/html") or (data_size < 10000 and data.startswith(b"<!DOCTYPE")):
-                                logger.error(f"Получен HTML вместо аудио. Это может означать ошибку авторизации")
-                                
-                                # Сохраняем HTML для отладки
-                                html_path = os.path.join(AUDIO_DIR, f"{note_id}_error_{attempt}.html")
-                                async with aiofiles.open(html_path, 'wb') as f:
-                                    await f.write(data)
-                                    
-                                logger.error(f"HTML-ответ сохранен для отладки: {html_path}")
-                                
-                                # Если это последняя попытка, возвращаем ошибку
-                                if attempt == max_retries - 1:
-                                    if response:
-                                        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-                                    return {
-                                        "success": False,
-                                        "message": "Получен HTML вместо аудио. Возможно, требуется аутентификация или запись недоступна.",
-                                        "data": {
-                                            "note_id": note_id,
-                                            "call_link": call_link,
-                                            "content_type": content_type,
-                                            "data_size": data_size,
-                                            "error_html": html_path
-                                        }
-                                    }
-                                
-                                # Если это не последняя попытка, пробуем еще раз
-                                await asyncio.sleep(1 * (attempt + 1))  # Экспоненциальная задержка
-                                continue
-                            
-                            # Сохраняем файл
-                            async with aiofiles.open(file_path, 'wb') as f:
-                                await f.write(data)
+                        if download_result is None and download_error.reason == "html":
+                            data_size = download_error.size
+                            logger.error(f"Получен HTML вместо аудио. Это может означать ошибку авторизации")
                             
-                            logger.info(f"Файл записи звонка сохранен: {file_path}")
-                            
-                            # Проверяем размер файла
-                            if os.path.getsize(file_path) == 0:
-                                logger.error(f"Скачан пустой файл (0 байт)")
+                            # Сохраняем HTML для отладки
+                            html_path = os.path.join(os.path.dirname(file_path), f"{note_id}_error_{attempt}.html")
+                            async with aiofiles.open(html_path, 'wb') as f:
+                                await f.write(download_error.body)
                                 
-                                # Если это последняя попытка, возвращаем ошибку
-                                if attempt == max_retries - 1:
-                                    if response:
-                                        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-                                    return {
-                                        "success": False,
-                                        "message": "Скачан пустой файл (0 байт)",
-                                        "data": {"call_link": call_link}
-                                    }
-                                
-                                # Если это не последняя попытка, пробуем еще раз
-                                await asyncio.sleep(1 * (attempt + 1))
-                                continue
-                            
-                            # Возвращаем файл пользователю
-                            return FileResponse(
-                                path=file_path,
-                                filename=f"call_{note_id}.mp3",
-                                media_type="audio/mpeg"
-                            )
-                        elif status_code in (301, 302, 303, 307, 308):
-                            # Обрабатываем редиректы вручную
-                            redirect_url = download_response.headers.get("Location")
-                            logger.info(f"Получен редирект на: {redirect_url}")
-                            
-                            if redirect_url:
-                                call_link = redirect_url
-                                continue
-                        else:
-                            # В случае ошибки пытаемся прочитать тело ответа для отладки
-                            try:
-                                error_content = await download_response.text()
-                                error_excerpt = error_content[:500] + "..." if len(error_content) > 500 else error_content
-                            except:
-                                error_excerpt = "Не удалось прочитать содержимое ответа"
-                            
-                            error_msg = f"Ошибка при скачивании файла: HTTP {status_code}"
-                            logger.error(f"{error_msg}\nОтвет: {error_excerpt}")
+                            logger.error(f"HTML-ответ сохранен для отладки: {html_path}")
+                            # Следующая попытка начнется с новых cookies
+                            download_client.invalidate_cookies()
                             
                             # Если это последняя попытка, возвращаем ошибку
                             if attempt == max_retries - 1:
+                                # Ссылка из сохраненной заметки могла устареть
+                                await note_resolver_service.forget(client_id, note_id)
                                 if response:
                                     response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
                                 return {
                                     "success": False,
-                                    "message": error_msg,
+                                    "message": "Получен HTML вместо аудио. Возможно, требуется аутентификация или запись недоступна.",
                                     "data": {
+                                        "note_id": note_id,
                                         "call_link": call_link,
-                                        "status": status_code,
-                                        "response_excerpt": error_excerpt
+                                        "content_type": content_type,
+                                        "data_size": data_size,
+                                        "error_html": html_path
                                     }
                                 }
                             
+                            # Если это не последняя попытка, пробуем еще раз
+                            await asyncio.sleep(1 * (attempt + 1))  # Экспоненциальная задержка
+                            continue
+                        
+                        if download_result is None and download_error.reason == "too_large":
+                            # Повторная попытка не поможет
+                            logger.error(f"Запись звонка слишком большая: {download_error}")
+                            if response:
+                                response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                            return {
+                                "success": False,
+                                "message": str(download_error),
+                                "data": {"call_link": call_link, "data_size": download_error.size}
+                            }
+                        
+                        # Проверяем размер файла
+                        if download_result is None:
+                            logger.error(f"Скачан пустой файл (0 байт)")
+                            
+                            # Если это последняя попытка, возвращаем ошибку
+                            if attempt == max_retries - 1:
+                                await note_resolver_service.forget(client_id, note_id)
+                                if response:
+                                    response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+                                return {
+                                    "success": False,
+                                    "message": "Скачан пустой файл (0 байт)",
+                                    "data": {"call_link": call_link}
+                                }
+                            
                             # Если это не последняя попытка, пробуем еще раз
                             await asyncio.sleep(1 * (attempt + 1))
+                            continue
+                        
+                        logger.info(f"Файл записи звонка сохранен: {file_path} ({download_result.size} байт)")
+                        
+                        await audio_catalog_service.register(
+                            file_path,
+                            note_id=note_id,
+                            contact_id=contact_id,
+                            client_id=client_id,
+                            audio_hash=download_result.sha256
+                        )
+                        
+                        # Возвращаем файл пользователю
+                        return FileResponse(
+                            path=file_path,
+                            filename=f"call_{note_id}.mp3",
+                            media_type="audio/mpeg"
+                        )
+                    elif status_code in (301, 302, 303, 307, 308):
+                        # Обрабатываем редиректы вручную
+                        redirect_url = download_response.headers.get("Location")
+                        logger.info(f"Получен редирект на: {redirect_url}")
+                        
+                        if redirect_url:
+                            call_link = redirect_url
+                            continue
+                    else:
+                        # В случае ошибки пытаемся прочитать тело ответа для отладки
+                        try:
+                            error_content = await download_response.text()
+                            error_excerpt = error_content[:500] + "..." if len(error_content) > 500 else error_content
+                        except:
+                            error_excerpt = "Не удалось прочитать содержимое ответа"
+                        
+                        error_msg = f"Ошибка при скачивании файла: HTTP {status_code}"
+                        logger.error(f"{error_msg}\nОтвет: {error_excerpt}")
+                        
+                        # Если это последняя попытка, возвращаем ошибку
+                        if attempt == max_retries - 1:
+                            await note_resolver_service.forget(client_id, note_id)
+                            if response:
+                                response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+                            return {
+                                "success": False,
+                                "message": error_msg,
+                                "data": {
+                                    "call_link": call_link,
+                                    "status": status_code,
+                                    "response_excerpt": error_excerpt
+                                }
+                            }
+                        
+                        # Если это не последняя попытка, пробуем еще раз
+                        await asyncio.sleep(1 * (attempt + 1))
             except Exception as e:
                 logger.error(f"Ошибка при попытке {attempt+1}: {e}")
                 logger.error(f"Стек-трейс: {traceback.format_exc()}")
                 
                 # Если это последняя попытка, возвращаем ошибку
                 if attempt == max_retries - 1:
+                    await note_resolver_service.forget(client_id, note_id)
                     if response:
                         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
                     return {
@@ -1355,6 +1202,7 @@ async def download_call_by_note_id(
         
         # Если дошли сюда, значит все попытки не удались
         logger.error(f"Все попытки скачивания не удались для заметки {note_id}")
+        await note_resolver_service.forget(client_id, note_id)
         if response:
             response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return {
@@ -1376,6 +1224,3 @@ async def download_call_by_note_id(
             "message": error_msg,
             "data": None
         }
-    finally:
-        if 'client' in locals():
-            await client.close()
\ No newline at end of file
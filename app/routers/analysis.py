@@ -5,7 +5,7 @@ import os
 
 from ..models.call_analysis import CallAnalysisRequest, CallAnalysisResponse
 from ..services.call_analysis_service import call_analysis_service
-from ..settings.paths import TRANSCRIPTION_DIR
+from ..settings.storage import transcription_storage
 
 router = APIRouter(tags=["analysis"])
 logger = logging.getLogger(__name__)
@@ -28,8 +28,8 @@ async def analyze_call(request: CallAnalysisRequest, background_tasks: Backgroun
         # Получаем текст для анализа
         dialogue_text = ""
         if request.transcription_filename:
-            file_path = os.path.join(TRANSCRIPTION_DIR, request.transcription_filename)
-            if not os.path.exists(file_path):
+            file_path = transcription_storage.locate(request.transcription_filename)
+            if not file_path:
                 return CallAnalysisResponse(
                     success=False,
                     message=f"Файл транскрипции {request.transcription_filename} не найден",
@@ -50,7 +50,7 @@ async def analyze_call(request: CallAnalysisRequest, background_tasks: Backgroun
             
         # Выполняем анализ
         logger.info("Запуск анализа звонка")
-        analysis_result = call_analysis_service.full_call_analysis(dialogue_text, meta_info)
+        analysis_result = await call_analysis_service.afull_call_analysis(dialogue_text, meta_info)
         
         # Сохраняем результат в файл
         output_filename = None
@@ -72,7 +72,11 @@ async def analyze_call(request: CallAnalysisRequest, background_tasks: Backgroun
             message="Анализ звонка успешно выполнен",
             data={
                 "classification": analysis_result["classification"],
+                "classification_code": analysis_result["classification_code"],
                 "analysis": analysis_result["analysis"],
+                "metrics": analysis_result["metrics"],
+                "recommendations": analysis_result["recommendations"],
+                "prompt_version": analysis_result["prompt_version"],
                 "output_filename": output_filename,
                 "timestamp": analysis_result["timestamp"]
             }
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Response, status
+import logging
+
+from ..models.job import JobResponse
+from ..services.job_queue_service import job_queue_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_status(job_id: str, response: Response):
+    """
+    Получение статуса задачи из очереди (транскрибация, анализ).
+    """
+    try:
+        job = await job_queue_service.get_job(job_id)
+
+        if not job:
+            response.status_code = status.HTTP_404_NOT_FOUND
+            return JobResponse(
+                success=False,
+                message=f"Задача {job_id} не найдена",
+                data=None
+            )
+
+        return JobResponse(
+            success=True,
+            message=f"Статус задачи: {job['status']}",
+            data=job
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при получении статуса задачи {job_id}: {e}")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return JobResponse(
+            success=False,
+            message=f"Ошибка при получении статуса задачи: {str(e)}",
+            data=None
+        )
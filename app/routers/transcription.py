@@ -1,28 +1,35 @@
-from bson import ObjectId
-from fastapi import APIRouter, HTTPException, status, BackgroundTasks, Response
+from http import HTTPStatus
+from fastapi import APIRouter, HTTPException, status, Response
 from fastapi.responses import FileResponse
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import logging
 import os
 import re
-import fnmatch
-import aiofiles
-import aiohttp
 import traceback
-from motor.motor_asyncio import AsyncIOMotorClient
 from ..models.transcription import (
     TranscriptionRequest, 
     TranscriptionResponse, 
+    BulkTranscribeRequest, 
     DialogueLine, 
     Dialogue, 
     TranscriptionRecord
 )
-from mlab_amo_async.amocrm_client import AsyncAmoCRMClient
-from ..services.transcription_service import transcribe_and_save, save_transcription_info, find_transcription_file
+from ..services.amocrm_client_registry import amocrm_clients
+from ..services.amocrm_cache import amocrm_cache
+from ..services.transcription_service import save_transcription_info, find_transcription_file
+from ..services.job_queue_service import job_queue_service
+from ..services.audio_catalog_service import audio_catalog_service
+from ..services.transcription_index_service import transcription_index_service, DEFAULT_PAGE_SIZE
+from ..services.transcript_search_service import transcript_search_service
+from ..services.transcript_store import load_transcript, render_text, render_srt
 from ..utils.helpers import cleanup_temp_file
+from ..services.call_ingest_service import download_and_enqueue_call
+from ..services.bulk_transcription_service import bulk_transcription_service
+from ..services.call_sync_service import call_sync_service
 from ..settings.auth import evenlabs
 from ..settings.paths import AUDIO_DIR, TRANSCRIPTION_DIR
+from ..settings.storage import audio_storage, transcription_storage
 
 
 # Настраиваем логирование
@@ -47,28 +54,24 @@ os.makedirs(AUDIO_DIR, exist_ok=True)
 os.makedirs(TRANSCRIPTION_DIR, exist_ok=True)
 
 @router.post("/api/transcribe", response_model=TranscriptionResponse)
-async def transcribe_audio(request: TranscriptionRequest, background_tasks: BackgroundTasks):
+async def transcribe_audio(request: TranscriptionRequest):
     """
     Транскрибирует аудиофайл с записью звонка и сохраняет результат в текстовый файл.
     """
     try:
-        # Проверяем существование файла
-        audio_path = os.path.join(AUDIO_DIR, request.audio_filename)
+        # Ищем файл в хранилище аудио (по имени или относительному пути)
+        audio_path = await audio_storage.alocate(request.audio_filename, clinic_id=request.client_id)
         
-        if not os.path.exists(audio_path):
+        if not audio_path:
             # Если точное имя файла не найдено, пробуем найти файл по ID заметки
             if request.note_id:
-                # Ищем файл, содержащий ID заметки
-                found = False
-                for filename in os.listdir(AUDIO_DIR):
-                    if f"note_{request.note_id}" in filename and filename.endswith(".mp3"):
-                        audio_path = os.path.join(AUDIO_DIR, filename)
-                        request.audio_filename = filename
-                        found = True
-                        logger.info(f"Найден файл по ID заметки: {audio_path}")
-                        break
-                
-                if not found:
+                # Ищем файл по ID заметки в каталоге аудио
+                found_path = await audio_catalog_service.find_path(note_id=request.note_id, client_id=request.client_id)
+                if found_path:
+                    audio_path = found_path
+                    request.audio_filename = os.path.basename(found_path)
+                    logger.info(f"Найден файл по ID заметки: {audio_path}")
+                else:
                     return TranscriptionResponse(
                         success=False,
                         message=f"Файл звонка для заметки {request.note_id} не найден в директории {AUDIO_DIR}",
@@ -105,19 +108,25 @@ async def transcribe_audio(request: TranscriptionRequest, background_tasks: Back
             else:
                 output_filename = f"transcript_{current_time}.txt"
             
-        output_path = os.path.join(TRANSCRIPTION_DIR, output_filename)
-        
-        # Запускаем транскрибацию в фоновом режиме, чтобы не блокировать ответ API
-        background_tasks.add_task(
-        transcribe_and_save,
-        audio_path=audio_path,
-        output_path=output_path,
-        num_speakers=request.num_speakers,
-        diarize=request.diarize,
-        phone=request.phone,
-        note_data={"note_id": request.note_id},
-        administrator_id=request.administrator_id if hasattr(request, 'administrator_id') else None  # Добавляем administrator_id
-    )
+        # Транскрипция попадает в раздел той же клиники, что и запись
+        clinic_id = request.client_id or audio_storage.partition_of(audio_path)
+        output_path = transcription_storage.path_for(output_filename, clinic_id=clinic_id)
+        
+        # Ставим транскрибацию в очередь задач, её выполнит отдельный воркер
+        job_id = await job_queue_service.enqueue(
+            "transcribe",
+            {
+                "audio_path": audio_path,
+                "output_path": output_path,
+                "num_speakers": request.num_speakers,
+                "diarize": request.diarize,
+                "phone": request.phone,
+                "note_data": {"note_id": request.note_id},
+                "administrator_id": request.administrator_id if hasattr(request, 'administrator_id') else None,  # Добавляем administrator_id
+                "chunked": request.chunked,
+                "preprocess": request.preprocess
+            }
+        )
         
         return TranscriptionResponse(
             success=True,
@@ -125,7 +134,9 @@ async def transcribe_audio(request: TranscriptionRequest, background_tasks: Back
             data={
                 "audio_filename": request.audio_filename,
                 "transcription_filename": output_filename,
-                "status": "processing"
+                "status": "processing",
+                "job_id": job_id,
+                "job_url": f"/api/jobs/{job_id}"
             }
         )
         
@@ -141,15 +152,16 @@ async def transcribe_audio(request: TranscriptionRequest, background_tasks: Back
 async def download_and_transcribe_call(
     note_id: int, 
     client_id: str, 
-    background_tasks: BackgroundTasks,
     num_speakers: int = 2,
     lead_id: Optional[int] = None,
     contact_id: Optional[int] = None,
     is_first_contact: bool = False,
+    analyze: bool = False,
     response: Response = None
 ):
     """
     Скачивает запись звонка и запускает её транскрибацию.
+    При analyze=true после транскрибации в очередь ставится анализ звонка.
     Использует реальные имена менеджера и клиента в транскрипции, если они доступны.
     Сохраняет информацию о транскрипции в MongoDB.
     Автоматически определяет администратора по ответственному в AmoCRM.
@@ -175,27 +187,18 @@ async def download_and_transcribe_call(
             
         logger.info(f"Найдена клиника: {clinic['name']} (ID: {clinic['id']})")
         
-        client = AsyncAmoCRMClient(
-            client_id=client_id,
-            client_secret="",  
-            subdomain="",      
-            redirect_url="",   
-            mongo_uri=MONGO_URI,
-            db_name=DB_NAME
-        )
+        client = await amocrm_clients.get(client_id)
         
         # Сначала получаем заметку
         note = None
         phone = None
         client_name = None
-        manager_name = None
         responsible_user_id = None
-        administrator_id = None  # ID администратора будем определять автоматически
         
         # Если указан ID контакта, ищем заметку у этого контакта
         if contact_id:
             logger.info(f"Получаем заметки для контакта {contact_id}")
-            notes = await client.get_contact_notes(contact_id)
+            notes = await amocrm_cache.get_contact_notes(client, client_id, contact_id)
             
             for n in notes:
                 if n.get("id") == note_id:
@@ -217,7 +220,7 @@ async def download_and_transcribe_call(
             
             # Получаем данные контакта для имени клиента
             try:
-                contact = await client.get_contact(contact_id)
+                contact = await amocrm_cache.get_contact(client, client_id, contact_id)
                 if contact:
                     # Получаем имя клиента
                     client_name = contact.get("name")
@@ -304,192 +307,25 @@ async def download_and_transcribe_call(
                 "data": None
             }
         
-        # Получаем ссылку на запись звонка
-        params = note.get("params", {})
-        call_link = params.get("link")
-        
-        if not call_link:
-            logger.warning(f"В заметке {note_id} нет ссылки на запись звонка")
-            if response:
-                response.status_code = status.HTTP_404_NOT_FOUND
-            return {
-                "success": False,
-                "message": f"В заметке {note_id} нет ссылки на запись звонка",
-                "data": None
-            }
-        
-        # Если есть ID ответственного, пытаемся получить его имя и найти связанного администратора
-        if responsible_user_id:
-            try:
-                # Запрос к API AmoCRM для получения данных о пользователе
-                user_response, status_code = await client.contacts.request(
-                    "get",
-                    f"users/{responsible_user_id}"
-                )
-                
-                if status_code == 200 and user_response:
-                    # Получаем имя ответственного
-                    manager_name = user_response.get("name")
-                    logger.info(f"Имя ответственного: {manager_name}")
-                    
-                    # Ищем администратора по amocrm_user_id и клинике
-                    mongo_client = AsyncIOMotorClient(MONGO_URI)
-                    db = mongo_client[DB_NAME]
-                    
-                    admin = await db.administrators.find_one({
-                        "amocrm_user_id": str(responsible_user_id),
-                        "clinic_id": ObjectId(clinic["id"])
-                    })
-                    
-                    if admin:
-                        administrator_id = str(admin["_id"])
-                        logger.info(f"Найден администратор в системе: {administrator_id} ({admin.get('name', 'Без имени')})")
-                    else:
-                        logger.warning(f"Администратор для ответственного {responsible_user_id} не найден в системе")
-                        
-                        # Попробуем найти любого администратора для этой клиники
-                        admin = await db.administrators.find_one({
-                            "clinic_id": ObjectId(clinic["id"])
-                        })
-                        
-                        if admin:
-                            administrator_id = str(admin["_id"])
-                            logger.info(f"Найден администратор по умолчанию: {administrator_id} ({admin.get('name', 'Без имени')})")
-            except Exception as e:
-                logger.warning(f"Не удалось получить данные ответственного: {e}")
-        
-        # Добавляем параметры аутентификации к ссылке
-        account_id = note.get("account_id")
-        user_id = note.get("created_by")
-        
-        if "userId" not in call_link and account_id and user_id:
-            if "?" in call_link:
-                call_link += f"&userId={user_id}&accountId={account_id}"
-            else:
-                call_link += f"?userId={user_id}&accountId={account_id}"
-                
-        logger.info(f"Ссылка на запись звонка: {call_link}")
-        
-        # Скачиваем звонок
-        # Формируем имя файла в соответствии с вашим форматом
-        if lead_id:
-            file_name = f"lead_{lead_id}_note_{note_id}.mp3"
-        else:
-            file_name = f"contact_{contact_id}_note_{note_id}.mp3"
-            
-        file_path = os.path.join(AUDIO_DIR, file_name)
-        
-        # Создаем SSL-контекст с отключенной проверкой сертификата
-        import ssl
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        # Заголовки для имитации браузера
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5",
-            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-            "Referer": "https://amocrm.mango-office.ru/",
-            "Origin": "https://amocrm.mango-office.ru"
-        }
-        
-        # Скачиваем файл
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
-            logger.info(f"Скачиваем файл по ссылке: {call_link}")
-            download_success = False
-            
-            async with session.get(call_link, allow_redirects=True) as download_response:
-                status_code = download_response.status
-                logger.info(f"Статус ответа: {status_code}")
-                
-                if status_code == 200:
-                    data = await download_response.read()
-                    data_size = len(data)
-                    
-                    if data_size < 1000 or data.startswith(b"<!DOCTYPE"):
-                        logger.error(f"Получен неверный формат данных (HTML или слишком маленький размер): {data_size} байт")
-                    else:
-                        # Сохраняем файл
-                        async with aiofiles.open(file_path, 'wb') as f:
-                            await f.write(data)
-                        
-                        logger.info(f"Файл записи звонка сохранен: {file_path}")
-                        download_success = True
-        
-        if not download_success:
-            logger.error(f"Не удалось скачать запись звонка")
-            if response:
-                response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-            return {
-                "success": False,
-                "message": "Не удалось скачать запись звонка",
-                "data": None
-            }
-        
-        # Запускаем транскрибацию в фоновом режиме
-        logger.info(f"Запускаем транскрибацию файла: {file_path}")
-        
-        # Генерируем имя файла для сохранения результата
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        phone_str = ""
-        
-        if phone:
-            # Очищаем номер телефона от лишних символов для использования в имени файла
-            phone_str = re.sub(r'[^\d]', '', phone)
-            
-        # Формируем имя файла
-        if phone_str:
-            output_filename = f"{phone_str}_{current_time}.txt"
-        else:
-            output_filename = f"note_{note_id}_{current_time}.txt"
-            
-        output_path = os.path.join(TRANSCRIPTION_DIR, output_filename)
-        
-        # Логируем информацию об администраторе
-        if administrator_id:
-            logger.info(f"Запуск транскрибации с привязкой к администратору ID: {administrator_id}")
-        else:
-            logger.warning("Администратор не определен, лимиты не будут обновлены")
-        
-        # Запускаем транскрибацию в фоновом режиме с использованием имен менеджера и клиента
-        background_tasks.add_task(
-            transcribe_and_save,
-            audio_path=file_path,
-            output_path=output_path,
-            num_speakers=num_speakers,
-            diarize=True,
+        # Скачиваем запись и ставим транскрибацию в очередь
+        http_status, result = await download_and_enqueue_call(
+            client=client,
+            clinic=clinic,
+            client_id=client_id,
+            note=note,
+            note_id=note_id,
+            lead_id=lead_id,
+            contact_id=contact_id,
             phone=phone,
-            manager_name=manager_name,
             client_name=client_name,
+            responsible_user_id=responsible_user_id,
+            num_speakers=num_speakers,
             is_first_contact=is_first_contact,
-            note_data={
-                "note_id": note_id,
-                "lead_id": lead_id,
-                "contact_id": contact_id,
-                "client_id": client_id
-            },
-            administrator_id=administrator_id  # Используем определенный ID администратора
+            analyze=analyze
         )
-        
-        return {
-            "success": True,
-            "message": "Звонок скачан, транскрибация запущена",
-            "data": {
-                "note_id": note_id,
-                "audio_file": file_name,
-                "transcription_file": output_filename,
-                "phone": phone,
-                "client_name": client_name,
-                "manager_name": manager_name,
-                "is_first_contact": is_first_contact,
-                "status": "processing",
-                "found_administrator_id": administrator_id,  # Добавляем для отладки
-                "download_url": f"/api/amocrm/contact/call/{note_id}/download?client_id={client_id}" + (f"&contact_id={contact_id}" if contact_id else ""),
-                "transcription_url": f"/api/transcriptions/{output_filename}/download"
-            }
-        }
+        if response and http_status != HTTPStatus.OK:
+            response.status_code = http_status
+        return result
         
     except Exception as e:
         error_msg = f"Ошибка при скачивании и транскрибации звонка: {str(e)}"
@@ -505,9 +341,108 @@ async def download_and_transcribe_call(
             "message": error_msg,
             "data": None
         }
-    finally:
-        if 'client' in locals():
-            await client.close()
+
+@router.post("/api/amocrm/calls/bulk-transcribe")
+async def bulk_transcribe_calls(request: BulkTranscribeRequest, response: Response):
+    """
+    Пакетное скачивание и транскрибация звонков по списку заметок
+    или за период (client_id + date_from/date_to).
+    Сразу возвращает ID пакета; звонки обрабатываются воркером,
+    уже транскрибированные пропускаются. Прогресс - GET /api/amocrm/calls/bulk-transcribe/{batch_id}.
+    """
+    try:
+        batch_id = await bulk_transcription_service.create_batch(
+            client_id=request.client_id,
+            note_ids=request.note_ids,
+            date_from=request.date_from,
+            date_to=request.date_to,
+            num_speakers=request.num_speakers,
+            analyze=request.analyze
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "success": True,
+            "message": "Пакет транскрибации создан",
+            "data": {
+                "batch_id": batch_id,
+                "status_url": f"/api/amocrm/calls/bulk-transcribe/{batch_id}"
+            }
+        }
+    except ValueError as e:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {
+            "success": False,
+            "message": str(e),
+            "data": None
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при создании пакета транскрибации: {e}")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {
+            "success": False,
+            "message": f"Ошибка при создании пакета транскрибации: {str(e)}",
+            "data": None
+        }
+
+@router.post("/api/amocrm/calls/sync/{client_id}")
+async def sync_calls(client_id: str, response: Response):
+    """
+    Запускает синхронизацию новых звонков клиники из AmoCRM (с момента курсора),
+    не дожидаясь планировщика. Новые звонки ставятся в пакет транскрибации.
+    """
+    try:
+        job_id = await call_sync_service.enqueue(client_id)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "success": True,
+            "message": "Синхронизация звонков поставлена в очередь",
+            "data": {"job_id": job_id, "job_url": f"/api/jobs/{job_id}"}
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при запуске синхронизации звонков: {e}")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {
+            "success": False,
+            "message": f"Ошибка при запуске синхронизации звонков: {str(e)}",
+            "data": None
+        }
+
+@router.get("/api/amocrm/calls/sync/{client_id}")
+async def get_sync_calls_state(client_id: str, response: Response):
+    """Курсор и результат последней синхронизации звонков клиники"""
+    state = await call_sync_service.get_state(client_id)
+    if not state:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {
+            "success": False,
+            "message": f"Синхронизация звонков клиники {client_id} еще не выполнялась",
+            "data": None
+        }
+    return {
+        "success": True,
+        "message": "Состояние синхронизации звонков",
+        "data": state
+    }
+
+@router.get("/api/amocrm/calls/bulk-transcribe/{batch_id}")
+async def get_bulk_transcribe_status(batch_id: str, response: Response):
+    """
+    Прогресс пакетной транскрибации: счетчики обработанных, пропущенных
+    и неудачных звонков и сводка по статусам задач транскрибации.
+    """
+    batch = await bulk_transcription_service.get_batch(batch_id)
+    if not batch:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {
+            "success": False,
+            "message": f"Пакет {batch_id} не найден",
+            "data": None
+        }
+    return {
+        "success": True,
+        "message": f"Статус пакета: {batch['status']}",
+        "data": batch
+    }
 
 @router.get("/api/amocrm/note/{note_id}/transcript/download")
 async def download_note_transcript(
@@ -524,43 +459,25 @@ async def download_note_transcript(
     try:
         logger.info(f"Запрос на скачивание транскрипции: note_id={note_id}, client_id={client_id}, lead_id={lead_id}, contact_id={contact_id}")
         
-        if not os.path.exists(TRANSCRIPTION_DIR):
-            logger.error(f"Директория транскрипций не найдена: {TRANSCRIPTION_DIR}")
-            if response:
-                response.status_code = status.HTTP_404_NOT_FOUND
-            return {
-                "success": False,
-                "message": "Директория транскрипций не найдена",
-                "data": None
-            }
-        
         # Сначала ищем файл в базе данных
         transcript_filename = await find_transcription_file(note_id=note_id, lead_id=lead_id, contact_id=contact_id)
         
-        # Если не нашли в базе, ищем в файловой системе
+        # Если не нашли в базе, ищем в индексе транскрипций
         if not transcript_filename:
-            logger.info(f"Файл транскрипции не найден в базе данных, ищем в файловой системе")
+            logger.info(f"Файл транскрипции не найден в базе данных, ищем в индексе транскрипций")
             
-            # Формируем шаблоны имен файлов для поиска
-            note_id_str = str(note_id)
-            file_patterns = [f"note_{note_id_str}_*.txt"]
+            # Ищем по ID заметки, а затем по телефону контакта в индексе транскрипций
+            lookups = [{"note_id": note_id}]
             
             # Если указан contact_id, получаем телефон контакта
             phone = None
             if contact_id:
                 try:
-                    # Создаем экземпляр клиента AmoCRM
-                    client = AsyncAmoCRMClient(
-                        client_id=client_id,
-                        client_secret="",  
-                        subdomain="",      
-                        redirect_url="",   
-                        mongo_uri=MONGO_URI,
-                        db_name=DB_NAME
-                    )
+                    # Общий клиент AmoCRM клиники
+                    client = await amocrm_clients.get(client_id)
                     
                     # Получаем контакт для извлечения номера телефона
-                    contact = await client.get_contact(contact_id)
+                    contact = await amocrm_cache.get_contact(client, client_id, contact_id)
                     
                     if contact and "custom_fields_values" in contact:
                         # Ищем поле телефона
@@ -569,32 +486,22 @@ async def download_note_transcript(
                                 phone = field["values"][0].get("value")
                                 if phone:
                                     logger.info(f"Извлечен номер телефона контакта: {phone}")
-                                    # Очищаем телефон от нецифровых символов для поиска файла
-                                    phone_clean = re.sub(r'[^\d]', '', phone)
-                                    file_patterns.append(f"{phone_clean}_*.txt")
+                                    lookups.append({"phone": phone})
                                     break
                 except Exception as e:
                     logger.error(f"Ошибка при получении данных контакта: {e}")
-                finally:
-                    if 'client' in locals():
-                        await client.close()
             
-            # Ищем файл по шаблонам
-            for pattern in file_patterns:
-                found = False
-                for filename in os.listdir(TRANSCRIPTION_DIR):
-                    if fnmatch.fnmatch(filename, pattern):
-                        transcript_filename = filename
-                        found = True
-                        logger.info(f"Найден файл транскрипции по шаблону {pattern}: {filename}")
-                        break
-                if found:
+            for lookup in lookups:
+                found_files, _ = await transcription_index_service.list_page(limit=1, **lookup)
+                if found_files:
+                    transcript_filename = found_files[0]["filename"]
+                    logger.info(f"Найден файл транскрипции по {lookup}: {transcript_filename}")
                     break
         
+        file_path = transcription_storage.locate(transcript_filename, clinic_id=client_id) if transcript_filename else None
+        
         # Если файл найден, возвращаем его
-        if transcript_filename:
-            file_path = os.path.join(TRANSCRIPTION_DIR, transcript_filename)
-            
+        if file_path:
             # Проверяем размер файла
             file_size = os.path.getsize(file_path)
             logger.info(f"Размер файла транскрипции: {file_size} байт")
@@ -665,9 +572,9 @@ async def download_transcription(filename: str):
     Скачивание файла транскрипции.
     """
     try:
-        file_path = os.path.join(TRANSCRIPTION_DIR, filename)
+        file_path = transcription_storage.locate(filename)
         
-        if not os.path.exists(file_path):
+        if not file_path:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Файл {filename} не найден"
@@ -688,64 +595,97 @@ async def download_transcription(filename: str):
             detail=f"Ошибка при скачивании транскрипции: {str(e)}"
         )
 
-@router.get("/api/transcriptions")
-async def get_all_transcriptions():
+@router.get("/api/transcriptions/{filename}/export")
+async def export_transcription(filename: str, format: str = "json"):
     """
-    Получение списка всех доступных транскрипций.
+    Экспорт транскрипции в формате json, srt или txt.
+    Формируется из структурированной версии транскрипции.
     """
+    if format not in ("json", "srt", "txt"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Поддерживаемые форматы: json, srt, txt"
+        )
+
     try:
-        if not os.path.exists(TRANSCRIPTION_DIR):
+        file_path = transcription_storage.locate(filename)
+        transcript = load_transcript(file_path) if file_path else None
+
+        if transcript is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Файл {filename} не найден"
+            )
+
+        if format == "json":
             return {
                 "success": True,
-                "message": "Директория с транскрипциями не найдена",
-                "data": {"transcriptions": []}
+                "message": "Транскрипция успешно получена",
+                "data": transcript
             }
-            
-        # Получаем список файлов транскрипций
-        transcription_files = []
-        for filename in os.listdir(TRANSCRIPTION_DIR):
-            if filename.endswith(".txt"):
-                file_path = os.path.join(TRANSCRIPTION_DIR, filename)
-                
-                # Получаем размер файла и дату изменения
-                file_stats = os.stat(file_path)
-                
-                # Пытаемся извлечь номер телефона и ID заметки из имени файла
-                phone_match = re.match(r'^(\d+)_\d{8}_\d{6}\.txt$', filename)
-                note_match = re.match(r'^note_(\d+)_\d{8}_\d{6}\.txt$', filename)
-                
-                phone = phone_match.group(1) if phone_match else None
-                note_id = note_match.group(1) if note_match else None
-                
-                # Получаем первые 100 символов текста для предпросмотра
-                preview_text = ""
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        preview_text = f.read(500)
-                        if len(preview_text) == 500:
-                            preview_text += "..."
-                except Exception as e:
-                    logger.warning(f"Не удалось прочитать предпросмотр файла {filename}: {e}")
-                
-                transcription_files.append({
-                    "filename": filename,
-                    "size": file_stats.st_size,
-                    "created_at": datetime.fromtimestamp(file_stats.st_ctime).strftime("%Y-%m-%d %H:%M:%S"),
-                    "phone": phone,
-                    "note_id": note_id,
-                    "preview": preview_text,
-                    "download_url": f"/api/transcriptions/{filename}/download"
-                })
-                
-        # Сортируем по дате создания (сначала новые)
-        transcription_files.sort(key=lambda x: x["created_at"], reverse=True)
+
+        base_name = os.path.splitext(filename)[0]
+        if format == "srt":
+            content = render_srt(transcript)
+            media_type = "application/x-subrip"
+        else:
+            content = render_text(transcript)
+            media_type = "text/plain"
+
+        return Response(
+            content=content,
+            media_type=f"{media_type}; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{base_name}.{format}"'}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при экспорте транскрипции: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при экспорте транскрипции: {str(e)}"
+        )
+
+@router.get("/api/transcriptions")
+async def get_all_transcriptions(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    phone: Optional[str] = None,
+    note_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+):
+    """
+    Получение списка транскрипций (сначала новые) постранично.
+    Для следующей страницы передайте next_cursor из предыдущего ответа.
+    """
+    try:
+        transcription_files, next_cursor = await transcription_index_service.list_page(
+            limit=limit,
+            cursor=cursor,
+            phone=phone,
+            note_id=note_id,
+            date_from=date_from,
+            date_to=date_to
+        )
         
         return {
             "success": True,
-            "message": f"Найдено {len(transcription_files)} транскрипций",
-            "data": {"transcriptions": transcription_files}
+            "message": f"Получено {len(transcription_files)} транскрипций",
+            "data": {
+                "transcriptions": transcription_files,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
         }
         
+    except ValueError as e:
+        return {
+            "success": False,
+            "message": f"Неверные параметры запроса: {str(e)}",
+            "data": None
+        }
     except Exception as e:
         logger.error(f"Ошибка при получении списка транскрипций: {str(e)}")
         return {
@@ -760,82 +700,25 @@ async def search_transcriptions(
     phone: Optional[str] = None,
     note_id: Optional[int] = None,
     date_from: Optional[str] = None,
-    date_to: Optional[str] = None
+    date_to: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0
 ):
     """
     Поиск транскрипций по различным параметрам.
+    Текстовый запрос ищется по полнотекстовому индексу с учетом словоформ,
+    результаты упорядочены по релевантности и содержат фрагменты реплик с подсветкой.
     """
     try:
-        if not os.path.exists(TRANSCRIPTION_DIR):
-            return {
-                "success": True,
-                "message": "Директория с транскрипциями не найдена",
-                "data": {"transcriptions": []}
-            }
-            
-        # Получаем список файлов транскрипций
-        transcription_files = []
-        for filename in os.listdir(TRANSCRIPTION_DIR):
-            if filename.endswith(".txt"):
-                file_path = os.path.join(TRANSCRIPTION_DIR, filename)
-                
-                # Получаем размер файла и дату изменения
-                file_stats = os.stat(file_path)
-                created_at = datetime.fromtimestamp(file_stats.st_ctime)
-                
-                # Фильтрация по дате
-                if date_from:
-                    date_from_obj = datetime.strptime(date_from, "%Y-%m-%d")
-                    if created_at < date_from_obj:
-                        continue
-                
-                if date_to:
-                    date_to_obj = datetime.strptime(date_to, "%Y-%m-%d")
-                    if created_at > date_to_obj:
-                        continue
-                
-                # Фильтрация по имени файла
-                if phone and phone not in filename:
-                    continue
-                
-                if note_id and f"note_{note_id}" not in filename:
-                    continue
-                
-                # Фильтрация по содержимому файла (если указан query)
-                content_match = True
-                if query:
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            if query.lower() not in content.lower():
-                                content_match = False
-                    except Exception as e:
-                        logger.warning(f"Не удалось прочитать содержимое файла {filename}: {e}")
-                        content_match = False
-                
-                if not content_match:
-                    continue
-                
-                # Получаем первые 500 символов текста для предпросмотра
-                preview_text = ""
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        preview_text = f.read(500)
-                        if len(preview_text) == 500:
-                            preview_text += "..."
-                except Exception as e:
-                    logger.warning(f"Не удалось прочитать предпросмотр файла {filename}: {e}")
-                
-                transcription_files.append({
-                    "filename": filename,
-                    "size": file_stats.st_size,
-                    "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    "preview": preview_text,
-                    "download_url": f"/api/transcriptions/{filename}/download"
-                })
-                
-        # Сортируем по дате создания (сначала новые)
-        transcription_files.sort(key=lambda x: x["created_at"], reverse=True)
+        transcription_files = await transcript_search_service.search(
+            query=query,
+            phone=phone,
+            note_id=note_id,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            offset=offset
+        )
         
         return {
             "success": True,
@@ -0,0 +1,211 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Время жизни записей кэша по типам сущностей (сек.)
+ENTITY_TTLS = {
+    "contacts": 300,
+    "contact_leads": 300,
+    "leads": 120,
+    "notes": 60,
+    "users": 3600
+}
+DEFAULT_TTL = 120
+# Сколько записей держать в памяти процесса
+AMOCRM_CACHE_MAX_ITEMS = int(os.getenv("AMOCRM_CACHE_MAX_ITEMS", "5000"))
+# Общий уровень кэша в MongoDB (для нескольких воркеров и API)
+AMOCRM_CACHE_SHARED = os.getenv("AMOCRM_CACHE_SHARED", "0") == "1"
+
+
+class AmoCRMCache:
+    """
+    Кэш чтения данных AmoCRM (контакты, сделки, заметки, пользователи).
+    Ключ - клиника (client_id), тип сущности и ID. Уровни:
+    LRU в памяти процесса (AMOCRM_CACHE_MAX_ITEMS записей) и, если включен
+    AMOCRM_CACHE_SHARED, коллекция amocrm_cache в MongoDB с TTL-индексом.
+    Время жизни задается по типу сущности (ENTITY_TTLS). Одновременные
+    промахи по одному ключу выполняют один запрос к AmoCRM.
+    Пустые и неуспешные ответы не кэшируются.
+    """
+
+    def __init__(self, max_items: int = AMOCRM_CACHE_MAX_ITEMS, shared: bool = AMOCRM_CACHE_SHARED):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.collection = self.db.amocrm_cache
+        self.max_items = max_items
+        self.shared = shared
+        self._items: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        """TTL-индекс: MongoDB сама удаляет просроченные записи"""
+        if self._indexes_ready:
+            return
+        await self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def _count(self, entity: str, counter: str):
+        counters = self._counters.setdefault(entity, {"hits": 0, "shared_hits": 0, "misses": 0})
+        counters[counter] += 1
+
+    @staticmethod
+    def _doc_id(key: Tuple[str, str, str]) -> str:
+        return ":".join(key)
+
+    def _get_local(self, key: Tuple[str, str, str]) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def _set_local(self, key: Tuple[str, str, str], value: Any, ttl: float):
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    async def _get_shared(self, key: Tuple[str, str, str]) -> Optional[Tuple[Any, float]]:
+        try:
+            doc = await self.collection.find_one({"_id": self._doc_id(key)})
+        except Exception as e:
+            logger.warning(f"Ошибка чтения общего кэша AmoCRM: {e}")
+            return None
+        if not doc or doc["expires_at"] <= datetime.utcnow():
+            return None
+        return doc["value"], (doc["expires_at"] - datetime.utcnow()).total_seconds()
+
+    async def _set_shared(self, key: Tuple[str, str, str], value: Any, ttl: float):
+        try:
+            await self.ensure_indexes()
+            await self.collection.replace_one(
+                {"_id": self._doc_id(key)},
+                {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Ошибка записи в общий кэш AmoCRM: {e}")
+
+    async def get_or_fetch(self, client_id: str, entity: str, entity_key: Any, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает значение из кэша или вызывает fetch и кэширует результат.
+
+        :param entity: тип сущности, определяет TTL (ключ ENTITY_TTLS)
+        :param entity_key: ID сущности или другой ключ в пределах типа
+        """
+        key = (client_id, entity, str(entity_key))
+        value = self._get_local(key)
+        if value is not None:
+            self._count(entity, "hits")
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._count(entity, "hits")
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            ttl = ENTITY_TTLS.get(entity, DEFAULT_TTL)
+            shared = await self._get_shared(key) if self.shared else None
+            if shared is not None:
+                self._count(entity, "shared_hits")
+                value, remaining = shared
+                self._set_local(key, value, remaining)
+            else:
+                self._count(entity, "misses")
+                value = await fetch()
+                if value:
+                    self._set_local(key, value, ttl)
+                    if self.shared:
+                        await self._set_shared(key, value, ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие этот же ключ, здесь оно пробрасывается дальше
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, client_id: str, entity: Optional[str] = None, entity_key: Any = None):
+        """Удаляет записи клиники: все, одного типа или одну сущность"""
+        def matches(key: Tuple[str, str, str]) -> bool:
+            return key[0] == client_id and (entity is None or key[1] == entity) and (entity_key is None or key[2] == str(entity_key))
+
+        for key in [key for key in self._items if matches(key)]:
+            del self._items[key]
+
+        if self.shared:
+            prefix = ":".join(part for part in (client_id, entity, None if entity_key is None else str(entity_key)) if part is not None)
+            query = {"_id": prefix} if entity_key is not None else {"_id": {"$regex": f"^{re.escape(prefix)}:"}}
+            try:
+                await self.collection.delete_many(query)
+            except Exception as e:
+                logger.warning(f"Ошибка очистки общего кэша AmoCRM: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов по типам сущностей"""
+        return {
+            "items": len(self._items),
+            "shared": self.shared,
+            "entities": {entity: dict(counters) for entity, counters in self._counters.items()}
+        }
+
+    # Кэшируемые запросы к AmoCRM
+
+    @staticmethod
+    async def _request(client, path: str) -> Optional[Dict[str, Any]]:
+        response, status_code = await client.contacts.request("get", path)
+        return response if status_code == 200 and response else None
+
+    async def get_contact(self, client, client_id: str, contact_id: int) -> Optional[Dict[str, Any]]:
+        return await self.get_or_fetch(client_id, "contacts", contact_id, lambda: client.get_contact(contact_id))
+
+    async def get_lead(self, client, client_id: str, lead_id: int) -> Optional[Dict[str, Any]]:
+        return await self.get_or_fetch(client_id, "leads", lead_id, lambda: client.get_lead(lead_id))
+
+    async def get_contact_notes(self, client, client_id: str, contact_id: int) -> List[Dict[str, Any]]:
+        return await self.get_or_fetch(client_id, "notes", f"contacts/{contact_id}", lambda: client.get_contact_notes(contact_id)) or []
+
+    async def get_lead_notes(self, client, client_id: str, lead_id: int) -> List[Dict[str, Any]]:
+        return await self.get_or_fetch(client_id, "notes", f"leads/{lead_id}", lambda: client.get_lead_notes(lead_id)) or []
+
+    async def get_contact_leads(self, client, client_id: str, contact_id: int) -> List[Dict[str, Any]]:
+        """Сделки, связанные с контактом"""
+        response = await self.get_or_fetch(client_id, "contact_leads", contact_id, lambda: self._request(client, f"contacts/{contact_id}/leads"))
+        return (response or {}).get("_embedded", {}).get("leads", [])
+
+    async def get_user(self, client, client_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self.get_or_fetch(client_id, "users", user_id, lambda: self._request(client, f"users/{user_id}"))
+
+    async def get_users(self, client, client_id: str) -> Optional[Dict[str, Any]]:
+        """Ответ AmoCRM со списком пользователей аккаунта"""
+        return await self.get_or_fetch(client_id, "users", "all", lambda: self._request(client, "users"))
+
+
+# Создаем экземпляр для использования в приложении
+amocrm_cache = AmoCRMCache()
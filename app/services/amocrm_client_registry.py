@@ -0,0 +1,131 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from mlab_amo_async.amocrm_client import AsyncAmoCRMClient
+
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Как часто проверять, не изменились ли учетные данные клиники (сек.)
+CREDENTIALS_CHECK_INTERVAL = 60
+
+
+class _Entry:
+    def __init__(self, client: AsyncAmoCRMClient, fingerprint: Tuple):
+        self.client = client
+        self.fingerprint = fingerprint
+        self.checked_at = time.monotonic()
+
+
+class AmoCRMClientRegistry:
+    """
+    Реестр долгоживущих клиентов AmoCRM - по одному на client_id клиники.
+    Клиент создается при первом обращении и переиспользуется всеми запросами,
+    поэтому соединения и загруженный токен не создаются заново на каждый запрос.
+    Обновление истекшего токена выполняет token_manager клиента.
+
+    Раз в CREDENTIALS_CHECK_INTERVAL секунд сверяются учетные данные клиники
+    и время обновления токена в MongoDB: если их изменили извне (повторная
+    авторизация, принудительное обновление токена), клиент пересоздается.
+    Клиенты закрываются при остановке приложения (close_all).
+    Частоту запросов всех клиентов ограничивает amocrm_rate_limiter
+    (подключается при запуске API и воркера).
+    """
+
+    def __init__(self):
+        self.mongo_client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.mongo_client[DB_NAME]
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _credentials(self, client_id: str) -> Tuple[Dict[str, Any], Tuple]:
+        """Учетные данные клиники и отпечаток для обнаружения изменений"""
+        clinic = await self.db.clinics.find_one(
+            {"client_id": client_id},
+            {"client_secret": 1, "amocrm_subdomain": 1, "redirect_url": 1}
+        ) or {}
+        token = await self.db.tokens.find_one({"client_id": client_id}, {"updated_at": 1, "subdomain": 1}) or {}
+
+        credentials = {
+            "client_secret": clinic.get("client_secret") or "",
+            "subdomain": clinic.get("amocrm_subdomain") or token.get("subdomain") or "",
+            "redirect_url": clinic.get("redirect_url") or ""
+        }
+        fingerprint = (credentials["client_secret"], credentials["subdomain"], credentials["redirect_url"], str(token.get("updated_at")))
+        return credentials, fingerprint
+
+    def _check_loop(self):
+        # Клиенты привязаны к event loop, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._entries.clear()
+            self._locks.clear()
+            self._loop = loop
+
+    async def get(self, client_id: str) -> AsyncAmoCRMClient:
+        """Возвращает клиент AmoCRM для клиники, создавая его при необходимости"""
+        self._check_loop()
+        entry = self._entries.get(client_id)
+        if entry and time.monotonic() - entry.checked_at < CREDENTIALS_CHECK_INTERVAL:
+            return entry.client
+
+        lock = self._locks.setdefault(client_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(client_id)
+            if entry and time.monotonic() - entry.checked_at < CREDENTIALS_CHECK_INTERVAL:
+                return entry.client
+
+            credentials, fingerprint = await self._credentials(client_id)
+            if entry and entry.fingerprint == fingerprint:
+                entry.checked_at = time.monotonic()
+                return entry.client
+
+            if entry:
+                logger.info(f"Учетные данные AmoCRM клиники {client_id} изменились, клиент пересоздается")
+                await self._close_client(client_id, entry.client)
+
+            client = AsyncAmoCRMClient(
+                client_id=client_id,
+                client_secret=credentials["client_secret"],
+                subdomain=credentials["subdomain"],
+                redirect_url=credentials["redirect_url"],
+                mongo_uri=MONGO_URI,
+                db_name=DB_NAME
+            )
+            self._entries[client_id] = _Entry(client, fingerprint)
+            logger.info(f"Создан клиент AmoCRM для клиники {client_id}")
+            return client
+
+    @staticmethod
+    async def _close_client(client_id: str, client: AsyncAmoCRMClient):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии клиента AmoCRM {client_id}: {e}")
+
+    async def invalidate(self, client_id: str):
+        """Закрывает клиент клиники; следующий запрос создаст новый (после смены токенов)"""
+        entry = self._entries.pop(client_id, None)
+        if entry:
+            await self._close_client(client_id, entry.client)
+
+    async def close_all(self):
+        """Закрывает все клиенты при остановке приложения"""
+        entries, self._entries = self._entries, {}
+        for client_id, entry in entries.items():
+            await self._close_client(client_id, entry.client)
+        logger.info(f"Закрыто клиентов AmoCRM: {len(entries)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clients": len(self._entries)}
+
+
+# Создаем экземпляр для использования в приложении
+amocrm_clients = AmoCRMClientRegistry()
@@ -0,0 +1,42 @@
+import logging
+from typing import Dict, Any, List, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер страницы списков AmoCRM
+AMOCRM_PAGE_LIMIT = 250
+
+
+async def iter_pages(
+    client,
+    path: str,
+    params: Dict[str, Any],
+    embedded_key: str
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Постранично получает список AmoCRM (например, leads) и отдает страницы по порядку.
+
+    Страницы запрашиваются по одной, максимального размера, пока в ответе есть
+    ссылка next; в памяти держится только текущая страница. Частоту запросов
+    ограничивает amocrm_rate_limiter. Запросы наперед не делаются: клиент
+    mlab_amo_async выполняет их синхронно, и они не перекрывались бы.
+    """
+    page = 1
+    while True:
+        response, status_code = await client.contacts.request(
+            "get", path, params=dict(params, page=page, limit=AMOCRM_PAGE_LIMIT)
+        )
+        if status_code != 200 or not response:
+            # 204 - страниц больше нет
+            if status_code not in (200, 204):
+                logger.error(f"Ошибка при запросе {path} (страница {page}): HTTP {status_code}")
+            return
+
+        items = response.get("_embedded", {}).get(embedded_key, [])
+        logger.info(f"Получено {len(items)} записей {path} на странице {page}")
+        if items:
+            yield items
+
+        if "next" not in response.get("_links", {}):
+            return
+        page += 1
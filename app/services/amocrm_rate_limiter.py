@@ -0,0 +1,202 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+import contextvars
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from mlab_amo_async import async_interaction
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Лимит API AmoCRM - 7 запросов в секунду на аккаунт; держимся немного ниже
+AMOCRM_RATE_LIMIT_RPS = float(os.getenv("AMOCRM_RATE_LIMIT_RPS", "6"))
+# Сколько запросов можно выполнить подряд без ожидания
+AMOCRM_RATE_LIMIT_BURST = int(os.getenv("AMOCRM_RATE_LIMIT_BURST", "3"))
+# Согласовывать лимит между процессами API и воркеров через MongoDB
+AMOCRM_RATE_LIMIT_SHARED = os.getenv("AMOCRM_RATE_LIMIT_SHARED", "1") == "1"
+# Сколько раз повторять запрос после ответа 429
+AMOCRM_THROTTLE_RETRIES = 5
+# Пауза после 429 без заголовка Retry-After (сек.), удваивается с каждой попыткой
+AMOCRM_THROTTLE_BACKOFF = 1.0
+AMOCRM_THROTTLE_MAX_DELAY = 60.0
+
+# Параметры AsyncBaseInteraction._request, которые передает обертка ограничителя
+_REQUEST_PARAMS = ("method", "path", "data", "params", "headers")
+
+# Retry-After последнего ответа 429 в текущей задаче (заполняется хуком сессии requests)
+_throttled: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("amocrm_throttled", default=None)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах: число или HTTP-дата"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class AmoCRMRateLimiter:
+    """
+    Ограничитель частоты запросов к API AmoCRM по аккаунту (поддомен или client_id).
+
+    Алгоритм GCRA, эквивалентный token bucket на AMOCRM_RATE_LIMIT_RPS запросов
+    в секунду с запасом AMOCRM_RATE_LIMIT_BURST: каждый запрос резервирует
+    очередной слот (поле tat - теоретическое время следующего запроса) и ждет
+    его наступления, поэтому запросы сверх лимита встают в очередь, а не
+    получают 429. При AMOCRM_RATE_LIMIT_SHARED слоты резервируются атомарно
+    в коллекции amocrm_rate_limits, и лимит общий для API и всех воркеров;
+    если MongoDB недоступна, используется локальный счетчик процесса.
+
+    Ответ 429 сдвигает слоты аккаунта на Retry-After (или на экспоненциальную
+    паузу), после чего запрос повторяется.
+    """
+
+    def __init__(self, rate: float = AMOCRM_RATE_LIMIT_RPS, burst: int = AMOCRM_RATE_LIMIT_BURST, shared: bool = AMOCRM_RATE_LIMIT_SHARED):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.collection = self.db.amocrm_rate_limits
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * max(0, burst - 1)
+        self.shared = shared
+        self._tat: Dict[str, float] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _count(self, key: str, counter: str, value: float = 1):
+        stats = self._stats.setdefault(key, {"requests": 0, "throttled": 0, "waited_seconds": 0.0})
+        stats[counter] += value
+
+    async def _reserve_shared(self, key: str, now: float) -> float:
+        # tat = max(tat, now) + interval; возвращается уже сдвинутое значение
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [{"$set": {"tat": {"$add": [{"$max": [{"$ifNull": ["$tat", now]}, now]}, self.interval]}}}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["tat"]
+
+    def _reserve_local(self, key: str, now: float) -> float:
+        tat = max(self._tat.get(key, now), now) + self.interval
+        self._tat[key] = tat
+        return tat
+
+    async def acquire(self, key: str):
+        """Ждет свободного слота для запроса к аккаунту"""
+        now = time.time()
+        tat = None
+        if self.shared:
+            try:
+                tat = await self._reserve_shared(key, now)
+            except Exception as e:
+                logger.warning(f"Общий лимит запросов AmoCRM недоступен, используется локальный: {e}")
+        if tat is None:
+            tat = self._reserve_local(key, now)
+
+        delay = tat - self.interval - self.tolerance - now
+        self._count(key, "requests")
+        if delay > 0:
+            self._count(key, "waited_seconds", delay)
+            await asyncio.sleep(delay)
+
+    async def block(self, key: str, seconds: float):
+        """Откладывает все запросы аккаунта на seconds секунд (после ответа 429)"""
+        self._count(key, "throttled")
+        # Слот, с которого запросы снова пойдут без запаса на всплеск
+        tat = time.time() + seconds + self.tolerance
+        self._tat[key] = max(self._tat.get(key, 0.0), tat)
+        if self.shared:
+            try:
+                await self.collection.update_one({"_id": key}, {"$max": {"tat": tat}}, upsert=True)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить паузу лимита AmoCRM: {e}")
+
+    async def call(self, key: str, request):
+        """
+        Выполняет запрос (фабрику корутины) с ожиданием слота
+        и повторами после ответов 429.
+        """
+        for attempt in range(AMOCRM_THROTTLE_RETRIES + 1):
+            await self.acquire(key)
+            _throttled.set(None)
+            try:
+                return await request()
+            except Exception:
+                retry_after = _throttled.get()
+                if retry_after is None or attempt == AMOCRM_THROTTLE_RETRIES:
+                    raise
+            delay = min(retry_after or AMOCRM_THROTTLE_BACKOFF * 2 ** attempt, AMOCRM_THROTTLE_MAX_DELAY)
+            logger.warning(f"AmoCRM вернул 429 для {key}, повтор через {delay:.1f} сек. (попытка {attempt + 1})")
+            await self.block(key, delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"shared": self.shared, "accounts": {key: dict(stats) for key, stats in self._stats.items()}}
+
+    @staticmethod
+    def _check_library():
+        """
+        Проверяет, что в mlab_amo_async есть перехватываемые атрибуты.
+        Иначе после обновления библиотеки ограничение частоты молча отключилось бы.
+        """
+        base = getattr(async_interaction, "AsyncBaseInteraction", None)
+        request = getattr(base, "_request", None)
+        if request is None or not inspect.iscoroutinefunction(request):
+            raise RuntimeError("mlab_amo_async: не найден AsyncBaseInteraction._request, ограничение запросов AmoCRM невозможно")
+        parameters = inspect.signature(request).parameters
+        missing = [name for name in _REQUEST_PARAMS if name not in parameters]
+        if missing:
+            raise RuntimeError(f"mlab_amo_async: у AsyncBaseInteraction._request нет параметров {missing}, ограничение запросов AmoCRM невозможно")
+        hooks = getattr(getattr(async_interaction, "_session", None), "hooks", None)
+        if not isinstance(hooks, dict) or not isinstance(hooks.get("response"), list):
+            raise RuntimeError("mlab_amo_async: не найдена сессия requests с хуками ответа, ответы 429 не будут обработаны")
+
+    def install(self):
+        """
+        Пропускает через ограничитель все запросы клиентов mlab_amo_async
+        (включая создаваемые внутри клиента интеракции заметок).
+        Вызывается при запуске API и воркера. Если версия библиотеки
+        несовместима, выбрасывает RuntimeError.
+        """
+        base = async_interaction.AsyncBaseInteraction
+        if getattr(base._request, "_rate_limited", False):
+            return
+        self._check_library()
+        original_request = base._request
+        limiter = self
+
+        async def limited_request(interaction, method, path, data=None, params=None, headers=None):
+            token_manager = interaction._token_manager
+            key = token_manager.subdomain or token_manager._client_id or "default"
+            return await limiter.call(
+                key,
+                lambda: original_request(interaction, method, path, data=data, params=params, headers=headers)
+            )
+
+        limited_request._rate_limited = True
+        base._request = limited_request
+
+        def on_response(response, *args, **kwargs):
+            # Запрос выполняется синхронно в той же задаче, что и limited_request
+            if response.status_code == 429:
+                _throttled.set(parse_retry_after(response.headers.get("Retry-After")) or 0.0)
+
+        async_interaction._session.hooks["response"].append(on_response)
+        logger.info("Ограничение частоты запросов AmoCRM подключено")
+
+
+# Создаем экземпляр для использования в приложении
+amocrm_rate_limiter = AmoCRMRateLimiter()
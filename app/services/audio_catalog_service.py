@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from .stt_cache_service import compute_file_sha256
+from ..settings.storage import audio_storage, StorageResolver
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Расширения аудиофайлов, попадающих в каталог
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".m4a")
+
+# Идентификаторы в именах файлов: lead_1_note_2.mp3, contact_3_note_4.mp3, call_5.mp3
+_FILENAME_ID_RE = re.compile(r'(lead|contact|note|call)_(\d+)')
+
+
+def parse_audio_filename(filename: str) -> Dict[str, int]:
+    """Извлекает note_id, contact_id и lead_id из имени аудиофайла"""
+    ids = {}
+    for kind, value in _FILENAME_ID_RE.findall(filename):
+        key = "note_id" if kind in ("note", "call") else f"{kind}_id"
+        ids.setdefault(key, int(value))
+    return ids
+
+
+class AudioCatalogService:
+    """
+    Каталог скачанных записей звонков (коллекция audio_files).
+    Запись добавляется при сохранении файла, поиск по note_id, contact_id,
+    lead_id или хэшу содержимого идет по индексу, без обхода директории.
+
+    Записи различаются по клинике и имени файла: файлы без даты в имени
+    (call_123.mp3) разных клиник лежат в своих разделах под одним именем.
+    Клиника берется из раздела хранилища, если не передана явно.
+    """
+
+    def __init__(self, storage: StorageResolver = audio_storage):
+        self.storage = storage
+        self.audio_dir = storage.root
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.files = self.db.audio_files
+        self._indexes_ready = False
+        # Файлы без даты в имени хранилище находит через каталог
+        storage.set_lookup(lambda filename, clinic_id=None: self.find_path(filename=filename, client_id=clinic_id))
+
+    async def ensure_indexes(self):
+        """Создает индексы каталога"""
+        if self._indexes_ready:
+            return
+        # Прежний уникальный индекс только по имени файла
+        indexes = await self.files.index_information()
+        if indexes.get("filename_1", {}).get("unique"):
+            try:
+                await self.files.drop_index("filename_1")
+            except OperationFailure:
+                pass
+        await self.files.create_index([("client_id", ASCENDING), ("filename", ASCENDING)], unique=True)
+        await self.files.create_index("filename")
+        await self.files.create_index([("note_id", ASCENDING), ("created_at", ASCENDING)], sparse=True)
+        await self.files.create_index("contact_id", sparse=True)
+        await self.files.create_index("lead_id", sparse=True)
+        await self.files.create_index("audio_hash", sparse=True)
+        self._indexes_ready = True
+
+    async def register(
+        self,
+        file_path: str,
+        note_id: Optional[int] = None,
+        contact_id: Optional[int] = None,
+        lead_id: Optional[int] = None,
+        client_id: Optional[str] = None,
+        audio_hash: Optional[str] = None
+    ):
+        """
+        Добавляет или обновляет запись о файле в каталоге.
+        Идентификаторы, не переданные явно, берутся из имени файла.
+        Ошибки каталога не прерывают скачивание - только логируются.
+        """
+        try:
+            await self.ensure_indexes()
+            filename = os.path.basename(file_path)
+
+            if audio_hash is None:
+                audio_hash = await asyncio.to_thread(compute_file_sha256, file_path)
+
+            fields = parse_audio_filename(filename)
+            explicit = {"note_id": note_id, "contact_id": contact_id, "lead_id": lead_id}
+            fields.update({key: value for key, value in explicit.items() if value is not None})
+            client_id = client_id or self.storage.partition_of(file_path)
+            fields.update({
+                "client_id": client_id,
+                "filename": filename,
+                "path": self.storage.relative(file_path),
+                "audio_hash": audio_hash,
+                "size": os.path.getsize(file_path),
+                "updated_at": datetime.now().isoformat()
+            })
+
+            await self.files.update_one(
+                {"client_id": client_id, "filename": filename},
+                {"$set": fields, "$setOnInsert": {"created_at": datetime.now().isoformat()}},
+                upsert=True
+            )
+            logger.info(f"Файл {filename} добавлен в каталог аудио")
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении файла {file_path} в каталог аудио: {e}")
+
+    async def find(
+        self,
+        note_id: Optional[int] = None,
+        contact_id: Optional[int] = None,
+        lead_id: Optional[int] = None,
+        audio_hash: Optional[str] = None,
+        filename: Optional[str] = None,
+        client_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Находит последнюю запись каталога по идентификатору.
+        Если указана клиника, ищутся только её файлы и файлы без клиники.
+        Записи о файлах, удаленных с диска, удаляются из каталога.
+        """
+        query = {
+            key: value for key, value in (
+                ("note_id", note_id), ("contact_id", contact_id),
+                ("lead_id", lead_id), ("audio_hash", audio_hash), ("filename", filename)
+            ) if value is not None
+        }
+        if not query:
+            return None
+        if client_id:
+            query["client_id"] = {"$in": [client_id, None]}
+
+        await self.ensure_indexes()
+        async for entry in self.files.find(query).sort("created_at", -1).limit(5):
+            path = self.storage.absolute(entry.get("path") or entry["filename"])
+            if path and os.path.exists(path):
+                entry["path"] = path
+                return entry
+            logger.warning(f"Файл {entry['filename']} из каталога аудио не найден на диске, запись удалена")
+            await self.files.delete_one({"_id": entry["_id"]})
+        return None
+
+    async def find_path(self, **kwargs) -> Optional[str]:
+        """Путь к файлу по идентификатору (см. find)"""
+        entry = await self.find(**kwargs)
+        return entry["path"] if entry else None
+
+    async def rebuild(self, batch_size: int = 500) -> int:
+        """
+        Перестраивает каталог по содержимому директории с аудио.
+        Записи о несуществующих файлах удаляются. Возвращает число файлов.
+
+        Найденные файлы помечаются ID перестроения (rebuild_id), после обхода
+        удаляются записи с другим ID, кроме добавленных во время обхода.
+        """
+        await self.ensure_indexes()
+        rebuild_id = uuid.uuid4().hex
+        started_at = datetime.now().isoformat()
+        operations = []
+        count = 0
+
+        for entry in self.storage.iter_files(AUDIO_EXTENSIONS):
+            fields = parse_audio_filename(entry.name)
+            client_id = self.storage.partition_of(entry.path)
+            fields.update({
+                "client_id": client_id,
+                "filename": entry.name,
+                "path": self.storage.relative(entry.path),
+                "audio_hash": await asyncio.to_thread(compute_file_sha256, entry.path),
+                "size": entry.stat().st_size,
+                "rebuild_id": rebuild_id,
+                "updated_at": datetime.now().isoformat()
+            })
+            created_at = datetime.fromtimestamp(entry.stat().st_mtime).isoformat()
+            operations.append(UpdateOne(
+                {"client_id": client_id, "filename": entry.name},
+                {"$set": fields, "$setOnInsert": {"created_at": created_at}},
+                upsert=True
+            ))
+            count += 1
+
+            if len(operations) >= batch_size:
+                await self.files.bulk_write(operations, ordered=False)
+                operations = []
+
+        if operations:
+            await self.files.bulk_write(operations, ordered=False)
+
+        removed = await self.files.delete_many({"rebuild_id": {"$ne": rebuild_id}, "updated_at": {"$lt": started_at}})
+        logger.info(f"Каталог аудио перестроен: {count} файлов, удалено устаревших записей: {removed.deleted_count}")
+        return count
+
+
+# Создаем экземпляр для использования в API
+audio_catalog_service = AudioCatalogService()
+
+
+async def _main():
+    count = await audio_catalog_service.rebuild()
+    print(f"Каталог аудио перестроен: {count} файлов в {audio_catalog_service.audio_dir}")
+
+
+if __name__ == "__main__":
+    # Разовое перестроение каталога: python -m app.services.audio_catalog_service
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    asyncio.run(_main())
@@ -0,0 +1,171 @@
+import os
+import bisect
+import logging
+import tempfile
+from typing import Dict, Any, List, Tuple, Optional
+
+from ..utils.audio_tools import is_ffmpeg_available, probe_duration, detect_silences, render_segments
+
+logger = logging.getLogger(__name__)
+
+# Предобработка аудио перед отправкой в STT (по умолчанию выключена)
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "0").lower() in ("1", "true", "yes")
+# Параметры кодирования: речи достаточно моно 16 кГц
+PREPROCESS_SAMPLE_RATE = int(os.getenv("AUDIO_PREPROCESS_SAMPLE_RATE", "16000"))
+PREPROCESS_BITRATE = os.getenv("AUDIO_PREPROCESS_BITRATE", "32k")
+# Паузы внутри записи длиннее MAX_GAP сокращаются до KEEP_GAP (сек.)
+PREPROCESS_MAX_GAP = 2.0
+PREPROCESS_KEEP_GAP = 0.5
+# Не перекодировать, если выигрыш по длительности и размеру незначителен
+PREPROCESS_MIN_SAVING = 0.1
+
+
+class OffsetMap:
+    """
+    Соответствие времени в обработанной записи времени в исходной.
+    Хранит сохраненные интервалы исходной записи в порядке следования:
+    (начало в обработанной записи, начало в исходной, длительность).
+    """
+
+    def __init__(self, segments: List[Tuple[float, float, float]]):
+        self.segments = segments
+        self._starts = [processed for processed, _, _ in segments]
+
+    @classmethod
+    def from_keep_segments(cls, keep: List[Tuple[float, float]]) -> "OffsetMap":
+        """Строит карту по списку сохраненных интервалов исходной записи"""
+        segments = []
+        position = 0.0
+        for start, end in keep:
+            segments.append((position, start, end - start))
+            position += end - start
+        return cls(segments)
+
+    @property
+    def processed_duration(self) -> float:
+        if not self.segments:
+            return 0.0
+        processed, _, length = self.segments[-1]
+        return processed + length
+
+    def to_original(self, t: float) -> float:
+        """Переводит время обработанной записи во время исходной"""
+        if not self.segments:
+            return t
+        index = max(bisect.bisect_right(self._starts, t) - 1, 0)
+        processed, original, length = self.segments[index]
+        return original + min(max(t - processed, 0.0), length)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"segments": [list(segment) for segment in self.segments]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OffsetMap":
+        return cls([tuple(segment) for segment in data.get("segments", [])])
+
+
+def build_keep_segments(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    max_gap: float = PREPROCESS_MAX_GAP,
+    keep_gap: float = PREPROCESS_KEEP_GAP
+) -> List[Tuple[float, float]]:
+    """
+    Определяет интервалы исходной записи, которые нужно сохранить.
+    Тишина в начале и в конце записи отрезается целиком, длинные паузы
+    внутри сокращаются до keep_gap (половина с каждой стороны паузы).
+    """
+    keep = []
+    cursor = 0.0
+    for start, end in sorted(silences):
+        start, end = max(start, 0.0), min(end, duration)
+        if end <= start:
+            continue
+        at_start = start <= 0.0
+        at_end = end >= duration
+        if not (at_start or at_end) and end - start <= max_gap:
+            continue
+
+        if at_start or at_end:
+            cut_start, cut_end = start, end
+        else:
+            cut_start, cut_end = start + keep_gap / 2, end - keep_gap / 2
+        if cut_start > cursor:
+            keep.append((cursor, cut_start))
+        cursor = max(cursor, cut_end)
+
+    if cursor < duration:
+        keep.append((cursor, duration))
+    return keep
+
+
+def remap_words(words: List[Dict[str, Any]], offset_map: OffsetMap) -> List[Dict[str, Any]]:
+    """Переводит временные метки слов из обработанной записи в исходную"""
+    remapped = []
+    for word in words:
+        item = dict(word)
+        if item.get("start") is not None:
+            item["start"] = round(offset_map.to_original(item["start"]), 3)
+        if item.get("end") is not None:
+            item["end"] = round(offset_map.to_original(item["end"]), 3)
+        remapped.append(item)
+    return remapped
+
+
+def remap_response(response: Dict[str, Any], offset_map: OffsetMap, original_duration: float) -> Dict[str, Any]:
+    """Возвращает ответ STT с временными метками исходной записи"""
+    remapped = dict(response)
+    remapped["words"] = remap_words(response.get("words", []), offset_map)
+    remapped["duration"] = original_duration
+    remapped["offset_map"] = offset_map.to_dict()
+    return remapped
+
+
+async def preprocess_for_stt(audio_path: str) -> Optional[Tuple[str, OffsetMap, float]]:
+    """
+    Готовит компактную версию записи для распознавания: моно, пониженная
+    частота дискретизации, без тишины по краям и с укороченными паузами.
+
+    Возвращает (путь к временному файлу, карта смещений, длительность исходной
+    записи) или None, если ffmpeg недоступен или обработка не дает выигрыша.
+    Временный файл удаляет вызывающий код.
+    """
+    if not is_ffmpeg_available():
+        logger.warning("ffmpeg не найден, предобработка аудио пропущена")
+        return None
+
+    duration = await probe_duration(audio_path)
+    silences = await detect_silences(audio_path, duration=duration)
+    keep = build_keep_segments(duration, silences)
+    if not keep:
+        return None
+
+    offset_map = OffsetMap.from_keep_segments(keep)
+
+    fd, output_path = tempfile.mkstemp(prefix="stt_pre_", suffix=".mp3")
+    os.close(fd)
+    try:
+        await render_segments(
+            audio_path,
+            output_path,
+            keep,
+            sample_rate=PREPROCESS_SAMPLE_RATE,
+            bitrate=PREPROCESS_BITRATE
+        )
+    except Exception:
+        os.remove(output_path)
+        raise
+
+    original_size = os.path.getsize(audio_path)
+    processed_size = os.path.getsize(output_path)
+    if processed_size > original_size * (1 - PREPROCESS_MIN_SAVING) \
+            and offset_map.processed_duration > duration * (1 - PREPROCESS_MIN_SAVING):
+        os.remove(output_path)
+        logger.info(f"Предобработка {os.path.basename(audio_path)} не дает выигрыша, отправляем исходный файл")
+        return None
+
+    logger.info(
+        f"Предобработка {os.path.basename(audio_path)}: {original_size} -> {processed_size} байт, "
+        f"{duration:.0f} -> {offset_map.processed_duration:.0f} сек."
+    )
+    return output_path, offset_map, duration
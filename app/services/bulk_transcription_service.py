@@ -0,0 +1,343 @@
+import os
+import asyncio
+import logging
+from http import HTTPStatus
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .job_queue_service import job_queue_service
+from .amocrm_client_registry import amocrm_clients
+from .amocrm_cache import amocrm_cache
+from .clinic_service import ClinicService
+from .call_ingest_service import download_and_enqueue_call, contact_name, contact_phone
+from ..utils.helpers import convert_date_to_timestamps
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Сколько звонков пакета скачивается одновременно
+BULK_TRANSCRIBE_CONCURRENCY = int(os.getenv("BULK_TRANSCRIBE_CONCURRENCY", "4"))
+# Максимальное количество звонков в одном пакете
+BULK_MAX_NOTES = 5000
+# Размер страницы и количество ID в одном запросе заметок AmoCRM
+NOTES_PAGE_LIMIT = 250
+NOTE_IDS_PER_REQUEST = 50
+# Сколько последних ошибок хранится в пакете
+BULK_ERRORS_LIMIT = 100
+
+# Статусы пакета
+BATCH_QUEUED = "queued"
+BATCH_RESOLVING = "resolving"
+BATCH_RUNNING = "running"
+BATCH_COMPLETED = "completed"
+BATCH_FAILED = "failed"
+
+# Сущности, к которым AmoCRM привязывает заметки о звонках
+CALL_NOTE_ENTITIES = ("contacts", "leads")
+CALL_NOTE_TYPES = ("call_in", "call_out")
+
+
+class BulkTranscriptionService:
+    """
+    Пакетное скачивание и транскрибация звонков (коллекция transcription_batches).
+    Пакет создается сразу, а заметки разрешаются и обрабатываются задачей
+    bulk_transcribe в воркере: звонки скачиваются параллельно с ограничением
+    BULK_TRANSCRIBE_CONCURRENCY, для каждого ставится задача transcribe.
+    Звонки, уже имеющие транскрипцию, пропускаются.
+
+    Звонок, который не удалось скачать или найти, сразу отмечается как failed
+    (снова доступен вебхуку и синхронизации звонков) и запоминается в пакете,
+    поэтому повтор задачи его не обрабатывает. Остальные звонки пакета отмечаются
+    так только при окончательной неудаче задачи (fail_batch), иначе повтор
+    задачи и синхронизация скачивали бы один звонок дважды.
+    """
+
+    def __init__(self):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.batches = self.db.transcription_batches
+
+    async def create_batch(
+        self,
+        client_id: str,
+        note_ids: Optional[List[int]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        num_speakers: int = 2,
+        analyze: bool = False
+    ) -> str:
+        """
+        Создает пакет и ставит его обработку в очередь. Возвращает ID пакета.
+
+        :param note_ids: ID заметок о звонках
+        :param date_from: начало периода (ДД.ММ.ГГГГ), если заметки не указаны
+        :param date_to: конец периода (ДД.ММ.ГГГГ), по умолчанию равен date_from
+        """
+        if not note_ids and not date_from:
+            raise ValueError("Укажите note_ids или период date_from/date_to")
+        if note_ids and len(note_ids) > BULK_MAX_NOTES:
+            raise ValueError(f"В пакете может быть не более {BULK_MAX_NOTES} звонков")
+
+        period = None
+        if not note_ids:
+            start_timestamp, _ = convert_date_to_timestamps(date_from)
+            _, end_timestamp = convert_date_to_timestamps(date_to or date_from)
+            if end_timestamp < start_timestamp:
+                raise ValueError("Дата окончания периода раньше даты начала")
+            period = {"from": start_timestamp, "to": end_timestamp}
+
+        now = datetime.now().isoformat()
+        batch = {
+            "client_id": client_id,
+            "note_ids": sorted(set(note_ids)) if note_ids else None,
+            "period": period,
+            "date_from": date_from,
+            "date_to": date_to or date_from,
+            "num_speakers": num_speakers,
+            "analyze": analyze,
+            "status": BATCH_QUEUED,
+            "total": None,
+            "progress": {"processed": 0, "queued": 0, "skipped": 0, "failed": 0, "not_found": 0},
+            "items": [],
+            "failed_note_ids": [],
+            "not_found_note_ids": [],
+            "errors": [],
+            "created_at": now,
+            "updated_at": now
+        }
+        result = await self.batches.insert_one(batch)
+        batch_id = str(result.inserted_id)
+
+        await job_queue_service.enqueue("bulk_transcribe", {"batch_id": batch_id}, max_attempts=3)
+        logger.info(f"Создан пакет транскрибации {batch_id} для клиники {client_id}")
+        return batch_id
+
+    async def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Возвращает пакет с прогрессом и сводкой по статусам задач транскрибации"""
+        if not ObjectId.is_valid(batch_id):
+            return None
+        batch = await self.batches.find_one({"_id": ObjectId(batch_id)})
+        if not batch:
+            return None
+
+        job_ids = [ObjectId(item["job_id"]) for item in batch.get("items", []) if item.get("job_id")]
+        jobs_summary = {}
+        if job_ids:
+            async for row in job_queue_service.jobs.aggregate([
+                {"$match": {"_id": {"$in": job_ids}}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ]):
+                jobs_summary[row["_id"]] = row["count"]
+
+        batch["id"] = str(batch.pop("_id"))
+        batch["jobs"] = jobs_summary
+        return batch
+
+    async def _update(
+        self,
+        batch_id: str,
+        fields: Dict[str, Any],
+        inc: Optional[Dict[str, int]] = None,
+        push: Optional[Dict[str, Any]] = None,
+        add_to_set: Optional[Dict[str, Any]] = None
+    ):
+        update: Dict[str, Any] = {"$set": dict(fields, updated_at=datetime.now().isoformat())}
+        if inc:
+            update["$inc"] = {f"progress.{key}": value for key, value in inc.items()}
+        if push:
+            update["$push"] = push
+        if add_to_set:
+            update["$addToSet"] = add_to_set
+        await self.batches.update_one({"_id": ObjectId(batch_id)}, update)
+
+    async def _fetch_call_notes(self, client, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Получает заметки о звонках по списку ID или за период"""
+        base_params = {f"filter[note_type][{i}]": note_type for i, note_type in enumerate(CALL_NOTE_TYPES)}
+        if batch.get("note_ids"):
+            note_ids = batch["note_ids"]
+            queries = [
+                dict(base_params, **{f"filter[id][{i}]": note_id for i, note_id in enumerate(note_ids[start:start + NOTE_IDS_PER_REQUEST])})
+                for start in range(0, len(note_ids), NOTE_IDS_PER_REQUEST)
+            ]
+        else:
+            queries = [dict(base_params, **{
+                "filter[updated_at][from]": batch["period"]["from"],
+                "filter[updated_at][to]": batch["period"]["to"]
+            })]
+
+        notes = {}
+        for entity_type in CALL_NOTE_ENTITIES:
+            for query in queries:
+                page = 1
+                while len(notes) < BULK_MAX_NOTES:
+                    params = dict(query, page=page, limit=NOTES_PAGE_LIMIT)
+                    notes_response, status_code = await client.contacts.request("get", f"{entity_type}/notes", params=params)
+                    if status_code != 200 or not notes_response:
+                        # 204 - заметок нет
+                        break
+                    for note in notes_response.get("_embedded", {}).get("notes", []):
+                        note["entity_type"] = entity_type
+                        notes.setdefault(note["id"], note)
+                    if "next" not in notes_response.get("_links", {}):
+                        break
+                    page += 1
+        return list(notes.values())[:BULK_MAX_NOTES]
+
+    async def transcribed_note_ids(self, client_id: str, note_ids: List[int]) -> set:
+        """ID заметок, для которых транскрипция уже есть"""
+        existing = set()
+        cursor = self.db.transcriptions.find(
+            {"client_id": client_id, "note_id": {"$in": note_ids}},
+            {"note_id": 1}
+        )
+        async for doc in cursor:
+            existing.add(doc["note_id"])
+        return existing
+
+    @staticmethod
+    async def _mark_failed(client_id: str, note_ids: List[int], error: str):
+        """Возвращает звонки из вебхука и синхронизации к повторному приему"""
+        from .webhook_service import amocrm_webhook_service
+
+        await amocrm_webhook_service.mark_failed(client_id, note_ids, error)
+
+    async def _process_note(self, client, clinic: Dict[str, Any], batch: Dict[str, Any], note: Dict[str, Any]):
+        """Скачивает звонок одной заметки и ставит транскрибацию в очередь"""
+        batch_id = str(batch["_id"])
+        note_id = note["id"]
+        entity_id = note.get("entity_id")
+        lead_id = entity_id if note["entity_type"] == "leads" else None
+        contact_id = entity_id if note["entity_type"] == "contacts" else None
+
+        phone = (note.get("params") or {}).get("phone")
+        client_name = None
+        try:
+            if contact_id:
+                contact = await amocrm_cache.get_contact(client, batch["client_id"], contact_id)
+                if contact:
+                    client_name = contact_name(contact)
+                    phone = phone or contact_phone(contact)
+
+            http_status, result = await download_and_enqueue_call(
+                client=client,
+                clinic=clinic,
+                client_id=batch["client_id"],
+                note=note,
+                note_id=note_id,
+                lead_id=lead_id,
+                contact_id=contact_id,
+                phone=phone,
+                client_name=client_name,
+                responsible_user_id=note.get("responsible_user_id"),
+                num_speakers=batch["num_speakers"],
+                analyze=batch["analyze"]
+            )
+        except Exception as e:
+            http_status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"success": False, "message": str(e), "data": None}
+
+        if http_status == HTTPStatus.OK:
+            await self._update(batch_id, {}, inc={"processed": 1, "queued": 1}, push={"items": {
+                "note_id": note_id,
+                "job_id": result["data"]["job_id"],
+                "transcription_file": result["data"]["transcription_file"]
+            }})
+        else:
+            logger.warning(f"Пакет {batch_id}: звонок {note_id} не обработан: {result['message']}")
+            await self._mark_failed(batch["client_id"], [note_id], result["message"])
+            await self._update(
+                batch_id, {},
+                inc={"processed": 1, "failed": 1},
+                push={"errors": {
+                    "$each": [{"note_id": note_id, "message": result["message"]}],
+                    "$slice": -BULK_ERRORS_LIMIT
+                }},
+                add_to_set={"failed_note_ids": note_id}
+            )
+
+    async def run(self, batch_id: str) -> Dict[str, Any]:
+        """Обрабатывает пакет (вызывается воркером, при ошибке задача повторяется)"""
+        batch = await self.batches.find_one({"_id": ObjectId(batch_id)})
+        if not batch:
+            raise ValueError(f"Пакет {batch_id} не найден")
+
+        clinic = await ClinicService().find_clinic_by_client_id(batch["client_id"])
+        if not clinic:
+            await self.fail_batch(batch_id, "Клиника не найдена")
+            return {"batch_id": batch_id, "status": BATCH_FAILED}
+
+        client = await amocrm_clients.get(batch["client_id"])
+        try:
+            await self._update(batch_id, {"status": BATCH_RESOLVING})
+            notes = await self._fetch_call_notes(client, batch)
+            found = {note["id"] for note in notes}
+
+            # При повторном запуске звонки, уже поставленные в очередь или
+            # переданные на повтор вебхуку и синхронизации, не обрабатываются снова
+            queued = {item["note_id"] for item in batch.get("items", [])}
+            failed = set(batch.get("failed_note_ids") or [])
+            transcribed = await self.transcribed_note_ids(batch["client_id"], list(found - queued - failed))
+            pending = [note for note in notes if note["id"] not in queued | failed | transcribed]
+
+            # Ненайденные заметки передаются на повтор один раз
+            missing = sorted(set(batch.get("note_ids") or []) - found - failed)
+            newly_missing = sorted(set(missing) - set(batch.get("not_found_note_ids") or []))
+            if newly_missing:
+                await self._mark_failed(batch["client_id"], newly_missing, "Заметка не найдена")
+
+            # Прогресс пересчитывается заново при каждой попытке
+            await self._update(batch_id, {
+                "status": BATCH_RUNNING,
+                "message": None,
+                "total": len(found | failed) + len(missing),
+                "not_found_note_ids": missing,
+                "progress": {
+                    "processed": len(queued) + len(failed),
+                    "queued": len(queued),
+                    "skipped": len(transcribed),
+                    "failed": len(failed),
+                    "not_found": len(missing)
+                }
+            })
+            logger.info(f"Пакет {batch_id}: найдено звонков {len(notes)}, к обработке {len(pending)}")
+
+            semaphore = asyncio.Semaphore(BULK_TRANSCRIBE_CONCURRENCY)
+
+            async def process(note):
+                async with semaphore:
+                    await self._process_note(client, clinic, batch, note)
+
+            await asyncio.gather(*(process(note) for note in pending))
+
+            await self._update(batch_id, {"status": BATCH_COMPLETED, "finished_at": datetime.now().isoformat()})
+            return {"batch_id": batch_id, "total": len(notes), "processed": len(pending)}
+        except Exception as e:
+            await self._update(batch_id, {"status": BATCH_QUEUED, "message": f"Ошибка, пакет будет обработан повторно: {e}"})
+            raise
+
+    async def fail_batch(self, batch_id: str, error: str):
+        """
+        Окончательная неудача пакета (попытки задачи исчерпаны): звонки,
+        не поставленные в очередь, передаются на повтор вебхуку и синхронизации.
+        """
+        await self._update(batch_id, {"status": BATCH_FAILED, "message": error})
+        batch = await self.batches.find_one(
+            {"_id": ObjectId(batch_id)},
+            {"client_id": 1, "note_ids": 1, "items.note_id": 1, "failed_note_ids": 1, "not_found_note_ids": 1}
+        )
+        if not batch or not batch.get("note_ids"):
+            return
+        handled = {item["note_id"] for item in batch.get("items", [])}
+        handled |= set(batch.get("failed_note_ids") or []) | set(batch.get("not_found_note_ids") or [])
+        handled |= await self.transcribed_note_ids(batch["client_id"], batch["note_ids"])
+        unqueued = [note_id for note_id in batch["note_ids"] if note_id not in handled]
+        if unqueued:
+            await self._mark_failed(batch["client_id"], unqueued, error)
+
+
+# Создаем экземпляр для использования в API и воркерах
+bulk_transcription_service = BulkTranscriptionService()
@@ -1,309 +1,168 @@
 import os
+import asyncio
 from datetime import datetime
 from ..settings.auth import get_langchain_token
-from ..settings.paths import DATA_DIR, TRANSCRIPTION_DIR
-from langchain.prompts import PromptTemplate
+from ..settings.paths import TRANSCRIPTION_DIR
+from ..settings.storage import analysis_storage
+from ..models.call_analysis import StructuredCallAnalysis
+from .transcript_store import load_transcript, render_text, structured_path
+from .prompt_registry import prompt_registry
+
+# Сколько запросов к LLM один процесс выполняет одновременно
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+# Категории звонков по коду из промпта классификации
+CALL_CATEGORIES = {
+    1: "Первичное обращение (новый клиент)",
+    2: "Запись на приём",
+    3: "Запрос информации (цены, услуги и т.д.)",
+    4: "Проблема или жалоба",
+    5: "Изменение или отмена встречи",
+    6: "Повторная консультация",
+    7: "Запрос результатов анализов",
+    8: "Другое"
+}
+
+# Пункты чеклиста в порядке вывода в тексте анализа
+SCORE_TITLES = {
+    "greeting": "Приветствие",
+    "needs_identification": "Выявление потребностей",
+    "solution_proposal": "Презентация",
+    "objection_handling": "Работа с возражениями",
+    "call_closing": "Закрытие продажи",
+    "overall_score": "Общая оценка"
+}
+TONE_TITLES = {"positive": "позитивная", "neutral": "нейтральная", "negative": "негативная"}
+SATISFACTION_TITLES = {"high": "высокая", "medium": "средняя", "low": "низкая"}
+# Вес подкритерия при расчете процента выполнения (FG%)
+SUBCRITERIA_WEIGHTS = {"✅": 1.0, "±": 0.5, "!": 0.0}
+
+
+class CallAnalysisParseError(ValueError):
+    """Ответ LLM не соответствует схеме структурированного анализа"""
 
 class CallAnalysisService:
     def __init__(self):
         self.llm = get_langchain_token()
-        self.prompts_path = os.path.join(DATA_DIR, "prompts.txt")
+        # Промпты разбираются один раз и перечитываются при изменении файла
+        self.prompts = prompt_registry
         
-        # Создаем директорию для результатов анализа
-        self.analysis_dir = os.path.join(DATA_DIR, "analysis")
-        os.makedirs(self.analysis_dir, exist_ok=True)
+        # Директория для результатов анализа (разбита по клиникам и датам)
+        self.analysis_dir = analysis_storage.root
+        
+        # Та же модель с ответом по схеме StructuredCallAnalysis (function calling)
+        self.structured_llm = self.llm.with_structured_output(StructuredCallAnalysis, include_raw=True)
+        
+        # Ограничение одновременных запросов к LLM (создается в event loop при первом вызове)
+        self._llm_semaphore = None
+        self._llm_loop = None
     
     def load_transcription(self, file_path):
         """Загружает транскрипцию звонка из файла"""
+        # Если есть структурированная версия, текст формируется из нее
+        if os.path.exists(structured_path(file_path)):
+            transcript = load_transcript(file_path)
+            if transcript:
+                return render_text(transcript).strip()
+
         with open(file_path, "r", encoding="utf-8") as f:
             return f.read().strip()
     
-    def load_prompt(self, prompt_type):
-        """Загружает нужный промпт из файла prompts.txt"""
-        if not os.path.exists(self.prompts_path):
-            raise FileNotFoundError(f"Файл промптов не найден: {self.prompts_path}")
-        
-        with open(self.prompts_path, "r", encoding="utf-8") as f:
-            content = f.read()
-        
-        prompts = {}
-        sections = content.split("[")
-        for section in sections:
-            if "]" in section:
-                key, text = section.split("]", 1)
-                prompts[key.strip()] = text.strip()
-        
-        return prompts.get(prompt_type, "")
+    def _semaphore(self):
+        """Семафор LLM_CONCURRENCY текущего event loop"""
+        loop = asyncio.get_running_loop()
+        if self._llm_loop is not loop:
+            self._llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+            self._llm_loop = loop
+        return self._llm_semaphore
     
-    # def classify_call(self, dialogue):
-    #     """Определяет тип звонка"""
-    #     prompt_template = PromptTemplate(
-    #         input_variables=["dialogue"],
-    #         template=self.load_prompt("classification")
-    #     )
-        
-    #     query = prompt_template.format(dialogue=dialogue)
-    #     response = self.llm.invoke(query)
-    #     try:
-    #         call_type = int(response.content.strip())
-    #     except ValueError:
-    #         call_type = 0  # Неопределенный тип звонка
-    #     return call_type
-
-    # Исправленная версия метода classify_call в файле call_analysis_service.py
-
-    # def classify_call(self, dialogue):
-    #     """Определяет тип звонка"""
-    #     prompt_template = PromptTemplate(
-    #         input_variables=["dialogue"],
-    #         template=self.load_prompt("classification")
-    #     )
-        
-    #     query = prompt_template.format(dialogue=dialogue)
-    #     response = self.llm.invoke(query)
-        
-    #     # Создаем словарь для сопоставления имен категорий с кодами
-    #     categories = {
-    #         "Первичное обращение": 1,
-    #         "Запись на приём": 2,
-    #         "Запрос информации": 3,
-    #         "Проблема или жалоба": 4,
-    #         "Изменение или отмена встречи": 5,
-    #         "Повторная консультация": 6,
-    #         "Запрос результатов анализов": 7,
-    #         "Другое": 8
-    #     }
-        
-    #     # Получаем текст ответа от LLM
-    #     response_text = response.content.strip()
-        
-    #     # Пытаемся сначала определить категорию по тексту
-    #     for category_name, category_code in categories.items():
-    #         if category_name.lower() in response_text.lower():
-    #             return category_code
-        
-    #     # Если не нашли по названию, пробуем найти число в ответе
-    #     try:
-    #         # Пытаемся извлечь число из ответа
-    #         import re
-    #         numbers = re.findall(r'\d+', response_text)
-    #         if numbers:
-    #             call_type = int(numbers[0])
-    #             if 1 <= call_type <= 8:  # Проверяем, что число в допустимом диапазоне
-    #                 return call_type
-    #     except ValueError:
-    #         pass
-        
-    #     # Если ничего не удалось определить, устанавливаем значение по умолчанию
-    #     return 1  # По умолчанию "Первичное обращение" как наиболее вероятное
-        
-    def classify_call(self, dialogue):
-        """Определяет тип звонка и возвращает текстовое название категории"""
-        prompt_template = PromptTemplate(
-            input_variables=["dialogue"],
-            template=self.load_prompt("classification")
-        )
-        
-        query = prompt_template.format(dialogue=dialogue)
-        response = self.llm.invoke(query)
-        
-        # Получаем текст ответа от LLM
-        response_text = response.content.strip()
-        
-        # Словарь для точного соответствия категорий из промпта
-        category_keywords = {
-            "первичное обращение": "Первичное обращение (новый клиент)",
-            "запись на приём": "Запись на приём",
-            "запрос информации": "Запрос информации (цены, услуги и т.д.)",
-            "проблема или жалоба": "Проблема или жалоба",
-            "изменение или отмена встречи": "Изменение или отмена встречи",
-            "повторная консультация": "Повторная консультация", 
-            "запрос результатов анализов": "Запрос результатов анализов",
-            "другое": "Другое"
-        }
-        
-        # Проверяем точное совпадение полного названия категории
-        response_lower = response_text.lower()
-        for keyword, full_name in category_keywords.items():
-            if keyword in response_lower:
-                return full_name
-        
-        # Если в ответе есть числа от 1 до 8, преобразуем их в названия категорий
-        import re
-        numbers = re.findall(r'\d+', response_text)
-        if numbers:
-            for num in numbers:
-                try:
-                    category_number = int(num)
-                    if 1 <= category_number <= 8:
-                        # Сопоставляем числовой код с полным названием
-                        category_map = {
-                            1: "Первичное обращение (новый клиент)",
-                            2: "Запись на приём",
-                            3: "Запрос информации (цены, услуги и т.д.)",
-                            4: "Проблема или жалоба",
-                            5: "Изменение или отмена встречи",
-                            6: "Повторная консультация", 
-                            7: "Запрос результатов анализов",
-                            8: "Другое"
-                        }
-                        return category_map[category_number]
-                except ValueError:
-                    continue
-        
-        # Если не удалось определить категорию из ответа, анализируем диалог эвристически
-        dialogue_lower = dialogue.lower()
-        
-        # Ищем ключевые слова, характерные для каждой категории
-        if "запис" in dialogue_lower and ("на прием" in dialogue_lower or "к врачу" in dialogue_lower):
-            return "Запись на приём"
-        elif "первый раз" in dialogue_lower or "впервые" in dialogue_lower:
-            return "Первичное обращение (новый клиент)"
-        elif "сколько стоит" in dialogue_lower or "цена" in dialogue_lower or "цены" in dialogue_lower:
-            return "Запрос информации (цены, услуги и т.д.)"
-        elif "проблем" in dialogue_lower or "жалоб" in dialogue_lower or "болит" in dialogue_lower:
-            return "Проблема или жалоба"
-        elif "перенести" in dialogue_lower or "отмен" in dialogue_lower:
-            return "Изменение или отмена встречи"
-        elif "повторн" in dialogue_lower or "контрольный" in dialogue_lower:
-            return "Повторная консультация"
-        elif "результат" in dialogue_lower or "анализ" in dialogue_lower:
-            return "Запрос результатов анализов"
-        
-        # Если все методы не дали результат, возвращаем наиболее вероятное
-        # По контексту - в стоматологиях это обычно "Запись на приём"
-        return "Запись на приём"
-
-    # def classify_call(self, dialogue):
-    #     """Определяет тип звонка и возвращает текстовое название категории"""
-    #     prompt_template = PromptTemplate(
-    #         input_variables=["dialogue"],
-    #         template=self.load_prompt("classification")
-    #     )
-        
-    #     query = prompt_template.format(dialogue=dialogue)
-    #     response = self.llm.invoke(query)
-        
-    #     # Получаем текст ответа от LLM
-    #     response_text = response.content.strip()
-        
-    #     # Словарь для сопоставления текстовых названий категорий с их полными названиями
-    #     category_map = {
-    #         "первичное обращение": "Первичное обращение (новый клиент)",
-    #         "запись на приём": "Запись на приём",
-    #         "запрос информации": "Запрос информации (цены, услуги и т.д.)",
-    #         "проблема или жалоба": "Проблема или жалоба",
-    #         "изменение или отмена": "Изменение или отмена встречи",
-    #         "повторная консультация": "Повторная консультация", 
-    #         "запрос результатов": "Запрос результатов анализов",
-    #         "другое": "Другое"
-    #     }
-        
-    #     # Пытаемся определить категорию по тексту ответа
-    #     for key, full_name in category_map.items():
-    #         if key.lower() in response_text.lower():
-    #             return full_name
-        
-    #     # Если не нашли по тексту, пытаемся найти числовой код в ответе
-    #     try:
-    #         import re
-    #         numbers = re.findall(r'\d+', response_text)
-    #         if numbers:
-    #             call_type = int(numbers[0])
-    #             if 1 <= call_type <= 8:
-    #                 # Сопоставляем числовой код с полным названием
-    #                 code_to_name = {
-    #                     1: "Первичное обращение (новый клиент)",
-    #                     2: "Запись на приём",
-    #                     3: "Запрос информации (цены, услуги и т.д.)",
-    #                     4: "Проблема или жалоба",
-    #                     5: "Изменение или отмена встречи",
-    #                     6: "Повторная консультация", 
-    #                     7: "Запрос результатов анализов",
-    #                     8: "Другое"
-    #                 }
-    #                 return code_to_name.get(call_type, "Неопределенный тип звонка")
-    #     except ValueError:
-    #         pass
-        
-    #     # Если не удалось определить категорию, возвращаем первичное обращение как наиболее вероятное
-    #     return "Первичное обращение (новый клиент)"
-
-    def analyze_call(self, dialogue):
-        """Анализирует звонок (тональность + оценка оператора)"""
-        prompt_template = PromptTemplate(
-            input_variables=["dialogue"],
-            template=self.load_prompt("analysis")
-        )
-        
-        query = prompt_template.format(dialogue=dialogue)
-        response = self.llm.invoke(query)
-        return response.content.strip()
+    async def astructured_call_analysis(self, dialogue):
+        """
+        Классификация, оценки по критериям и метрики звонка одним запросом к LLM
+        (промпт structured_analysis, ответ по схеме StructuredCallAnalysis).
+        
+        Возвращает результат и версию промпта, по которому он получен.
+        
+        :raises CallAnalysisParseError: ответ LLM не удалось разобрать по схеме
+        """
+        query, prompt_version = self.prompts.format("structured_analysis", dialogue=dialogue)
+        async with self._semaphore():
+            response = await self.structured_llm.ainvoke(query)
+        
+        if response.get("parsing_error") or response.get("parsed") is None:
+            raise CallAnalysisParseError(f"Ответ LLM не соответствует схеме анализа звонка (промпт {prompt_version}): {response.get('parsing_error') or 'пустой ответ'}")
+        return response["parsed"], prompt_version
     
-    # def full_call_analysis(self, dialogue, meta_info=None):
-    #     """Полный анализ звонка: классификация + анализ"""
-    #     call_class = self.classify_call(dialogue)
-    #     call_analysis = self.analyze_call(dialogue)
-        
-    #     result = {
-    #         "classification": call_class,
-    #         "analysis": call_analysis,
-    #         "meta_info": meta_info or {},
-    #         "timestamp": datetime.now().isoformat()
-    #     }
-        
-    #     return result
-
-    # def full_call_analysis(self, dialogue, meta_info=None):
-    #     """Полный анализ звонка: классификация + анализ"""
-    #     # Словарь для сопоставления числового кода категории с названием
-    #     category_names = {
-    #         1: "Первичное обращение (новый клиент)",
-    #         2: "Запись на приём",
-    #         3: "Запрос информации (цены, услуги и т.д.)",
-    #         4: "Проблема или жалоба",
-    #         5: "Изменение или отмена встречи",
-    #         6: "Повторная консультация", 
-    #         7: "Запрос результатов анализов",
-    #         8: "Другое",
-    #         0: "Неопределенный тип звонка"
-    #     }
-        
-    #     # Получаем числовой код категории
-    #     call_class = self.classify_call(dialogue)
-        
-    #     # Получаем название категории
-    #     call_class_name = category_names.get(call_class, "Неопределенный тип звонка")
-        
-    #     # Анализируем звонок
-    #     call_analysis = self.analyze_call(dialogue)
-        
-    #     result = {
-    #         "classification": call_class,  # Сохраняем числовой код для совместимости
-    #         "classification_name": call_class_name,  # Добавляем название категории
-    #         "analysis": call_analysis,
-    #         "meta_info": meta_info or {},
-    #         "timestamp": datetime.now().isoformat()
-    #     }
-        
-    #     return result
-
-    def full_call_analysis(self, dialogue, meta_info=None):
-        """Полный анализ звонка: классификация + анализ"""
-        # Получаем классификацию звонка (теперь это может быть строка)
-        call_class = self.classify_call(dialogue)
-        
-        # Получаем текст анализа
-        call_analysis = self.analyze_call(dialogue)
-        
-        result = {
-            "classification": call_class,  # Сохраняем полученное значение (строку или число)
-            "analysis": call_analysis,
+    @staticmethod
+    def build_metrics(structured):
+        """Метрики звонка (формат CallMetrics) из структурированного анализа"""
+        subcriteria = {key: value for key, value in structured.subcriteria.model_dump().items() if value}
+        metrics = {key: getattr(structured.scores, key).score for key in SCORE_TITLES}
+        metrics["tone"] = structured.tone
+        metrics["customer_satisfaction"] = structured.customer_satisfaction
+        
+        # FG% - доля выполненных подкритериев (частично выполненный считается за половину)
+        weights = [SUBCRITERIA_WEIGHTS[value] for value in subcriteria.values()]
+        if weights:
+            metrics["fg_percent"] = round(sum(weights) / len(weights) * 100, 1)
+        else:
+            metrics["fg_percent"] = metrics["overall_score"] * 10
+        
+        if subcriteria:
+            metrics["subcriteria"] = subcriteria
+        return metrics
+    
+    @staticmethod
+    def render_analysis(structured):
+        """Текст анализа для файла и ответа API"""
+        lines = []
+        for number, (key, title) in enumerate(SCORE_TITLES.items(), start=1):
+            criterion = getattr(structured.scores, key)
+            lines.append(f"{number}. {title} ({criterion.score:g}/10)")
+            lines.append(criterion.comment.strip())
+            lines.append("")
+        
+        lines.append(f"Тональность разговора: {TONE_TITLES[structured.tone]}")
+        lines.append(f"Удовлетворенность клиента: {SATISFACTION_TITLES[structured.customer_satisfaction]}")
+        lines.append(f"Конверсия: {'да' if structured.conversion else 'нет'}")
+        if structured.client_request:
+            lines.append(f"Потребность клиента: {structured.client_request}")
+        
+        subcriteria = {key: value for key, value in structured.subcriteria.model_dump().items() if value}
+        if subcriteria:
+            lines.append("")
+            lines.append("Подкритерии:")
+            for key, value in subcriteria.items():
+                lines.append(f"- {structured.subcriteria.model_fields[key].description}: {value}")
+        
+        lines.append("")
+        lines.append("Рекомендации:")
+        for number, recommendation in enumerate(structured.recommendations, start=1):
+            lines.append(f"{number}. {recommendation}")
+        return "\n".join(lines)
+    
+    async def afull_call_analysis(self, dialogue, meta_info=None):
+        """
+        Полный анализ звонка без блокировки event loop: классификация,
+        оценка и метрики получаются одним структурированным запросом к LLM
+        """
+        structured, prompt_version = await self.astructured_call_analysis(dialogue)
+        
+        return {
+            "classification": CALL_CATEGORIES[structured.category_code],
+            "classification_code": structured.category_code,
+            "analysis": self.render_analysis(structured),
+            "metrics": self.build_metrics(structured),
+            "recommendations": structured.recommendations,
+            "call_type": structured.call_type,
+            "call_category": structured.call_category,
+            "traffic_source": structured.traffic_source,
+            "client_request": structured.client_request,
+            "conversion": structured.conversion,
+            "prompt_version": prompt_version,
             "meta_info": meta_info or {},
             "timestamp": datetime.now().isoformat()
         }
-        
-        return result
     
     # def save_analysis(self, analysis_result, filename=None):
     #     """Сохраняет результат анализа в текстовый файл"""
@@ -385,10 +244,14 @@ class CallAnalysisService:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"analysis_{timestamp}.txt"
         
-        file_path = os.path.join(self.analysis_dir, filename)
+        clinic_id = (analysis_result.get('meta_info') or {}).get('client_id')
+        file_path = analysis_storage.path_for(filename, clinic_id=clinic_id)
         
         with open(file_path, "w", encoding="utf-8") as f:
-            f.write(f"Дата и время анализа: {analysis_result['timestamp']}\n\n")
+            f.write(f"Дата и время анализа: {analysis_result['timestamp']}\n")
+            if analysis_result.get('prompt_version'):
+                f.write(f"Версия промпта: {analysis_result['prompt_version']}\n")
+            f.write("\n")
             
             # Добавляем метаданные
             if analysis_result.get('meta_info'):
@@ -0,0 +1,268 @@
+import re
+import logging
+from http import HTTPStatus
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .job_queue_service import job_queue_service
+from .audio_catalog_service import audio_catalog_service
+from .download_client import download_client
+from .amocrm_cache import amocrm_cache
+from ..settings.storage import audio_storage, transcription_storage
+from ..utils.downloads import stream_to_file, DownloadError
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+
+async def download_and_enqueue_call(
+    client,
+    clinic: Dict[str, Any],
+    client_id: str,
+    note: Dict[str, Any],
+    note_id: int,
+    lead_id: Optional[int] = None,
+    contact_id: Optional[int] = None,
+    phone: Optional[str] = None,
+    client_name: Optional[str] = None,
+    responsible_user_id: Optional[int] = None,
+    num_speakers: int = 2,
+    is_first_contact: bool = False,
+    analyze: bool = False
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Скачивает запись звонка из заметки AmoCRM и ставит её транскрибацию в очередь.
+    Определяет имя ответственного и связанного администратора.
+
+    :param client: клиент AmoCRM клиники
+    :param note: заметка о звонке со ссылкой на запись (см. find_call_link)
+    :returns: HTTP-статус и ответ в формате {"success", "message", "data"}
+    """
+    manager_name = None
+    administrator_id = None  # ID администратора определяется по ответственному
+
+    # Получаем ссылку на запись звонка
+    call_link = find_call_link(client, note)
+    
+    if not call_link:
+        logger.warning(f"В заметке {note_id} нет ссылки на запись звонка")
+        return HTTPStatus.NOT_FOUND, {
+            "success": False,
+            "message": f"В заметке {note_id} нет ссылки на запись звонка",
+            "data": None
+        }
+    
+    # Если есть ID ответственного, пытаемся получить его имя и найти связанного администратора
+    if responsible_user_id:
+        try:
+            # Данные о пользователе AmoCRM (из кэша, если недавно запрашивались)
+            user_response = await amocrm_cache.get_user(client, client_id, responsible_user_id)
+            
+            if user_response:
+                # Получаем имя ответственного
+                manager_name = user_response.get("name")
+                logger.info(f"Имя ответственного: {manager_name}")
+                
+                # Ищем администратора по amocrm_user_id и клинике
+                mongo_client = AsyncIOMotorClient(MONGO_URI)
+                db = mongo_client[DB_NAME]
+                
+                admin = await db.administrators.find_one({
+                    "amocrm_user_id": str(responsible_user_id),
+                    "clinic_id": ObjectId(clinic["id"])
+                })
+                
+                if admin:
+                    administrator_id = str(admin["_id"])
+                    logger.info(f"Найден администратор в системе: {administrator_id} ({admin.get('name', 'Без имени')})")
+                else:
+                    logger.warning(f"Администратор для ответственного {responsible_user_id} не найден в системе")
+                    
+                    # Попробуем найти любого администратора для этой клиники
+                    admin = await db.administrators.find_one({
+                        "clinic_id": ObjectId(clinic["id"])
+                    })
+                    
+                    if admin:
+                        administrator_id = str(admin["_id"])
+                        logger.info(f"Найден администратор по умолчанию: {administrator_id} ({admin.get('name', 'Без имени')})")
+        except Exception as e:
+            logger.warning(f"Не удалось получить данные ответственного: {e}")
+    
+    # Добавляем параметры аутентификации к ссылке
+    account_id = note.get("account_id")
+    user_id = note.get("created_by")
+    
+    if "userId" not in call_link and account_id and user_id:
+        if "?" in call_link:
+            call_link += f"&userId={user_id}&accountId={account_id}"
+        else:
+            call_link += f"?userId={user_id}&accountId={account_id}"
+            
+    logger.info(f"Ссылка на запись звонка: {call_link}")
+    
+    # Скачиваем звонок
+    # Формируем имя файла в соответствии с вашим форматом
+    if lead_id:
+        file_name = f"lead_{lead_id}_note_{note_id}.mp3"
+    else:
+        file_name = f"contact_{contact_id}_note_{note_id}.mp3"
+        
+    file_path = audio_storage.path_for(file_name, clinic_id=client_id)
+    
+    # Скачиваем файл через общую сессию (соединения переиспользуются)
+    session = await download_client.get_session()
+    logger.info(f"Скачиваем файл по ссылке: {call_link}")
+    download_result = None
+    
+    async with session.get(call_link, allow_redirects=True) as download_response:
+        status_code = download_response.status
+        logger.info(f"Статус ответа: {status_code}")
+        
+        if status_code == 200:
+            # Сохраняем файл потоково, хэш считается по ходу записи
+            try:
+                download_result = await stream_to_file(download_response, file_path, min_size=1000)
+                logger.info(f"Файл записи звонка сохранен: {file_path}")
+            except DownloadError as e:
+                logger.error(f"Получен неверный формат данных ({e.reason}): {e}")
+    
+    download_success = download_result is not None
+    if download_success:
+        await audio_catalog_service.register(
+            file_path,
+            note_id=note_id,
+            contact_id=contact_id,
+            lead_id=lead_id,
+            client_id=client_id,
+            audio_hash=download_result.sha256
+        )
+    
+    if not download_success:
+        logger.error("Не удалось скачать запись звонка")
+        return HTTPStatus.INTERNAL_SERVER_ERROR, {
+            "success": False,
+            "message": "Не удалось скачать запись звонка",
+            "data": None
+        }
+    
+    # Запускаем транскрибацию в фоновом режиме
+    logger.info(f"Запускаем транскрибацию файла: {file_path}")
+    
+    # Генерируем имя файла для сохранения результата
+    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    phone_str = ""
+    
+    if phone:
+        # Очищаем номер телефона от лишних символов для использования в имени файла
+        phone_str = re.sub(r'[^\d]', '', phone)
+        
+    # Формируем имя файла
+    if phone_str:
+        output_filename = f"{phone_str}_{current_time}.txt"
+    else:
+        output_filename = f"note_{note_id}_{current_time}.txt"
+        
+    output_path = transcription_storage.path_for(output_filename, clinic_id=client_id)
+    
+    # Логируем информацию об администраторе
+    if administrator_id:
+        logger.info(f"Запуск транскрибации с привязкой к администратору ID: {administrator_id}")
+    else:
+        logger.warning("Администратор не определен, лимиты не будут обновлены")
+    
+    # Ставим транскрибацию в очередь с использованием имен менеджера и клиента
+    job_id = await job_queue_service.enqueue(
+        "transcribe",
+        {
+            "audio_path": file_path,
+            "output_path": output_path,
+            "num_speakers": num_speakers,
+            "diarize": True,
+            "phone": phone,
+            "manager_name": manager_name,
+            "client_name": client_name,
+            "is_first_contact": is_first_contact,
+            "note_data": {
+                "note_id": note_id,
+                "lead_id": lead_id,
+                "contact_id": contact_id,
+                "client_id": client_id
+            },
+            "administrator_id": administrator_id,  # Используем определенный ID администратора
+            "audio_hash": download_result.sha256,
+            "analyze": analyze
+        },
+        dedup_key=f"transcribe:{client_id}:{note_id}"
+    )
+    
+    return HTTPStatus.OK, {
+        "success": True,
+        "message": "Звонок скачан, транскрибация запущена",
+        "data": {
+            "note_id": note_id,
+            "audio_file": file_name,
+            "transcription_file": output_filename,
+            "phone": phone,
+            "client_name": client_name,
+            "manager_name": manager_name,
+            "is_first_contact": is_first_contact,
+            "status": "processing",
+            "job_id": job_id,
+            "job_url": f"/api/jobs/{job_id}",
+            "found_administrator_id": administrator_id,  # Добавляем для отладки
+            "download_url": f"/api/amocrm/contact/call/{note_id}/download?client_id={client_id}" + (f"&contact_id={contact_id}" if contact_id else ""),
+            "transcription_url": f"/api/transcriptions/{output_filename}/download"
+        }
+    }
+
+
+def find_call_link(client, note: Dict[str, Any]) -> Optional[str]:
+    """
+    Ссылка на запись звонка из заметки AmoCRM: params.link, params.telephone.link,
+    известные ссылки телефоний в params, затем рекурсивный поиск по всей заметке.
+    """
+    params = note.get("params") or {}
+
+    # 1. Прямая проверка наличия ссылки в параметрах
+    if params.get("link"):
+        return params["link"]
+
+    # 2. Для телефонии uiscom/calltouch ссылка может быть в telephone.link
+    telephone = params.get("telephone")
+    if isinstance(telephone, dict) and telephone.get("link"):
+        logger.info(f"Найдена ссылка в parameters.telephone.link: {telephone['link']}")
+        return telephone["link"]
+
+    # 3. Для comagic/voximplant может быть другое поле
+    for key, value in params.items():
+        if isinstance(value, str) and value.startswith("http") and (".mp3" in value or "media.comagic.ru" in value or "voximplant" in value):
+            logger.info(f"Найдена ссылка в parameters.{key}: {value}")
+            return value
+
+    # 4. Рекурсивный поиск ссылок по структуре заметки
+    call_link = client._find_link_in_dict(note, max_depth=5)
+    if call_link:
+        logger.info(f"Найдена ссылка в структуре заметки: {call_link}")
+    return call_link
+
+
+def contact_name(contact: Dict[str, Any]) -> Optional[str]:
+    """Имя клиента из контакта AmoCRM"""
+    name = contact.get("name")
+    if not name:
+        name = f"{contact.get('first_name', '')} {contact.get('last_name', '')}".strip() or None
+    return name
+
+
+def contact_phone(contact: Dict[str, Any]) -> Optional[str]:
+    """Первый номер телефона из полей контакта AmoCRM"""
+    for field in contact.get("custom_fields_values") or []:
+        if field.get("field_code") == "PHONE" and field.get("values"):
+            return field["values"][0].get("value")
+    return None
@@ -18,227 +18,6 @@ class CallMetricsService:
         self.db = self.client[DB_NAME]
         self.metrics_collection = self.db["call_metrics"]
 
-    def extract_metrics_from_analysis(analysis_text: str) -> Dict[str, Any]:
-        """
-        Извлекает числовые оценки и категориальные переменные из текста анализа
-        Расширенная версия с поддержкой дополнительных метрик
-        """
-        try:
-            metrics = {}
-            subcriteria = {}
-            
-            # Извлекаем числовые оценки
-            greeting_match = re.search(r'Приветствие[^(]*\((\d+)/10\)', analysis_text)
-            if greeting_match:
-                metrics["greeting"] = float(greeting_match.group(1))
-            
-            needs_match = re.search(r'Выявление потребностей[^(]*\((\d+)/10\)', analysis_text)
-            if needs_match:
-                metrics["needs_identification"] = float(needs_match.group(1))
-            
-            solution_match = re.search(r'Предложение решения[^(]*\((\d+)/10\)', analysis_text)
-            if solution_match:
-                metrics["solution_proposal"] = float(solution_match.group(1))
-            
-            objection_match = re.search(r'Работа с возражениями[^(]*\((\d+)/10\)', analysis_text)
-            if objection_match:
-                metrics["objection_handling"] = float(objection_match.group(1))
-            
-            closing_match = re.search(r'Завершение разговора[^(]*\((\d+)/10\)', analysis_text)
-            if closing_match:
-                metrics["call_closing"] = float(closing_match.group(1))
-            
-            overall_match = re.search(r'Общая оценка[^(]*\((\d+)/10\)', analysis_text)
-            if overall_match:
-                metrics["overall_score"] = float(overall_match.group(1))
-            
-            # Извлекаем тональность разговора
-            tone_match = re.search(r'Тональность разговора[^(]*(позитивн|нейтральн|негативн)', analysis_text, re.IGNORECASE)
-            if tone_match:
-                tone_text = tone_match.group(1).lower()
-                if "позитивн" in tone_text:
-                    metrics["tone"] = "positive"
-                elif "негативн" in tone_text:
-                    metrics["tone"] = "negative"
-                else:
-                    metrics["tone"] = "neutral"
-            
-            # Извлекаем удовлетворенность клиента
-            satisfaction_match = re.search(r'Удовлетворенность клиента[^(]*(высок|средн|низк)', analysis_text, re.IGNORECASE)
-            if satisfaction_match:
-                satisfaction_text = satisfaction_match.group(1).lower()
-                if "высок" in satisfaction_text:
-                    metrics["customer_satisfaction"] = "high"
-                elif "низк" in satisfaction_text:
-                    metrics["customer_satisfaction"] = "low"
-                else:
-                    metrics["customer_satisfaction"] = "medium"
-            
-            # Пытаемся извлечь FG% (процент выполнения критериев)
-            fg_match = re.search(r'выполнен(?:ие|о)(?:\s+критериев)?(?:\s*[-:])?\s*(\d+)%', analysis_text, re.IGNORECASE)
-            if fg_match:
-                metrics["fg_percent"] = float(fg_match.group(1))
-            else:
-                # Если не найдено явное указание FG%, рассчитаем его из средних оценок
-                if "overall_score" in metrics:
-                    metrics["fg_percent"] = metrics["overall_score"] * 10  # Преобразуем оценку 0-10 в проценты 0-100
-            
-            # Извлекаем информацию о конверсии
-            conversion_match = re.search(r'конверсия[^:]*:[^a-zа-я]*(да|нет|успешн|неуспешн)', analysis_text, re.IGNORECASE)
-            if conversion_match:
-                conversion_text = conversion_match.group(1).lower()
-                if "да" in conversion_text or "успешн" in conversion_text:
-                    metrics["conversion"] = True
-                else:
-                    metrics["conversion"] = False
-            
-            # Извлекаем тип звонка (входящий/исходящий)
-            call_type_match = re.search(r'тип звонка[^:]*:[^a-zа-я]*(входящ|исходящ)', analysis_text, re.IGNORECASE)
-            if call_type_match:
-                call_type_text = call_type_match.group(1).lower()
-                if "входящ" in call_type_text:
-                    metrics["call_type"] = "входящий"
-                else:
-                    metrics["call_type"] = "исходящий"
-            
-            # Категория звонка (первичка_1/первичка_перезвон/подтверждение/вторичка)
-            call_category_match = re.search(r'категория[^:]*:[^a-zа-я]*(первичка\s*1|первичка\s*перезвон|подтвержден|вторичк)', analysis_text, re.IGNORECASE)
-            if call_category_match:
-                category_text = call_category_match.group(1).lower()
-                if "первичка 1" in category_text or "первичка1" in category_text:
-                    metrics["call_category"] = "первичка_1"
-                elif "перезвон" in category_text:
-                    metrics["call_category"] = "первичка_перезвон"
-                elif "подтвержден" in category_text:
-                    metrics["call_category"] = "подтверждение"
-                elif "вторичк" in category_text:
-                    metrics["call_category"] = "вторичка"
-            
-            # Извлекаем источник трафика
-            source_match = re.search(r'источник[^:]*:[^a-zа-я]*([a-zа-я0-9\s]+)', analysis_text, re.IGNORECASE)
-            if source_match:
-                metrics["traffic_source"] = source_match.group(1).strip()
-            
-            # Извлекаем потребность клиента
-            need_match = re.search(r'потребность[^:]*:[^a-zа-я]*([^\n.]+)', analysis_text, re.IGNORECASE)
-            if need_match:
-                metrics["client_request"] = need_match.group(1).strip()
-            
-            # Извлекаем детальные критерии оценки для подкритериев
-            # Ищем последовательность символов ✅, !, ± в тексте
-            criteria_match = re.search(r'критерии[^:]*:[^a-zа-я]*([✅!±\s]+)', analysis_text, re.IGNORECASE)
-            if criteria_match:
-                criteria_string = criteria_match.group(1).strip()
-                # Преобразуем строку символов в массив для сохранения в subcriteria
-                subcriteria["criteria_symbols"] = list(criteria_string.replace(" ", ""))
-            
-            # Извлекаем подкритерии для разных типов звонков
-            # Приветствие
-            greeting_criteria = re.search(r'приветствие[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if greeting_criteria:
-                subcriteria["greeting"] = greeting_criteria.group(1)
-            
-            # Имя пациента
-            name_criteria = re.search(r'имя пациента[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if name_criteria:
-                subcriteria["patient_name"] = name_criteria.group(1)
-            
-            # Выявление потребностей
-            need_criteria = re.search(r'выявление потребностей[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if need_criteria:
-                subcriteria["need_identification"] = need_criteria.group(1)
-            
-            # Презентация клиники
-            clinic_criteria = re.search(r'презентация клиники[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if clinic_criteria:
-                subcriteria["clinic_presentation"] = clinic_criteria.group(1)
-            
-            # Презентация услуг
-            service_criteria = re.search(r'презентация услуг[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if service_criteria:
-                subcriteria["service_presentation"] = service_criteria.group(1)
-            
-            # Презентация врачей
-            doctor_criteria = re.search(r'презентация врачей[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if doctor_criteria:
-                subcriteria["doctor_presentation"] = doctor_criteria.group(1)
-            
-            # Запись на приём
-            appointment_criteria = re.search(r'запись[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if appointment_criteria:
-                subcriteria["appointment"] = appointment_criteria.group(1)
-            
-            # Цена
-            price_criteria = re.search(r'цена[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if price_criteria:
-                subcriteria["price"] = price_criteria.group(1)
-            
-            # Адрес
-            address_criteria = re.search(r'адрес[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if address_criteria:
-                subcriteria["address"] = address_criteria.group(1)
-            
-            # Паспорт
-            passport_criteria = re.search(r'паспорт[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if passport_criteria:
-                subcriteria["passport"] = passport_criteria.group(1)
-            
-            # Работа с возражениями
-            objection_criteria = re.search(r'работа с возражениями[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if objection_criteria:
-                subcriteria["objection_handling"] = objection_criteria.group(1)
-            
-            # Следующий шаг
-            next_step_criteria = re.search(r'следующий шаг[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if next_step_criteria:
-                subcriteria["next_step"] = next_step_criteria.group(1)
-            
-            # Качество речи
-            speech_criteria = re.search(r'речь[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if speech_criteria:
-                subcriteria["speech_quality"] = speech_criteria.group(1)
-            
-            # Проявление инициативы
-            initiative_criteria = re.search(r'инициатива[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if initiative_criteria:
-                subcriteria["initiative"] = initiative_criteria.group(1)
-            
-            # Апелляция (для перезвона и подтверждения)
-            appeal_criteria = re.search(r'апелляция[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if appeal_criteria:
-                subcriteria["recall_appeal"] = appeal_criteria.group(1)
-            
-            # Уточнение вопроса (для вторички)
-            clarification_criteria = re.search(r'уточнение[^:]*:[^a-zа-я]*(✅|!|±)', analysis_text, re.IGNORECASE)
-            if clarification_criteria:
-                subcriteria["clarification"] = clarification_criteria.group(1)
-            
-            # Если есть подкритерии, добавляем их в метрики
-            if subcriteria:
-                metrics["subcriteria"] = subcriteria
-            
-            # Проверяем, что извлечены все необходимые метрики
-            required_keys = [
-                "greeting", "needs_identification", "solution_proposal", 
-                "objection_handling", "call_closing", "tone", 
-                "customer_satisfaction", "overall_score"
-            ]
-            
-            # Если не хватает какой-то метрики, заполняем значениями по умолчанию
-            for key in required_keys:
-                if key not in metrics:
-                    if key in ["tone"]:
-                        metrics[key] = "neutral"
-                    elif key in ["customer_satisfaction"]:
-                        metrics[key] = "medium"
-                    else:
-                        metrics[key] = 0.0
-            
-            return metrics
-        except Exception as e:
-            logger.error(f"Ошибка при извлечении метрик из анализа: {e}")
-            return None
-        
     # async def save_call_metrics(self, metrics_data: Dict[str, Any]) -> str:
     #     """
     #     Сохраняет метрики звонка в базу данных
@@ -335,27 +114,17 @@ class CallMetricsService:
                 "contact_id": request.contact_id,
                 "lead_id": request.lead_id,
                 "metrics": metrics,
-                "call_classification": analysis_result["classification"],
+                "call_classification": analysis_result["classification_code"],
                 "comments": "",
-                "recommendations": extract_recommendations(analysis_result["analysis"]),
+                "recommendations": analysis_result.get("recommendations"),
+                "prompt_version": analysis_result.get("prompt_version"),
                 "created_at": now.isoformat()
             }
             
-            # Дополнительные поля из расширенных метрик
-            if "call_type" in metrics:
-                metrics_data["call_type"] = metrics["call_type"]
-                
-            if "call_category" in metrics:
-                metrics_data["call_category"] = metrics["call_category"]
-                
-            if "traffic_source" in metrics:
-                metrics_data["traffic_source"] = metrics["traffic_source"]
-                
-            if "client_request" in metrics:
-                metrics_data["client_request"] = metrics["client_request"]
-                
-            if "conversion" in metrics:
-                metrics_data["conversion"] = metrics["conversion"]
+            # Дополнительные поля структурированного анализа
+            for key in ("call_type", "call_category", "traffic_source", "client_request", "conversion"):
+                if analysis_result.get(key) is not None:
+                    metrics_data[key] = analysis_result[key]
             
             # Формируем ссылки на CRM и транскрибацию
             # Ссылка на CRM (предполагаем, что может быть в meta_info)
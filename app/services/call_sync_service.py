@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+from .job_queue_service import job_queue_service
+from .amocrm_client_registry import amocrm_clients
+from .amocrm_pager import iter_pages
+from .bulk_transcription_service import bulk_transcription_service, BULK_MAX_NOTES, CALL_NOTE_ENTITIES, CALL_NOTE_TYPES, NOTE_IDS_PER_REQUEST
+from .call_ingest_service import find_call_link
+from .webhook_service import amocrm_webhook_service
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Синхронизация новых звонков всех клиник (выключена по умолчанию: каждый звонок - платная транскрибация)
+CALL_SYNC_ENABLED = os.getenv("CALL_SYNC_ENABLED", "0") == "1"
+# Как часто проверять новые звонки (сек.)
+CALL_SYNC_INTERVAL = int(os.getenv("CALL_SYNC_INTERVAL", "180"))
+# За какой период забирать звонки при первой синхронизации клиники (сек.)
+CALL_SYNC_LOOKBACK = int(os.getenv("CALL_SYNC_LOOKBACK", "3600"))
+# Ставить ли анализ новых звонков в очередь после транскрибации
+CALL_SYNC_ANALYZE = os.getenv("CALL_SYNC_ANALYZE", "0") == "1"
+
+
+class CallSyncService:
+    """
+    Инкрементальная синхронизация звонков из AmoCRM.
+    Для каждой клиники хранится курсор (коллекция call_sync_state) -
+    наибольший updated_at уже обработанных заметок call_in/call_out и ID заметок
+    с этим временем. Синхронизация запрашивает только заметки, измененные
+    с момента курсора, отбрасывает уже транскрибированные и принятые из вебхука
+    и ставит остальные в пакет транскрибации (bulk_transcribe), после чего
+    сдвигает курсор. Звонки, которые не удалось скачать или транскрибировать
+    (отметка failed в ingested_call_notes), запрашиваются по ID и ставятся
+    в очередь повторно, независимо от курсора.
+
+    Задачи sync_calls ставит в очередь планировщик воркера раз в
+    CALL_SYNC_INTERVAL секунд; dedup_key не дает запустить две синхронизации
+    одной клиники одновременно.
+    """
+
+    def __init__(self):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.state = self.db.call_sync_state
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.state.create_index([("client_id", ASCENDING)], unique=True)
+        self._indexes_ready = True
+
+    async def get_state(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """Курсор и результат последней синхронизации клиники"""
+        await self.ensure_indexes()
+        return await self.state.find_one({"client_id": client_id}, {"_id": 0})
+
+    async def enqueue(self, client_id: str) -> str:
+        """Ставит синхронизацию клиники в очередь (если она еще не в очереди)"""
+        return await job_queue_service.enqueue(
+            "sync_calls",
+            {"client_id": client_id},
+            max_attempts=1,
+            dedup_key=f"sync_calls:{client_id}"
+        )
+
+    async def enqueue_all(self) -> List[str]:
+        """Ставит в очередь синхронизацию всех клиник, подключенных к AmoCRM"""
+        job_ids = []
+        async for clinic in self.db.clinics.find({"client_id": {"$nin": [None, ""]}}, {"client_id": 1}):
+            job_ids.append(await self.enqueue(clinic["client_id"]))
+        return job_ids
+
+    async def _fetch_notes(self, client, filters: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """Заметки о звонках контактов и сделок по фильтру"""
+        params = {f"filter[note_type][{i}]": note_type for i, note_type in enumerate(CALL_NOTE_TYPES)}
+        params.update(filters)
+
+        notes = {}
+        for entity_type in CALL_NOTE_ENTITIES:
+            async for page in iter_pages(client, f"{entity_type}/notes", params, "notes"):
+                for note in page:
+                    note["entity_type"] = entity_type
+                    notes.setdefault(note["id"], note)
+        return notes
+
+    async def _fetch_new_notes(self, client, cursor: int) -> Dict[int, Dict[str, Any]]:
+        """Заметки о звонках, измененные начиная с cursor (включительно)"""
+        return await self._fetch_notes(client, {"filter[updated_at][from]": cursor})
+
+    async def _fetch_retry_notes(self, client, note_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Заметки о звонках по ID (для повторной обработки)"""
+        notes = {}
+        for start in range(0, len(note_ids), NOTE_IDS_PER_REQUEST):
+            chunk = note_ids[start:start + NOTE_IDS_PER_REQUEST]
+            notes.update(await self._fetch_notes(client, {f"filter[id][{i}]": note_id for i, note_id in enumerate(chunk)}))
+        return notes
+
+    async def sync(self, client_id: str) -> Dict[str, Any]:
+        """Находит новые звонки клиники и ставит их транскрибацию в очередь"""
+        state = await self.get_state(client_id) or {}
+        cursor = state.get("cursor") or int(time.time()) - CALL_SYNC_LOOKBACK
+        seen_at_cursor = set(state.get("cursor_note_ids", []))
+
+        client = await amocrm_clients.get(client_id)
+        notes = await self._fetch_new_notes(client, cursor)
+        retry_ids = set(await amocrm_webhook_service.retry_note_ids(client_id))
+        missing_retry_ids = sorted(retry_ids - set(notes))
+        retry_notes = await self._fetch_retry_notes(client, missing_retry_ids) if missing_retry_ids else {}
+        notes_by_id = {**retry_notes, **notes}
+
+        # Заметки без ссылки (пропущенные звонки) скачать нельзя
+        candidates = [
+            note_id for note_id, note in notes_by_id.items()
+            if (note_id not in seen_at_cursor or note_id in retry_ids) and find_call_link(client, note)
+        ]
+        transcribed = await bulk_transcription_service.transcribed_note_ids(client_id, candidates) if candidates else set()
+        # Звонки, уже принятые из вебхука или прошлой синхронизацией, не ставятся повторно
+        new_note_ids = sorted([
+            note_id for note_id in candidates
+            if note_id not in transcribed and await amocrm_webhook_service.claim_note(client_id, note_id, "sync", notes_by_id[note_id].get("entity_type"))
+        ])
+
+        batch_ids = []
+        for start in range(0, len(new_note_ids), BULK_MAX_NOTES):
+            chunk = new_note_ids[start:start + BULK_MAX_NOTES]
+            try:
+                batch_ids.append(await bulk_transcription_service.create_batch(client_id=client_id, note_ids=chunk, analyze=CALL_SYNC_ANALYZE))
+            except Exception:
+                # Курсор не сдвинут, новые звонки будут найдены при следующей синхронизации,
+                # повторные остаются в списке на повтор
+                unqueued = new_note_ids[start:]
+                await amocrm_webhook_service.release_notes(client_id, [note_id for note_id in unqueued if note_id not in retry_ids])
+                await amocrm_webhook_service.mark_failed(client_id, [note_id for note_id in unqueued if note_id in retry_ids], "Не удалось создать пакет")
+                raise
+
+        # Курсор сдвигается только после постановки пакетов в очередь
+        new_cursor = max([cursor] + [note.get("updated_at") or 0 for note in notes.values()])
+        cursor_note_ids = [note_id for note_id, note in notes.items() if note.get("updated_at") == new_cursor]
+        if new_cursor == cursor:
+            cursor_note_ids = sorted(seen_at_cursor.union(cursor_note_ids))
+
+        result = {
+            "found": len(notes),
+            "retried": len(retry_ids),
+            "queued": len(new_note_ids),
+            "skipped": len(candidates) - len(new_note_ids),
+            "batch_ids": batch_ids
+        }
+        await self.state.update_one(
+            {"client_id": client_id},
+            {"$set": {
+                "cursor": new_cursor,
+                "cursor_note_ids": cursor_note_ids,
+                "last_synced_at": datetime.now().isoformat(),
+                "last_result": result
+            }},
+            upsert=True
+        )
+        logger.info(f"Синхронизация звонков клиники {client_id}: найдено {len(notes)}, в очередь {len(new_note_ids)}")
+        return result
+
+    async def run_scheduler(self, stopping: asyncio.Event, interval: int = CALL_SYNC_INTERVAL):
+        """Периодически ставит синхронизацию всех клиник в очередь (запускается воркером)"""
+        logger.info(f"Планировщик синхронизации звонков запущен (интервал {interval} сек.)")
+        while not stopping.is_set():
+            try:
+                await self.enqueue_all()
+            except Exception as e:
+                logger.error(f"Ошибка планировщика синхронизации звонков: {e}")
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Создаем экземпляр для использования в API и воркерах
+call_sync_service = CallSyncService()
@@ -0,0 +1,229 @@
+import os
+import shutil
+import asyncio
+import logging
+import tempfile
+from collections import Counter
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+from .transcription_pool import transcription_pool
+from ..utils.audio_tools import is_ffmpeg_available, probe_duration, detect_silences, extract_segment
+
+logger = logging.getLogger(__name__)
+
+# Разбивать на фрагменты только записи длиннее этого порога (сек.)
+CHUNK_MIN_DURATION = float(os.getenv("TRANSCRIPTION_CHUNK_MIN_DURATION", "600"))
+# Желаемая длительность фрагмента (сек.)
+CHUNK_TARGET_SECONDS = float(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "300"))
+# В каком окне вокруг желаемой границы искать паузу (сек.)
+CHUNK_SEARCH_WINDOW = 30.0
+# Перекрытие соседних фрагментов для сопоставления говорящих (сек.)
+CHUNK_OVERLAP = 8.0
+
+
+def plan_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    target: float = CHUNK_TARGET_SECONDS,
+    window: float = CHUNK_SEARCH_WINDOW
+) -> List[Tuple[float, float]]:
+    """
+    Делит запись на фрагменты примерно по target секунд.
+    Граница ставится в середину ближайшей паузы в пределах window от желаемой
+    точки; если пауз нет - режем ровно по target. Короткий хвост
+    (меньше трети target) присоединяется к последнему фрагменту.
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    boundaries = [0.0]
+
+    while duration - boundaries[-1] > target:
+        desired = boundaries[-1] + target
+        candidates = [
+            m for m in midpoints
+            if abs(m - desired) <= window and m > boundaries[-1] + target / 2
+        ]
+        cut = min(candidates, key=lambda m: abs(m - desired)) if candidates else desired
+        if duration - cut < target / 3:
+            break
+        boundaries.append(cut)
+
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def shift_words(words: List[Dict[str, Any]], offset: float) -> List[Dict[str, Any]]:
+    """Сдвигает временные метки слов фрагмента на его смещение в исходной записи"""
+    shifted = []
+    for word in words:
+        item = dict(word)
+        if item.get("start") is not None:
+            item["start"] = item["start"] + offset
+        if item.get("end") is not None:
+            item["end"] = item["end"] + offset
+        shifted.append(item)
+    return shifted
+
+
+def _normalize(text: str) -> str:
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def _speakers_of(words: List[Dict[str, Any]]) -> List[str]:
+    """Идентификаторы говорящих в порядке первого появления"""
+    speakers = []
+    for word in words:
+        speaker = word.get("speaker_id")
+        if speaker is not None and speaker not in speakers:
+            speakers.append(speaker)
+    return speakers
+
+
+def match_speakers(
+    previous: List[Dict[str, Any]],
+    current: List[Dict[str, Any]],
+    known_speakers: List[str],
+    local_speakers: Optional[List[str]] = None,
+    tolerance: float = 0.5
+) -> Dict[str, str]:
+    """
+    Сопоставляет идентификаторы говорящих нового фрагмента с уже известными.
+
+    В зоне перекрытия одни и те же слова распознаны в обоих фрагментах:
+    пары слов с одинаковым текстом и близким временем голосуют за соответствие
+    speaker_id. Соответствия назначаются жадно по числу голосов; оставшимся
+    говорящим отдаются свободные известные идентификаторы, а если таких нет -
+    новые.
+    """
+    votes = Counter()
+    previous_words = [w for w in previous if w.get("type", "word") == "word"]
+    for word in current:
+        if word.get("type", "word") != "word":
+            continue
+        text = _normalize(word.get("text", ""))
+        if not text:
+            continue
+        for candidate in previous_words:
+            if abs(candidate.get("start", 0) - word.get("start", 0)) <= tolerance \
+                    and _normalize(candidate.get("text", "")) == text:
+                votes[(word.get("speaker_id"), candidate.get("speaker_id"))] += 1
+                break
+
+    mapping: Dict[str, str] = {}
+    used = set()
+    for (local, known), _ in votes.most_common():
+        if local in mapping or known in used:
+            continue
+        mapping[local] = known
+        used.add(known)
+
+    if local_speakers is None:
+        local_speakers = _speakers_of(current)
+
+    free = [s for s in known_speakers if s not in used]
+    for speaker in local_speakers:
+        if speaker in mapping:
+            continue
+        if free:
+            mapping[speaker] = free.pop(0)
+        else:
+            mapping[speaker] = f"speaker_{len(known_speakers) + len(mapping)}"
+        used.add(mapping[speaker])
+
+    return mapping
+
+
+def merge_chunk_responses(
+    chunks: List[Tuple[float, float, float]],
+    responses: List[Dict[str, Any]],
+    duration: float
+) -> Dict[str, Any]:
+    """
+    Склеивает ответы STT по фрагментам в один ответ того же формата.
+
+    :param chunks: список (начало_извлечения, начало_фрагмента, конец_фрагмента);
+                   начало извлечения раньше начала фрагмента на величину перекрытия
+    :param responses: ответы API по фрагментам в том же порядке
+    :param duration: длительность исходной записи
+    """
+    merged: List[Dict[str, Any]] = []
+    known_speakers: List[str] = []
+
+    for (extract_start, chunk_start, _), response in zip(chunks, responses):
+        words = shift_words(response.get("words", []), extract_start)
+
+        if merged:
+            overlap_previous = [w for w in merged if w.get("start", 0) >= extract_start]
+            overlap_current = [w for w in words if w.get("start", 0) < chunk_start]
+            mapping = match_speakers(overlap_previous, overlap_current, known_speakers, _speakers_of(words))
+            for word in words:
+                if word.get("speaker_id") in mapping:
+                    word["speaker_id"] = mapping[word["speaker_id"]]
+
+            # Слова зоны перекрытия берем из предыдущего фрагмента
+            while merged and merged[-1].get("start", 0) >= chunk_start:
+                merged.pop()
+            words = [w for w in words if w.get("start", 0) >= chunk_start]
+
+        for speaker in _speakers_of(words):
+            if speaker not in known_speakers:
+                known_speakers.append(speaker)
+        merged.extend(words)
+
+    first = responses[0] if responses else {}
+    return {
+        "language_code": first.get("language_code"),
+        "language_probability": first.get("language_probability"),
+        "text": "".join(w.get("text", "") for w in merged),
+        "words": merged,
+        "duration": duration,
+        "chunks": len(chunks)
+    }
+
+
+async def transcribe_chunked(
+    audio_path: str,
+    convert: Callable[..., Dict[str, Any]],
+    num_speakers: int = 2,
+    diarize: bool = True
+) -> Optional[Dict[str, Any]]:
+    """
+    Транскрибирует длинную запись параллельно по фрагментам.
+
+    Запись режется по паузам, фрагменты распознаются одновременно в пуле
+    транскрибации (с его ограничением на число потоков), затем временные
+    метки сдвигаются, а говорящие сопоставляются по зонам перекрытия.
+    Возвращает None, если разбиение не требуется или недоступно - тогда
+    вызывающий код распознает файл целиком.
+    """
+    if not is_ffmpeg_available():
+        logger.warning("ffmpeg не найден, параллельная транскрибация по фрагментам недоступна")
+        return None
+
+    duration = await probe_duration(audio_path)
+    if duration < CHUNK_MIN_DURATION:
+        return None
+
+    silences = await detect_silences(audio_path, duration=duration)
+    plan = plan_chunks(duration, silences)
+    if len(plan) < 2:
+        return None
+
+    chunks = [(max(start - CHUNK_OVERLAP, 0.0) if i else 0.0, start, end) for i, (start, end) in enumerate(plan)]
+    logger.info(f"Запись {os.path.basename(audio_path)} ({duration:.0f} сек.) разбита на {len(chunks)} фрагментов")
+
+    temp_dir = tempfile.mkdtemp(prefix="stt_chunks_")
+    try:
+        paths = []
+        for index, (extract_start, _, end) in enumerate(chunks):
+            chunk_path = os.path.join(temp_dir, f"chunk_{index:03d}.mp3")
+            await extract_segment(audio_path, chunk_path, extract_start, end)
+            paths.append(chunk_path)
+
+        responses = await asyncio.gather(*(
+            transcription_pool.run(convert, path, num_speakers=num_speakers, diarize=diarize)
+            for path in paths
+        ))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return merge_chunk_responses(chunks, list(responses), duration)
@@ -6,6 +6,8 @@ from typing import List, Dict, Any, Optional
 
 from ..models.clinic import ClinicResponse, AdministratorResponse
 from mlab_amo_async.amocrm_client import AsyncAmoCRMClient
+from .amocrm_client_registry import amocrm_clients
+from .amocrm_cache import amocrm_cache
 
 logger = logging.getLogger(__name__)
 
@@ -214,6 +216,8 @@ class ClinicService:
             # Инициализируем токен с кодом авторизации
             await amocrm_client.init_token(clinic_data["auth_code"])
             logger.info("Токен AmoCRM инициализирован успешно")
+            # Клиент из реестра, созданный со старыми токенами, больше не нужен
+            await amocrm_clients.invalidate(clinic_data["client_id"])
             
             # Получаем пользователей из AmoCRM
             users = await self.get_amocrm_users(amocrm_client)
@@ -276,22 +280,29 @@ class ClinicService:
             logger.error(f"Трассировка: {traceback.format_exc()}")
             raise
             
-    async def get_amocrm_users(self, amocrm_client):
+    async def get_amocrm_users(self, amocrm_client, client_id: Optional[str] = None):
         """
-        Получает пользователей из AmoCRM
+        Получает пользователей из AmoCRM.
+        Если указан client_id, список берется из кэша AmoCRM, пока не истек его срок.
         """
         try:
-            logger.info("Запрашиваем пользователей из AmoCRM")
-            response, status_code = await amocrm_client.contacts.request(
-                "get", 
-                "users"
-            )
-            
-            logger.info(f"Получен ответ от AmoCRM: статус {status_code}")
-            
-            if status_code != 200:
-                logger.error(f"Ошибка при получении пользователей AmoCRM: статус {status_code}")
-                return []
+            if client_id:
+                response = await amocrm_cache.get_users(amocrm_client, client_id)
+                if not response:
+                    logger.error("Ошибка при получении пользователей AmoCRM")
+                    return []
+            else:
+                logger.info("Запрашиваем пользователей из AmoCRM")
+                response, status_code = await amocrm_client.contacts.request(
+                    "get", 
+                    "users"
+                )
+                
+                logger.info(f"Получен ответ от AmoCRM: статус {status_code}")
+                
+                if status_code != 200:
+                    logger.error(f"Ошибка при получении пользователей AmoCRM: статус {status_code}")
+                    return []
                 
             if "_embedded" not in response:
                 logger.error(f"В ответе AmoCRM отсутствует ключ '_embedded': {response}")
@@ -545,18 +556,11 @@ class ClinicService:
             if not clinic:
                 raise ValueError(f"Клиника с ID {clinic_id} не найдена")
                 
-            # Создаем клиент AmoCRM
-            amocrm_client = AsyncAmoCRMClient(
-                client_id=clinic["client_id"],
-                client_secret=clinic["client_secret"],
-                subdomain=clinic["amocrm_subdomain"],
-                redirect_url=clinic["redirect_url"],
-                mongo_uri=MONGO_URI,
-                db_name=DB_NAME
-            )
+            # Общий клиент AmoCRM клиники
+            amocrm_client = await amocrm_clients.get(clinic["client_id"])
             
             # Получаем пользователей из AmoCRM
-            users = await self.get_amocrm_users(amocrm_client)
+            users = await self.get_amocrm_users(amocrm_client, clinic["client_id"])
             
             # Получаем существующих администраторов
             existing_admins = {}
@@ -0,0 +1,114 @@
+import os
+import ssl
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит соединений и лимит на один хост телефонии
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "32"))
+DOWNLOAD_MAX_CONNECTIONS_PER_HOST = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS_PER_HOST", "8"))
+# Сколько секунд держать открытыми неиспользуемые соединения и кэшировать DNS
+DOWNLOAD_KEEPALIVE_TIMEOUT = 60
+DOWNLOAD_DNS_CACHE_TTL = 300
+# Таймауты скачивания записи (сек.)
+DOWNLOAD_CONNECT_TIMEOUT = 15
+DOWNLOAD_READ_TIMEOUT = 120
+# Через сколько секунд cookie-сессию провайдера нужно получить заново
+COOKIE_SESSION_TTL = int(os.getenv("DOWNLOAD_COOKIE_SESSION_TTL", "1800"))
+
+# Страница, с которой Mango Office выдает cookies для скачивания записей
+MANGO_OFFICE_URL = "https://amocrm.mango-office.ru/"
+
+# Заголовки для имитации браузера
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,video/*;q=0.6,*/*;q=0.5",
+    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+    "Referer": "https://amocrm.mango-office.ru/",
+    "Origin": "https://amocrm.mango-office.ru"
+}
+
+
+class DownloadClient:
+    """
+    Общий HTTP-клиент для скачивания записей звонков.
+    Одна сессия aiohttp на всё время работы процесса: соединения с хостами
+    телефонии переиспользуются (keep-alive), DNS кэшируется, а cookies
+    провайдера запрашиваются один раз и обновляются только по истечении
+    COOKIE_SESSION_TTL или после отказа в доступе.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._cookie_expires: Dict[str, float] = {}
+
+    @staticmethod
+    def _ssl_context() -> ssl.SSLContext:
+        # Сертификаты хостов телефонии не проверяются
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, создавая её в текущем event loop при первом обращении"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Сессия привязана к event loop, в котором создана
+            self._session = None
+            self._lock = asyncio.Lock()
+            self._loop = loop
+
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    ssl=self._ssl_context(),
+                    limit=DOWNLOAD_MAX_CONNECTIONS,
+                    limit_per_host=DOWNLOAD_MAX_CONNECTIONS_PER_HOST,
+                    ttl_dns_cache=DOWNLOAD_DNS_CACHE_TTL,
+                    keepalive_timeout=DOWNLOAD_KEEPALIVE_TIMEOUT
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    headers=BROWSER_HEADERS,
+                    cookie_jar=aiohttp.CookieJar(),
+                    timeout=aiohttp.ClientTimeout(sock_connect=DOWNLOAD_CONNECT_TIMEOUT, sock_read=DOWNLOAD_READ_TIMEOUT)
+                )
+                self._cookie_expires.clear()
+                logger.info("Создана общая сессия для скачивания записей звонков")
+        return self._session
+
+    async def ensure_cookies(self, provider_url: str = MANGO_OFFICE_URL):
+        """Получает cookies провайдера, если их еще нет или срок их действия истек"""
+        if self._cookie_expires.get(provider_url, 0) > time.monotonic():
+            return
+
+        session = await self.get_session()
+        async with session.get(provider_url) as init_response:
+            logger.info(f"Инициализация cookie-сессии {provider_url}: HTTP {init_response.status}")
+        self._cookie_expires[provider_url] = time.monotonic() + COOKIE_SESSION_TTL
+
+    def invalidate_cookies(self, provider_url: str = MANGO_OFFICE_URL):
+        """Помечает cookies провайдера устаревшими (например, после HTML-ответа вместо записи)"""
+        self._cookie_expires.pop(provider_url, None)
+
+    async def close(self):
+        """Закрывает сессию и все соединения при завершении процесса"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._cookie_expires.clear()
+
+
+# Создаем экземпляр для использования в приложении
+download_client = DownloadClient()
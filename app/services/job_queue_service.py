@@ -0,0 +1,253 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from datetime import datetime, timedelta
+import logging
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Статусы задач
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Статусы, в которых задача с dedup_key не может быть поставлена повторно
+ACTIVE_STATUSES = [JOB_QUEUED, JOB_RUNNING]
+
+# Параметры повторных попыток
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30  # секунд, удваивается с каждой попыткой
+RETRY_MAX_DELAY = 30 * 60
+DEFAULT_LEASE_SECONDS = 300
+
+
+class JobQueueService:
+    """
+    Очередь задач в MongoDB (коллекция jobs).
+    Воркер захватывает задачу на время аренды (lease); если воркер упал,
+    аренда истекает и задачу забирает другой воркер.
+    """
+
+    def __init__(self):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.jobs = self.db.jobs
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        """Создает индексы для выборки задач воркерами"""
+        if self._indexes_ready:
+            return
+        await self.jobs.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+        await self.jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+        await self._ensure_dedup_index()
+        self._indexes_ready = True
+
+    async def _ensure_dedup_index(self):
+        """
+        Уникальный индекс dedup_key среди незавершенных задач: одновременные
+        enqueue с одним ключом (вебхук, синхронизация, планировщик) не создают дублей.
+        """
+        # Прежний неуникальный индекс по тому же полю
+        try:
+            await self.jobs.drop_index("dedup_key_1")
+        except OperationFailure:
+            pass
+        try:
+            await self.jobs.create_index(
+                "dedup_key",
+                name="dedup_key_active",
+                unique=True,
+                partialFilterExpression={"dedup_key": {"$exists": True}, "status": {"$in": ACTIVE_STATUSES}}
+            )
+        except OperationFailure as e:
+            # $in в partialFilterExpression поддерживается с MongoDB 6.0
+            logger.warning(f"Не удалось создать уникальный индекс dedup_key, дубли возможны: {e}")
+            await self.jobs.create_index("dedup_key", name="dedup_key_active", sparse=True)
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        dedup_key: Optional[str] = None,
+        delay_seconds: int = 0
+    ) -> str:
+        """
+        Добавляет задачу в очередь и возвращает её ID.
+        Если указан dedup_key и такая задача еще не завершена, возвращает ID существующей.
+        """
+        await self.ensure_indexes()
+
+        if dedup_key:
+            existing = await self._find_active(dedup_key)
+            if existing:
+                logger.info(f"Задача {dedup_key} уже в очереди: {existing['_id']}")
+                return str(existing["_id"])
+
+        now = datetime.utcnow()
+        job = {
+            "type": job_type,
+            "payload": payload,
+            "status": JOB_QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now + timedelta(seconds=delay_seconds),
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": None,
+            "result": None,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+        if dedup_key:
+            job["dedup_key"] = dedup_key
+
+        try:
+            result = await self.jobs.insert_one(job)
+        except DuplicateKeyError:
+            # Такую же задачу только что поставил другой процесс
+            existing = await self._find_active(dedup_key)
+            if not existing:
+                raise
+            logger.info(f"Задача {dedup_key} уже в очереди: {existing['_id']}")
+            return str(existing["_id"])
+        logger.info(f"Задача {job_type} поставлена в очередь: {result.inserted_id}")
+        return str(result.inserted_id)
+
+    async def _find_active(self, dedup_key: str) -> Optional[Dict[str, Any]]:
+        return await self.jobs.find_one({"dedup_key": dedup_key, "status": {"$in": ACTIVE_STATUSES}}, {"_id": 1})
+
+    async def claim(
+        self,
+        worker_id: str,
+        job_types: Optional[List[str]] = None,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Атомарно захватывает следующую готовую задачу.
+        Берутся задачи в очереди, а также задачи с истекшей арендой.
+        """
+        now = datetime.utcnow()
+        query = {
+            "$or": [
+                {"status": JOB_QUEUED, "run_at": {"$lte": now}},
+                {"status": JOB_RUNNING, "lease_expires_at": {"$lte": now}}
+            ]
+        }
+        if job_types:
+            query["type"] = {"$in": job_types}
+
+        return await self.jobs.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "started_at": now.isoformat(),
+                    "updated_at": now.isoformat()
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def extend_lease(self, job_id, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        """Продлевает аренду задачи, пока воркер её выполняет"""
+        now = datetime.utcnow()
+        result = await self.jobs.update_one(
+            {"_id": ObjectId(job_id), "lease_owner": worker_id, "status": JOB_RUNNING},
+            {"$set": {
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now.isoformat()
+            }}
+        )
+        return result.modified_count == 1
+
+    async def complete(self, job_id, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        """Отмечает задачу выполненной"""
+        now = datetime.utcnow().isoformat()
+        update = await self.jobs.update_one(
+            {"_id": ObjectId(job_id), "lease_owner": worker_id},
+            {"$set": {
+                "status": JOB_COMPLETED,
+                "result": result,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "finished_at": now,
+                "updated_at": now
+            }}
+        )
+        return update.modified_count == 1
+
+    async def fail(self, job_id, worker_id: str, error: str) -> Optional[str]:
+        """
+        Обрабатывает ошибку задачи: возвращает её в очередь с экспоненциальной
+        задержкой или помечает как окончательно неудачную.
+        Возвращает новый статус задачи или None, если аренда уже потеряна
+        (задачу забрал другой воркер) и статус не изменен.
+        """
+        job = await self.jobs.find_one({"_id": ObjectId(job_id), "lease_owner": worker_id})
+        if not job:
+            logger.warning(f"Задача {job_id} больше не принадлежит воркеру {worker_id}, ошибка не записана")
+            return None
+
+        now = datetime.utcnow()
+        attempts = job.get("attempts", 0)
+
+        if attempts >= job.get("max_attempts", DEFAULT_MAX_ATTEMPTS):
+            new_status = JOB_FAILED
+            update = {
+                "status": JOB_FAILED,
+                "finished_at": now.isoformat()
+            }
+        else:
+            new_status = JOB_QUEUED
+            delay = min(RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), RETRY_MAX_DELAY)
+            update = {
+                "status": JOB_QUEUED,
+                "run_at": now + timedelta(seconds=delay)
+            }
+            logger.info(f"Задача {job_id} будет повторена через {delay} сек. (попытка {attempts})")
+
+        update.update({
+            "last_error": error,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "updated_at": now.isoformat()
+        })
+        result = await self.jobs.update_one(
+            {"_id": ObjectId(job_id), "lease_owner": worker_id},
+            {"$set": update}
+        )
+        if result.matched_count == 0:
+            logger.warning(f"Задача {job_id} больше не принадлежит воркеру {worker_id}, ошибка не записана")
+            return None
+        return new_status
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Возвращает задачу в виде, пригодном для ответа API"""
+        if not ObjectId.is_valid(job_id):
+            return None
+
+        job = await self.jobs.find_one({"_id": ObjectId(job_id)})
+        if not job:
+            return None
+
+        job["id"] = str(job.pop("_id"))
+        for field in ("run_at", "lease_expires_at"):
+            if isinstance(job.get(field), datetime):
+                job[field] = job[field].isoformat()
+        return job
+
+
+# Создаем экземпляр для использования в API и воркерах
+job_queue_service = JobQueueService()
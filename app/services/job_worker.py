@@ -0,0 +1,225 @@
+import os
+import asyncio
+import logging
+import socket
+import traceback
+import uuid
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from .job_queue_service import job_queue_service, JobQueueService, DEFAULT_LEASE_SECONDS, JOB_FAILED
+from .transcription_pool import TRANSCRIPTION_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Параметры воркера
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", str(TRANSCRIPTION_MAX_WORKERS)))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+
+async def handle_transcribe(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Транскрибирует аудиофайл; при флаге analyze ставит в очередь анализ"""
+    from .transcription_service import transcribe_and_save
+
+    params = dict(payload)
+    analyze = params.pop("analyze", False)
+
+    success = await transcribe_and_save(**params)
+    if not success:
+        raise RuntimeError(f"Транскрибация файла {params.get('audio_path')} не удалась")
+
+    transcription_filename = os.path.basename(params["output_path"])
+    result = {"transcription_filename": transcription_filename}
+
+    if analyze:
+        note_data = params.get("note_data") or {}
+        result["analysis_job_id"] = await job_queue_service.enqueue(
+            "analyze",
+            {
+                "transcription_filename": transcription_filename,
+                "meta_info": {k: v for k, v in note_data.items() if v is not None}
+            }
+        )
+
+    return result
+
+
+async def handle_analyze(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Выполняет анализ транскрипции с помощью LLM и сохраняет результат"""
+    from .call_analysis_service import call_analysis_service
+    from ..settings.storage import transcription_storage
+
+    transcription_filename = payload["transcription_filename"]
+    file_path = transcription_storage.locate(transcription_filename, clinic_id=(payload.get("meta_info") or {}).get("client_id"))
+    if not file_path:
+        raise FileNotFoundError(f"Файл транскрипции {transcription_filename} не найден")
+
+    dialogue_text = call_analysis_service.load_transcription(file_path)
+    analysis_result = await call_analysis_service.afull_call_analysis(dialogue_text, payload.get("meta_info"))
+
+    base_name = os.path.splitext(transcription_filename)[0]
+    output_filename = f"{base_name}_analysis.txt"
+    call_analysis_service.save_analysis(analysis_result, output_filename)
+
+    return {
+        "classification": analysis_result["classification"],
+        "classification_code": analysis_result["classification_code"],
+        "metrics": analysis_result["metrics"],
+        "prompt_version": analysis_result["prompt_version"],
+        "output_filename": output_filename
+    }
+
+
+async def handle_bulk_transcribe(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Разрешает заметки пакета, скачивает звонки и ставит их транскрибацию в очередь"""
+    from .bulk_transcription_service import bulk_transcription_service
+
+    return await bulk_transcription_service.run(payload["batch_id"])
+
+
+async def handle_sync_calls(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Находит новые звонки клиники с момента курсора и ставит их в очередь"""
+    from .call_sync_service import call_sync_service
+
+    return await call_sync_service.sync(payload["client_id"])
+
+
+async def handle_transcribe_failed(payload: Dict[str, Any], error: str):
+    """Возвращает звонок из AmoCRM к повторному приему вебхуком или синхронизацией"""
+    from .webhook_service import amocrm_webhook_service
+
+    note_data = payload.get("note_data") or {}
+    if note_data.get("client_id") and note_data.get("note_id"):
+        await amocrm_webhook_service.mark_failed(note_data["client_id"], [note_data["note_id"]], error)
+
+
+async def handle_bulk_transcribe_failed(payload: Dict[str, Any], error: str):
+    """Передает звонки пакета, не поставленные в очередь, на повторный прием"""
+    from .bulk_transcription_service import bulk_transcription_service
+
+    await bulk_transcription_service.fail_batch(payload["batch_id"], error)
+
+
+# Обработчики задач по типу
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]] = {
+    "transcribe": handle_transcribe,
+    "analyze": handle_analyze,
+    "bulk_transcribe": handle_bulk_transcribe,
+    "sync_calls": handle_sync_calls,
+}
+
+# Обработчики окончательной неудачи задачи (попытки исчерпаны)
+JOB_FAILURE_HANDLERS: Dict[str, Callable[[Dict[str, Any], str], Awaitable[None]]] = {
+    "transcribe": handle_transcribe_failed,
+    "bulk_transcribe": handle_bulk_transcribe_failed,
+}
+
+
+class JobWorker:
+    """
+    Воркер, выбирающий задачи из коллекции jobs и выполняющий их
+    с ограничением на количество одновременных задач.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueueService = job_queue_service,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS
+    ):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Останавливает выборку новых задач; текущие задачи дорабатывают"""
+        logger.info(f"Воркер {self.worker_id} получил сигнал остановки")
+        self._stopping.set()
+
+    async def run(self):
+        """Основной цикл воркера"""
+        await self.queue.ensure_indexes()
+        logger.info(f"Воркер {self.worker_id} запущен (параллельно задач: {self.concurrency})")
+
+        while not self._stopping.is_set():
+            if len(self._tasks) >= self.concurrency:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                job = await self.queue.claim(
+                    self.worker_id,
+                    job_types=list(JOB_HANDLERS.keys()),
+                    lease_seconds=self.lease_seconds
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при получении задачи из очереди: {e}")
+                job = None
+
+            if not job:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._process(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if self._tasks:
+            logger.info(f"Ожидание завершения {len(self._tasks)} задач")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info(f"Воркер {self.worker_id} остановлен")
+
+    async def _heartbeat(self, job_id):
+        """Периодически продлевает аренду выполняемой задачи"""
+        interval = max(self.lease_seconds / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.extend_lease(job_id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Не удалось продлить аренду задачи {job_id}: {e}")
+
+    async def _process(self, job: Dict[str, Any]):
+        """Выполняет одну задачу и фиксирует результат"""
+        job_id = job["_id"]
+        job_type = job["type"]
+
+        # Задача с истекшей арендой, у которой исчерпаны попытки
+        if job.get("attempts", 0) > job.get("max_attempts", 1):
+            new_status = await self.queue.fail(job_id, self.worker_id, "Превышено количество попыток (аренда истекла)")
+            await self._on_failed(job, new_status, "Превышено количество попыток (аренда истекла)")
+            return
+
+        logger.info(f"Выполнение задачи {job_id} ({job_type}), попытка {job.get('attempts')}")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            handler = JOB_HANDLERS[job_type]
+            result = await handler(job.get("payload") or {})
+            await self.queue.complete(job_id, self.worker_id, result)
+            logger.info(f"Задача {job_id} ({job_type}) выполнена")
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении задачи {job_id} ({job_type}): {e}")
+            logger.error(f"Стек-трейс: {traceback.format_exc()}")
+            new_status = await self.queue.fail(job_id, self.worker_id, str(e))
+            if new_status:
+                logger.info(f"Задача {job_id} переведена в статус {new_status}")
+            await self._on_failed(job, new_status, str(e))
+        finally:
+            heartbeat.cancel()
+
+    async def _on_failed(self, job: Dict[str, Any], new_status: Optional[str], error: str):
+        """Вызывает обработчик окончательной неудачи задачи"""
+        handler = JOB_FAILURE_HANDLERS.get(job["type"])
+        if not handler or new_status != JOB_FAILED:
+            return
+        try:
+            await handler(job.get("payload") or {}, error)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика неудачи задачи {job['_id']}: {e}")
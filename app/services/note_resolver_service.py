@@ -0,0 +1,205 @@
+import re
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, List, Awaitable, Callable
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+from .amocrm_cache import amocrm_cache
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Результат стратегии поиска: заметка, тип и ID сущности, к которой она привязана
+NoteLocation = Tuple[Dict[str, Any], Optional[str], Optional[int]]
+
+# Ссылка на заметку в ответе AmoCRM: .../api/v4/leads/123/notes/456
+_NOTE_HREF_RE = re.compile(r'/(leads|contacts|companies|customers)/(\d+)/notes/\d+')
+
+
+def entity_from_note(note: Dict[str, Any]) -> Tuple[Optional[str], Optional[int]]:
+    """Тип и ID сущности-владельца по ссылке _links.self заметки"""
+    href = ((note.get("_links") or {}).get("self") or {}).get("href") or ""
+    match = _NOTE_HREF_RE.search(href)
+    if match:
+        return match.group(1), int(match.group(2))
+    return None, note.get("entity_id")
+
+
+class NoteResolverService:
+    """
+    Поиск заметки AmoCRM по ID.
+    Способы поиска (прямой запрос, заметки контакта, заметки сделок контакта,
+    поиск по filter[id], notes/{id}) перебираются по порядку, от самого
+    дешевого, до первого нашедшего заметку. Одновременный запуск не дает
+    выигрыша: клиент mlab_amo_async выполняет запросы синхронно внутри
+    event loop, и все они завершились бы раньше отмены.
+
+    Найденная заметка и сущность-владелец сохраняются в коллекции
+    note_locations, поэтому повторный запрос той же заметки обходится
+    без обращений к AmoCRM, а при наличии только владельца - одним запросом.
+    Если запись по сохраненной заметке не скачивается, заметка удаляется
+    из кэша (forget) и при следующем запросе ищется заново.
+    """
+
+    def __init__(self):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.locations = self.db.note_locations
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        """Создает индекс кэша"""
+        if self._indexes_ready:
+            return
+        await self.locations.create_index([("client_id", ASCENDING), ("note_id", ASCENDING)], unique=True)
+        self._indexes_ready = True
+
+    async def get_cached(self, client_id: str, note_id: int) -> Optional[Dict[str, Any]]:
+        """Запись кэша для заметки или None"""
+        await self.ensure_indexes()
+        return await self.locations.find_one({"client_id": client_id, "note_id": note_id}, {"_id": 0})
+
+    async def remember(
+        self,
+        client_id: str,
+        note_id: int,
+        note: Optional[Dict[str, Any]] = None,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[int] = None
+    ):
+        """Сохраняет известные данные о заметке; ошибки кэша только логируются"""
+        fields = {
+            key: value for key, value in (
+                ("note", note), ("entity_type", entity_type), ("entity_id", entity_id)
+            ) if value is not None
+        }
+        if not fields:
+            return
+        fields["updated_at"] = datetime.now().isoformat()
+        try:
+            await self.ensure_indexes()
+            await self.locations.update_one(
+                {"client_id": client_id, "note_id": note_id},
+                {"$set": fields},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить заметку {note_id} в кэш: {e}")
+
+    async def forget(self, client_id: str, note_id: int):
+        """Удаляет заметку из кэша (например, если ссылка на запись устарела)"""
+        try:
+            await self.locations.delete_one({"client_id": client_id, "note_id": note_id})
+            logger.info(f"Заметка {note_id} удалена из кэша")
+        except Exception as e:
+            logger.warning(f"Не удалось удалить заметку {note_id} из кэша: {e}")
+
+    # Стратегии поиска. Каждая возвращает NoteLocation или None
+
+    @staticmethod
+    async def _by_id(client, note_id: int) -> Optional[NoteLocation]:
+        note = await client.get_note_by_id(note_id)
+        return (note, None, None) if note else None
+
+    @staticmethod
+    async def _in_contact(client, client_id: str, note_id: int, contact_id: int) -> Optional[NoteLocation]:
+        for note in await amocrm_cache.get_contact_notes(client, client_id, contact_id):
+            if note.get("id") == note_id:
+                logger.info(f"Найдена заметка {note_id} в контакте {contact_id}")
+                return note, "contacts", contact_id
+        return None
+
+    @staticmethod
+    async def _in_lead(client, client_id: str, note_id: int, lead_id: int) -> Optional[NoteLocation]:
+        for note in await amocrm_cache.get_lead_notes(client, client_id, lead_id):
+            if note.get("id") == note_id:
+                logger.info(f"Найдена заметка {note_id} в сделке {lead_id}")
+                return note, "leads", lead_id
+        return None
+
+    async def _in_contact_leads(self, client, client_id: str, note_id: int, contact_id: int) -> Optional[NoteLocation]:
+        leads = await amocrm_cache.get_contact_leads(client, client_id, contact_id)
+        logger.info(f"Найдено {len(leads)} связанных сделок для контакта {contact_id}")
+        return await self._first_found([
+            lambda lead_id=lead["id"]: self._in_lead(client, client_id, note_id, lead_id)
+            for lead in leads if lead.get("id")
+        ])
+
+    @staticmethod
+    async def _by_filter(client, note_id: int) -> Optional[NoteLocation]:
+        search_response, search_status = await client.contacts.request("get", "notes", params={"filter[id]": note_id})
+        if search_status == 200 and search_response:
+            notes = search_response.get("_embedded", {}).get("notes", [])
+            if notes:
+                logger.info(f"Найдена заметка {note_id} через общий поиск")
+                return notes[0], None, None
+        return None
+
+    @staticmethod
+    async def _direct(client, note_id: int) -> Optional[NoteLocation]:
+        note_response, status_code = await client.contacts.request("get", f"notes/{note_id}")
+        if status_code == 200 and note_response:
+            logger.info(f"Найдена заметка {note_id} через прямой запрос")
+            return note_response, None, None
+        return None
+
+    @staticmethod
+    async def _in_entity(client, note_id: int, entity_type: str, entity_id: int) -> Optional[NoteLocation]:
+        note_response, status_code = await client.contacts.request("get", f"{entity_type}/{entity_id}/notes/{note_id}")
+        if status_code == 200 and note_response:
+            return note_response, entity_type, entity_id
+        return None
+
+    @staticmethod
+    async def _first_found(lookups: List[Callable[[], Awaitable[Optional[NoteLocation]]]]) -> Optional[NoteLocation]:
+        """Выполняет поиски по очереди и возвращает первый успешный результат"""
+        for lookup in lookups:
+            try:
+                result = await lookup()
+            except Exception as e:
+                logger.warning(f"Ошибка при поиске заметки: {e}")
+                continue
+            if result:
+                return result
+        return None
+
+    async def resolve(self, client, client_id: str, note_id: int, contact_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Находит заметку по ID. Сначала проверяется кэш, затем известная
+        сущность-владелец, затем остальные способы поиска по очереди.
+        """
+        cached = await self.get_cached(client_id, note_id)
+        if cached and cached.get("note"):
+            logger.info(f"Заметка {note_id} взята из кэша")
+            return cached["note"]
+
+        found = None
+        if cached and cached.get("entity_type") and cached.get("entity_id"):
+            found = await self._first_found([lambda: self._in_entity(client, note_id, cached["entity_type"], cached["entity_id"])])
+
+        if not found:
+            lookups = [lambda: self._by_id(client, note_id)]
+            if contact_id:
+                lookups += [
+                    lambda: self._in_contact(client, client_id, note_id, contact_id),
+                    lambda: self._in_contact_leads(client, client_id, note_id, contact_id)
+                ]
+            lookups += [lambda: self._by_filter(client, note_id), lambda: self._direct(client, note_id)]
+            found = await self._first_found(lookups)
+
+        if not found:
+            return None
+
+        note, entity_type, entity_id = found
+        if not entity_type:
+            entity_type, entity_id = entity_from_note(note)
+        await self.remember(client_id, note_id, note=note, entity_type=entity_type, entity_id=entity_id)
+        return note
+
+
+# Создаем экземпляр для использования в API
+note_resolver_service = NoteResolverService()
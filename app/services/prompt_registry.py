@@ -0,0 +1,102 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from langchain.prompts import PromptTemplate
+
+from ..settings.paths import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_PATH = os.path.join(DATA_DIR, "prompts.txt")
+
+
+class CompiledPrompt:
+    """Промпт из файла: текст, готовый шаблон и версия (хэш содержимого)"""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        self.template = PromptTemplate(input_variables=["dialogue"], template=text)
+
+    def format(self, **kwargs) -> str:
+        return self.template.format(**kwargs)
+
+
+class PromptRegistry:
+    """
+    Реестр промптов из prompts.txt (секции вида [structured_analysis]).
+    Файл разбирается один раз в готовые шаблоны; при обращении проверяется
+    только mtime файла, и промпты перечитываются, лишь когда он изменился.
+    У каждого промпта есть версия - хэш его текста, она сохраняется вместе
+    с результатом анализа. Правка одной секции меняет версию только этой секции.
+    """
+
+    def __init__(self, path: str = PROMPTS_PATH):
+        self.path = path
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse(content: str) -> Dict[str, str]:
+        """Секции файла промптов: название -> текст"""
+        prompts = {}
+        for section in content.split("["):
+            if "]" in section:
+                key, text = section.split("]", 1)
+                prompts[key.strip()] = text.strip()
+        return prompts
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Файл промптов не найден: {self.path}")
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                content = f.read()
+            prompts = {}
+            for name, text in self.parse(content).items():
+                previous = self._prompts.get(name)
+                # Неизмененные секции не компилируются заново
+                prompts[name] = previous if previous and previous.text == text else CompiledPrompt(name, text)
+            self._prompts = prompts
+            self._mtime = mtime
+            logger.info(f"Загружены промпты {self.path}: " + ", ".join(f"{p.name}@{p.version}" for p in prompts.values()))
+
+    def get(self, name: str) -> CompiledPrompt:
+        """Промпт по названию секции; KeyError, если секции нет в файле"""
+        self._reload_if_changed()
+        try:
+            return self._prompts[name]
+        except KeyError:
+            raise KeyError(f"Промпт [{name}] не найден в {self.path}")
+
+    def text(self, name: str) -> str:
+        """Текст промпта (пустая строка, если секции нет)"""
+        self._reload_if_changed()
+        prompt = self._prompts.get(name)
+        return prompt.text if prompt else ""
+
+    def format(self, name: str, **kwargs) -> Tuple[str, str]:
+        """Готовый запрос и версия промпта, по которому он построен"""
+        prompt = self.get(name)
+        return prompt.format(**kwargs), prompt.version
+
+    def versions(self) -> Dict[str, Any]:
+        """Текущие версии всех промптов"""
+        self._reload_if_changed()
+        return {name: prompt.version for name, prompt in self._prompts.items()}
+
+
+# Создаем экземпляр для использования в приложении
+prompt_registry = PromptRegistry()
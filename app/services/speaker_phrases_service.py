@@ -0,0 +1,80 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+from ..utils.phrase_matcher import PhraseMatcher, default_phrase_matcher
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Как часто перечитывать настройки фраз клиники из MongoDB (секунд)
+SPEAKER_PHRASES_TTL = int(os.getenv("SPEAKER_PHRASES_TTL", "300"))
+
+
+class SpeakerPhrasesService:
+    """
+    Реестр скомпилированных наборов фраз для определения ролей по клиникам.
+
+    Клиника может переопределить любой список из DEFAULT_SPEAKER_PHRASES
+    в поле speaker_role_phrases своего документа в коллекции clinics.
+    Набор перекомпилируется только при изменении этого поля.
+    """
+
+    def __init__(self, ttl: int = SPEAKER_PHRASES_TTL):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.ttl = ttl
+        # client_id -> (время загрузки, хэш настроек, скомпилированный набор)
+        self._cache: Dict[str, Tuple[float, str, PhraseMatcher]] = {}
+
+    async def get_matcher(self, client_id: Optional[str] = None) -> PhraseMatcher:
+        """Возвращает набор фраз клиники (или общий, если настроек нет)"""
+        if not client_id:
+            return default_phrase_matcher
+
+        cached = self._cache.get(client_id)
+        now = time.monotonic()
+        if cached and now - cached[0] < self.ttl:
+            return cached[2]
+
+        try:
+            clinic = await self.db.clinics.find_one(
+                {"client_id": client_id},
+                {"speaker_role_phrases": 1}
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить фразы ролей для клиники {client_id}: {e}")
+            return cached[2] if cached else default_phrase_matcher
+
+        phrases = (clinic or {}).get("speaker_role_phrases") or {}
+        config_hash = hashlib.sha256(
+            json.dumps(phrases, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+        if cached and cached[1] == config_hash:
+            matcher = cached[2]
+        elif phrases:
+            matcher = PhraseMatcher(phrases)
+            logger.info(f"Скомпилирован набор фраз ролей для клиники {client_id}")
+        else:
+            matcher = default_phrase_matcher
+
+        self._cache[client_id] = (now, config_hash, matcher)
+        return matcher
+
+    def invalidate(self, client_id: Optional[str] = None):
+        """Сбрасывает кэш наборов фраз (для клиники или целиком)"""
+        if client_id:
+            self._cache.pop(client_id, None)
+        else:
+            self._cache.clear()
+
+
+# Создаем экземпляр для использования в сервисах
+speaker_phrases_service = SpeakerPhrasesService()
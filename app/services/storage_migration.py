@@ -0,0 +1,141 @@
+import os
+import sys
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ..settings.storage import (
+    StorageResolver, audio_storage, transcription_storage, analysis_storage, date_from_filename
+)
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Служебные файлы транскрипции (структурированная версия и отладочный ответ STT)
+_COMPANION_SUFFIXES = (".transcript.json.gz", ".txt.debug.json")
+
+
+class StorageMigration:
+    """
+    Перенос файлов из плоских директорий в структуру <клиника>/YYYY/MM/DD.
+    Клиника файла определяется по записям transcriptions, audio_files и call_records,
+    дата - по имени файла (или по времени изменения). После переноса
+    в базе сохраняются относительные пути к файлам.
+    """
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.clinics: Dict[str, str] = {}
+
+    async def load_clinics(self):
+        """Собирает соответствие имя файла -> клиника"""
+        async for doc in self.db.transcriptions.find(
+            {"client_id": {"$ne": None}}, {"filename": 1, "filename_audio": 1, "client_id": 1}
+        ):
+            for key in ("filename", "filename_audio"):
+                if doc.get(key):
+                    self.clinics.setdefault(doc[key], str(doc["client_id"]))
+
+        async for doc in self.db.audio_files.find({"client_id": {"$ne": None}}, {"filename": 1, "client_id": 1}):
+            self.clinics.setdefault(doc["filename"], str(doc["client_id"]))
+
+        async for doc in self.db.call_records.find(
+            {"clinic_id": {"$ne": None}}, {"audio_file": 1, "transcription_file": 1, "analysis_file": 1, "clinic_id": 1}
+        ):
+            for key in ("audio_file", "transcription_file", "analysis_file"):
+                if doc.get(key):
+                    self.clinics.setdefault(os.path.basename(doc[key]), str(doc["clinic_id"]))
+
+        logger.info(f"Определены клиники для {len(self.clinics)} файлов")
+
+    def _clinic_for(self, filename: str) -> Optional[str]:
+        clinic_id = self.clinics.get(filename)
+        if clinic_id is None:
+            # Служебные файлы транскрипции относятся к той же клинике
+            for suffix in _COMPANION_SUFFIXES:
+                if filename.endswith(suffix):
+                    return self.clinics.get(filename[:-len(suffix)] + ".txt")
+        return clinic_id
+
+    def _move(self, storage: StorageResolver, entry: os.DirEntry) -> Optional[str]:
+        """Переносит файл в раздел клиники; возвращает новый относительный путь"""
+        when = date_from_filename(entry.name) or datetime.fromtimestamp(entry.stat().st_mtime)
+        clinic_id = self._clinic_for(entry.name)
+        relative_path = os.path.join(storage.relative_dir(clinic_id, when), entry.name)
+
+        if self.dry_run:
+            logger.info(f"[dry-run] {entry.path} -> {relative_path}")
+            return relative_path
+
+        target = storage.path_for(entry.name, clinic_id, when)
+        if os.path.exists(target):
+            logger.warning(f"Файл {target} уже существует, {entry.path} не перенесен")
+            return None
+        os.replace(entry.path, target)
+        return relative_path
+
+    def migrate_directory(self, storage: StorageResolver) -> Dict[str, str]:
+        """Переносит все файлы из корня хранилища; возвращает имя файла -> относительный путь"""
+        moved = {}
+        for entry in list(storage.iter_legacy_files()):
+            try:
+                relative_path = self._move(storage, entry)
+            except OSError as e:
+                logger.error(f"Не удалось перенести {entry.path}: {e}")
+                continue
+            if relative_path:
+                moved[entry.name] = relative_path
+        logger.info(f"{storage.root}: перенесено файлов: {len(moved)}")
+        return moved
+
+    async def update_references(self, audio: Dict[str, str], transcriptions: Dict[str, str], analyses: Dict[str, str]):
+        """Сохраняет в базе новые относительные пути перенесенных файлов"""
+        if self.dry_run:
+            return
+
+        for filename, relative_path in audio.items():
+            await self.db.audio_files.update_many({"filename": filename}, {"$set": {"path": relative_path}})
+            await self.db.transcriptions.update_many({"filename_audio": filename}, {"$set": {"audio_path": relative_path}})
+
+        for filename, relative_path in transcriptions.items():
+            if filename.endswith(".txt"):
+                await self.db.transcriptions.update_many({"filename": filename}, {"$set": {"path": relative_path}})
+
+        # В call_records имена файлов могли сохраняться вместе с путем, поэтому сверяем по базовому имени
+        fields = (("audio_file", "audio_path", audio), ("transcription_file", "transcription_path", transcriptions),
+                  ("analysis_file", "analysis_path", analyses))
+        async for record in self.db.call_records.find({}, {"audio_file": 1, "transcription_file": 1, "analysis_file": 1}):
+            update = {}
+            for source, target, moved in fields:
+                name = os.path.basename(record.get(source) or "")
+                if name in moved:
+                    update[target] = moved[name]
+            if update:
+                await self.db.call_records.update_one({"_id": record["_id"]}, {"$set": update})
+
+    async def run(self) -> Dict[str, int]:
+        await self.load_clinics()
+        audio = await asyncio.to_thread(self.migrate_directory, audio_storage)
+        transcriptions = await asyncio.to_thread(self.migrate_directory, transcription_storage)
+        analyses = await asyncio.to_thread(self.migrate_directory, analysis_storage)
+        await self.update_references(audio, transcriptions, analyses)
+        return {"audio": len(audio), "transcriptions": len(transcriptions), "analysis": len(analyses)}
+
+
+async def _main(dry_run: bool):
+    result = await StorageMigration(dry_run=dry_run).run()
+    print(f"Перенос завершен{' (dry-run)' if dry_run else ''}: {result}")
+
+
+if __name__ == "__main__":
+    # Разовый перенос файлов: python -m app.services.storage_migration [--dry-run]
+    # Сервисы на время переноса лучше остановить
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    asyncio.run(_main("--dry-run" in sys.argv[1:]))
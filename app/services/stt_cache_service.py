@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional
+
+from ..settings.paths import STT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Размер блока при потоковом чтении файла для хэширования
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_file_sha256(file_path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    Вычисляет SHA-256 содержимого файла, читая его блоками,
+    чтобы не загружать аудио в память целиком.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class SttCacheService:
+    """
+    Кэш сырых ответов ElevenLabs speech-to-text.
+    Ключ - SHA-256 аудио и параметры распознавания, поэтому одна и та же запись,
+    отправленная повторно под другим именем, не распознается заново.
+    """
+
+    def __init__(self, cache_dir: str = STT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio_hash: str, model_id: str, diarize: bool, num_speakers: int) -> str:
+        """Формирует ключ кэша из хэша аудио и параметров распознавания"""
+        return f"{audio_hash}_{model_id}_{'d' if diarize else 'nd'}_{num_speakers}"
+
+    def _path(self, key: str) -> str:
+        # Раскладываем файлы по подкаталогам, чтобы не держать всё в одной директории
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, audio_hash: str, model_id: str, diarize: bool, num_speakers: int) -> Optional[Dict[str, Any]]:
+        """Возвращает сохраненный ответ STT или None"""
+        path = self._path(self.make_key(audio_hash, model_id, diarize, num_speakers))
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш STT {path}: {e}")
+            return None
+
+    def put(self, audio_hash: str, model_id: str, diarize: bool, num_speakers: int, response_dict: Dict[str, Any]):
+        """Сохраняет ответ STT атомарно (через временный файл)"""
+        path = self._path(self.make_key(audio_hash, model_id, diarize, num_speakers))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = None
+        try:
+            # Уникальный временный файл: один ответ могут сохранять несколько потоков и процессов
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=os.path.dirname(path),
+                prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False
+            ) as f:
+                tmp_path = f.name
+                json.dump(response_dict, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            logger.info(f"Ответ STT сохранен в кэш: {path}")
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить кэш STT {path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+# Создаем экземпляр для использования в сервисах
+stt_cache_service = SttCacheService()
@@ -0,0 +1,312 @@
+import os
+import re
+import sys
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from .transcript_store import load_transcript
+from .transcription_index_service import build_listing
+from ..settings.paths import SEARCH_INDEX_PATH
+from ..settings.storage import transcription_storage, StorageResolver
+from ..utils.russian_stemmer import stem, stem_text
+
+logger = logging.getLogger(__name__)
+
+# Реплики документа получают rowid = id документа * ROWID_STRIDE + номер реплики,
+# поэтому реплики одного файла удаляются и выбираются по диапазону rowid
+ROWID_STRIDE = 100000
+# Сколько фрагментов с подсветкой возвращать для каждого файла
+SNIPPETS_PER_FILE = 3
+# Максимальная длина фрагмента
+SNIPPET_LENGTH = 300
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_NON_DIGIT_RE = re.compile(r'\D')
+# Сколько последних цифр номера сравнивать (без кода страны: +7/8)
+PHONE_SUFFIX_DIGITS = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    phone TEXT,
+    note_id TEXT,
+    created_at TEXT,
+    size INTEGER,
+    preview TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents(created_at);
+CREATE INDEX IF NOT EXISTS idx_documents_phone ON documents(phone, created_at);
+CREATE INDEX IF NOT EXISTS idx_documents_note_id ON documents(note_id, created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS utterances USING fts5(
+    stems,
+    speaker UNINDEXED,
+    start UNINDEXED,
+    text UNINDEXED
+);
+"""
+
+
+def highlight(text: str, query_stems: List[str], length: int = SNIPPET_LENGTH) -> str:
+    """
+    Выделяет в тексте слова, основа которых начинается с одной из основ запроса,
+    и обрезает текст до length символов вокруг первого совпадения.
+    """
+    matches = [
+        match for match in _WORD_RE.finditer(text)
+        if any(stem(match.group(0).lower()).startswith(s) for s in query_stems)
+    ]
+    if not matches:
+        return text[:length]
+
+    start = max(0, matches[0].start() - length // 3)
+    end = min(len(text), start + length)
+    parts = []
+    position = start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(text[position:match.start()])
+        parts.append(f"<mark>{match.group(0)}</mark>")
+        position = match.end()
+    parts.append(text[position:end])
+
+    snippet = "".join(parts)
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet += "..."
+    return snippet
+
+
+class TranscriptSearchService:
+    """
+    Полнотекстовый индекс транскрипций в SQLite FTS5.
+    Индексируются основы слов (русский стеммер Snowball) каждой реплики,
+    метаданные файлов хранятся в таблице documents для фильтров.
+    """
+
+    def __init__(self, db_path: str = SEARCH_INDEX_PATH, storage: StorageResolver = transcription_storage):
+        self.db_path = db_path
+        self.storage = storage
+        self._schema_ready = False
+        self._write_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            connection.executescript(_SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def _index_sync(self, txt_path: str, transcript: Optional[Dict[str, Any]] = None):
+        filename = os.path.basename(txt_path)
+        if not os.path.exists(txt_path):
+            self._remove_sync(filename)
+            return
+
+        if transcript is None:
+            transcript = load_transcript(txt_path) or {}
+        listing = build_listing(txt_path)
+        header = transcript.get("header", {})
+        # Телефон из заголовка транскрипции (есть и у файлов note_*), иначе из имени файла
+        phone = _NON_DIGIT_RE.sub('', str(header.get("phone") or "")) or listing["phone"]
+
+        # Заголовок индексируется как реплика с номером 0, чтобы находились имена и телефон
+        header_text = " ".join(str(header[key]) for key in ("phone", "client_name", "manager_name") if header.get(key))
+        rows = [(header_text, "", 0, header_text)]
+        for utterance in transcript.get("utterances", []):
+            rows.append((utterance.get("text", ""), utterance.get("speaker", ""), utterance.get("start", 0), utterance.get("text", "")))
+        rows = rows[:ROWID_STRIDE]
+
+        with self._write_lock, self._connect() as connection:
+            connection.execute(
+                """
+                INSERT INTO documents (filename, phone, note_id, created_at, size, preview)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(filename) DO UPDATE SET
+                    phone = excluded.phone, note_id = excluded.note_id, created_at = excluded.created_at,
+                    size = excluded.size, preview = excluded.preview
+                """,
+                (filename, phone, listing["note_id"], header.get("created_at") or listing["created_at"],
+                 listing["size"], listing["preview"])
+            )
+            doc_id = connection.execute("SELECT id FROM documents WHERE filename = ?", (filename,)).fetchone()["id"]
+
+            base = doc_id * ROWID_STRIDE
+            connection.execute("DELETE FROM utterances WHERE rowid BETWEEN ? AND ?", (base, base + ROWID_STRIDE - 1))
+            connection.executemany(
+                "INSERT INTO utterances (rowid, stems, speaker, start, text) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (base + index, " ".join(stem_text(source)), speaker, start, text)
+                    for index, (source, speaker, start, text) in enumerate(rows)
+                ]
+            )
+
+    def _remove_sync(self, filename: str):
+        with self._write_lock, self._connect() as connection:
+            row = connection.execute("SELECT id FROM documents WHERE filename = ?", (filename,)).fetchone()
+            if row:
+                base = row["id"] * ROWID_STRIDE
+                connection.execute("DELETE FROM utterances WHERE rowid BETWEEN ? AND ?", (base, base + ROWID_STRIDE - 1))
+                connection.execute("DELETE FROM documents WHERE id = ?", (row["id"],))
+
+    def _search_sync(
+        self,
+        query: Optional[str],
+        phone: Optional[str],
+        note_id: Optional[int],
+        date_from: Optional[str],
+        date_to: Optional[str],
+        limit: int,
+        offset: int
+    ) -> List[Dict[str, Any]]:
+        filters = []
+        params: List[Any] = []
+        phone_digits = _NON_DIGIT_RE.sub('', phone or "")
+        if phone_digits:
+            # Номер совпадает по последним цифрам (+7/8 в начале не важны), по началу
+            # (введена часть номера) или как подстрока имени файла
+            filters.append("(d.phone LIKE ? OR d.phone LIKE ? OR d.filename LIKE ?)")
+            params += [f"%{phone_digits[-PHONE_SUFFIX_DIGITS:]}", f"{phone_digits}%", f"%{phone_digits}%"]
+        if note_id:
+            filters.append("d.note_id = ?")
+            params.append(str(note_id))
+        if date_from:
+            filters.append("d.created_at >= ?")
+            params.append(datetime.strptime(date_from, "%Y-%m-%d").strftime("%Y-%m-%d 00:00:00"))
+        if date_to:
+            filters.append("d.created_at <= ?")
+            params.append(datetime.strptime(date_to, "%Y-%m-%d").strftime("%Y-%m-%d 23:59:59"))
+        where = (" AND " + " AND ".join(filters)) if filters else ""
+
+        query_stems = [stem(token) for token in _WORD_RE.findall((query or "").lower())]
+
+        with self._connect() as connection:
+            if not query_stems:
+                documents = connection.execute(
+                    f"SELECT d.*, NULL AS score FROM documents d WHERE 1 = 1{where} "
+                    f"ORDER BY d.created_at DESC, d.filename DESC LIMIT ? OFFSET ?",
+                    params + [limit, offset]
+                ).fetchall()
+                return [self._serialize(row, []) for row in documents]
+
+            match = " ".join(f'"{s}"*' for s in query_stems)
+            documents = connection.execute(
+                f"""
+                WITH hits AS MATERIALIZED (
+                    SELECT rowid / {ROWID_STRIDE} AS doc_id, bm25(utterances) AS score
+                    FROM utterances WHERE utterances MATCH ?
+                )
+                SELECT d.*, MIN(hits.score) AS score
+                FROM hits
+                JOIN documents d ON d.id = hits.doc_id
+                WHERE 1 = 1{where}
+                GROUP BY d.id
+                ORDER BY score, d.created_at DESC
+                LIMIT ? OFFSET ?
+                """,
+                [match] + params + [limit, offset]
+            ).fetchall()
+
+            results = []
+            for row in documents:
+                base = row["id"] * ROWID_STRIDE
+                hits = connection.execute(
+                    """
+                    SELECT speaker, start, text FROM utterances
+                    WHERE utterances MATCH ? AND rowid BETWEEN ? AND ?
+                    ORDER BY bm25(utterances) LIMIT ?
+                    """,
+                    (match, base, base + ROWID_STRIDE - 1, SNIPPETS_PER_FILE)
+                ).fetchall()
+                snippets = [
+                    {"speaker": hit["speaker"], "start": hit["start"], "text": highlight(hit["text"], query_stems)}
+                    for hit in hits
+                ]
+                results.append(self._serialize(row, snippets))
+            return results
+
+    @staticmethod
+    def _serialize(row: sqlite3.Row, snippets: List[Dict[str, Any]]) -> Dict[str, Any]:
+        filename = row["filename"]
+        return {
+            "filename": filename,
+            "size": row["size"],
+            "created_at": row["created_at"],
+            "phone": row["phone"],
+            "note_id": row["note_id"],
+            "preview": row["preview"],
+            "score": row["score"],
+            "snippets": snippets,
+            "download_url": f"/api/transcriptions/{filename}/download"
+        }
+
+    def _rebuild_sync(self) -> int:
+        with self._write_lock, self._connect() as connection:
+            connection.execute("DELETE FROM utterances")
+            connection.execute("DELETE FROM documents")
+
+        count = 0
+        for entry in self.storage.iter_files((".txt",)):
+            try:
+                self._index_sync(entry.path)
+                count += 1
+            except Exception as e:
+                logger.error(f"Не удалось проиндексировать {entry.name}: {e}")
+
+        with self._connect() as connection:
+            connection.execute("INSERT INTO utterances(utterances) VALUES ('optimize')")
+        return count
+
+    async def index_transcript(self, txt_path: str, transcript: Optional[Dict[str, Any]] = None):
+        """Добавляет или обновляет транскрипцию в индексе; ошибки только логируются"""
+        try:
+            await asyncio.to_thread(self._index_sync, txt_path, transcript)
+        except Exception as e:
+            logger.error(f"Ошибка при индексации транскрипции {txt_path} для поиска: {e}")
+
+    async def remove(self, filename: str):
+        """Удаляет транскрипцию из индекса"""
+        await asyncio.to_thread(self._remove_sync, filename)
+
+    async def search(
+        self,
+        query: Optional[str] = None,
+        phone: Optional[str] = None,
+        note_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Ищет транскрипции. С query результаты упорядочены по релевантности (BM25)
+        и содержат фрагменты реплик с подсветкой; без query - по дате (сначала новые).
+        """
+        return await asyncio.to_thread(
+            self._search_sync, query, phone, note_id, date_from, date_to,
+            max(1, min(limit, 500)), max(0, offset)
+        )
+
+    async def rebuild(self) -> int:
+        """Перестраивает индекс по всем файлам директории транскрипций"""
+        return await asyncio.to_thread(self._rebuild_sync)
+
+
+# Создаем экземпляр для использования в API
+transcript_search_service = TranscriptSearchService()
+
+
+if __name__ == "__main__":
+    # Разовое перестроение индекса: python -m app.services.transcript_search_service
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    total = asyncio.run(transcript_search_service.rebuild())
+    print(f"Поисковый индекс перестроен: {total} транскрипций")
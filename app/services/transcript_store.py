@@ -0,0 +1,204 @@
+import os
+import re
+import gzip
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+# Версия формата структурированной транскрипции
+TRANSCRIPT_FORMAT_VERSION = 1
+# Суффикс файла со структурированной транскрипцией рядом с .txt
+STRUCTURED_SUFFIX = ".transcript.json.gz"
+
+# Роли говорящих
+ROLE_MANAGER = "manager"
+ROLE_CLIENT = "client"
+ROLE_OTHER = "other"
+
+# Разбор строк текстового формата (для транскрипций без структурированной версии)
+_LINE_RE = re.compile(r'^\[(\d+):(\d{2})\]\s+([^:]+):\s?(.*)$')
+_HEADER_FIELDS = {
+    "Дата и время": "created_at",
+    "Телефон": "phone",
+    "Клиент": "client_name",
+    "Менеджер": "manager_name",
+    "Файл": "audio_filename",
+}
+
+
+def structured_path(txt_path: str) -> str:
+    """Путь к структурированной транскрипции для .txt файла"""
+    return os.path.splitext(txt_path)[0] + STRUCTURED_SUFFIX
+
+
+def build_transcript(
+    dialogue: List[Dict[str, Any]],
+    audio_filename: str,
+    duration: float = 0,
+    phone: Optional[str] = None,
+    client_name: Optional[str] = None,
+    manager_name: Optional[str] = None,
+    is_first_contact: bool = False,
+    created_at: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Формирует структурированную транскрипцию: заголовок с метаданными
+    и список реплик с ролью говорящего и временными метками.
+    """
+    return {
+        "version": TRANSCRIPT_FORMAT_VERSION,
+        "header": {
+            "created_at": created_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "phone": phone,
+            "client_name": client_name,
+            "manager_name": manager_name,
+            "is_first_contact": is_first_contact,
+            "audio_filename": audio_filename,
+            "duration": duration
+        },
+        "utterances": [
+            {
+                "speaker": line["speaker"],
+                "role": line.get("role", ROLE_OTHER),
+                "start": round(float(line.get("start_time", 0)), 3),
+                "end": round(float(line.get("end_time", 0)), 3),
+                "text": line["text"]
+            }
+            for line in dialogue
+        ]
+    }
+
+
+def _format_clock(seconds: float) -> str:
+    """Форматирует время в [MM:SS]"""
+    return f"[{int(seconds) // 60:02d}:{int(seconds) % 60:02d}]"
+
+
+def render_text(transcript: Dict[str, Any]) -> str:
+    """Текстовое представление транскрипции (формат .txt файлов)"""
+    header = transcript.get("header", {})
+    parts = ["Транскрипция звонка\n", f"Дата и время: {header.get('created_at', '')}\n"]
+
+    if header.get("phone"):
+        parts.append(f"Телефон: {header['phone']}\n")
+    if header.get("client_name"):
+        parts.append(f"Клиент: {header['client_name']}\n")
+    if header.get("manager_name"):
+        parts.append(f"Менеджер: {header['manager_name']}\n")
+    if header.get("is_first_contact"):
+        parts.append("Тип: Первичное обращение\n")
+
+    parts.append(f"Файл: {header.get('audio_filename', '')}\n")
+
+    duration = header.get("duration") or 0
+    parts.append(f"Длительность: {int(duration) // 60}:{int(duration) % 60:02d}\n\n")
+
+    for utterance in transcript.get("utterances", []):
+        parts.append(f"{_format_clock(utterance['start'])} {utterance['speaker']}: {utterance['text']}\n\n")
+
+    return "".join(parts)
+
+
+def render_srt(transcript: Dict[str, Any]) -> str:
+    """Субтитры SRT по репликам транскрипции"""
+    def srt_time(seconds: float) -> str:
+        millis = int(round(seconds * 1000))
+        hours, millis = divmod(millis, 3600000)
+        minutes, millis = divmod(millis, 60000)
+        secs, millis = divmod(millis, 1000)
+        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+    blocks = []
+    for index, utterance in enumerate(transcript.get("utterances", []), start=1):
+        blocks.append(
+            f"{index}\n{srt_time(utterance['start'])} --> {srt_time(utterance['end'])}\n"
+            f"{utterance['speaker']}: {utterance['text']}\n"
+        )
+    return "\n".join(blocks)
+
+
+def save_transcript(txt_path: str, transcript: Dict[str, Any]):
+    """Записывает текстовую транскрипцию и её структурированную версию"""
+    with open(txt_path, "w", encoding="utf-8") as file:
+        file.write(render_text(transcript))
+
+    try:
+        with gzip.open(structured_path(txt_path), "wt", encoding="utf-8") as file:
+            json.dump(transcript, file, ensure_ascii=False, separators=(",", ":"))
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить структурированную транскрипцию для {txt_path}: {e}")
+
+
+def parse_transcript_text(content: str) -> Dict[str, Any]:
+    """
+    Разбирает текстовую транскрипцию в структурированный вид.
+    Используется для старых файлов без структурированной версии.
+    """
+    header = {"is_first_contact": False, "duration": 0}
+    utterances = []
+
+    for raw_line in content.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        match = _LINE_RE.match(line)
+        if match:
+            start = int(match.group(1)) * 60 + int(match.group(2))
+            if utterances and utterances[-1]["end"] < start:
+                utterances[-1]["end"] = start
+            utterances.append({
+                "speaker": match.group(3).strip(),
+                "role": ROLE_OTHER,
+                "start": start,
+                "end": start,
+                "text": match.group(4).strip()
+            })
+            continue
+
+        if utterances or ":" not in line:
+            continue
+
+        key, value = [part.strip() for part in line.split(":", 1)]
+        if key in _HEADER_FIELDS:
+            header[_HEADER_FIELDS[key]] = value
+        elif key == "Тип":
+            header["is_first_contact"] = "Первичное" in value
+        elif key == "Длительность" and re.match(r'^\d+:\d{2}$', value):
+            minutes, seconds = value.split(":")
+            header["duration"] = int(minutes) * 60 + int(seconds)
+
+    client_name = header.get("client_name")
+    for utterance in utterances:
+        if utterance["speaker"].startswith("Менеджер"):
+            utterance["role"] = ROLE_MANAGER
+        elif utterance["speaker"].startswith("Клиент") or (client_name and utterance["speaker"] == client_name):
+            utterance["role"] = ROLE_CLIENT
+
+    if utterances and header["duration"] and utterances[-1]["end"] < header["duration"]:
+        utterances[-1]["end"] = header["duration"]
+
+    return {"version": TRANSCRIPT_FORMAT_VERSION, "header": header, "utterances": utterances}
+
+
+def load_transcript(txt_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Загружает структурированную транскрипцию для .txt файла.
+    Если структурированной версии нет, разбирает текстовый файл.
+    """
+    sidecar = structured_path(txt_path)
+    if os.path.exists(sidecar):
+        try:
+            with gzip.open(sidecar, "rt", encoding="utf-8") as file:
+                return json.load(file)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать структурированную транскрипцию {sidecar}: {e}")
+
+    if not os.path.exists(txt_path):
+        return None
+
+    with open(txt_path, "r", encoding="utf-8") as file:
+        return parse_transcript_text(file.read())
@@ -0,0 +1,236 @@
+import os
+import re
+import sys
+import json
+import uuid
+import base64
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from ..settings.storage import transcription_storage, StorageResolver
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Длина предпросмотра текста транскрипции
+PREVIEW_LENGTH = 500
+# Размер страницы списка транскрипций
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Форматы имен файлов транскрипций: 79991234567_20250101_120000.txt, note_123_20250101_120000.txt
+_PHONE_FILENAME_RE = re.compile(r'^(\d+)_\d{8}_\d{6}\.txt$')
+_NOTE_FILENAME_RE = re.compile(r'^note_(\d+)_\d{8}_\d{6}\.txt$')
+
+
+def build_listing(file_path: str) -> Dict[str, Any]:
+    """
+    Собирает метаданные файла транскрипции для списка:
+    размер, дату создания, телефон и ID заметки из имени файла, предпросмотр.
+    """
+    filename = os.path.basename(file_path)
+    file_stats = os.stat(file_path)
+
+    phone_match = _PHONE_FILENAME_RE.match(filename)
+    note_match = _NOTE_FILENAME_RE.match(filename)
+
+    preview_text = ""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            preview_text = f.read(PREVIEW_LENGTH)
+            if len(preview_text) == PREVIEW_LENGTH:
+                preview_text += "..."
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать предпросмотр файла {filename}: {e}")
+
+    return {
+        "size": file_stats.st_size,
+        "created_at": datetime.fromtimestamp(file_stats.st_ctime).strftime("%Y-%m-%d %H:%M:%S"),
+        "phone": phone_match.group(1) if phone_match else None,
+        "note_id": note_match.group(1) if note_match else None,
+        "preview": preview_text
+    }
+
+
+def encode_cursor(created_at: str, filename: str) -> str:
+    """Курсор страницы - позиция последнего элемента в порядке сортировки"""
+    raw = json.dumps([created_at, filename], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Разбирает курсор страницы; при неверном формате - ValueError"""
+    try:
+        created_at, filename = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(filename)
+    except Exception:
+        raise ValueError("Неверный формат курсора")
+
+
+class TranscriptionIndexService:
+    """
+    Индекс файлов транскрипций для списка (поле listing в коллекции transcriptions).
+    Список отдается постранично по индексу (listing.created_at, filename)
+    без обхода директории и чтения файлов.
+    """
+
+    def __init__(self, storage: StorageResolver = transcription_storage):
+        self.storage = storage
+        self.transcription_dir = storage.root
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.collection = self.db.transcriptions
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        """Создает индексы для постраничной выборки и фильтров"""
+        if self._indexes_ready:
+            return
+        await self.collection.create_index([("listing.created_at", DESCENDING), ("filename", DESCENDING)])
+        await self.collection.create_index([("listing.phone", ASCENDING), ("listing.created_at", DESCENDING)], sparse=True)
+        await self.collection.create_index([("listing.note_id", ASCENDING), ("listing.created_at", DESCENDING)], sparse=True)
+        self._indexes_ready = True
+
+    async def index_file(self, file_path: str):
+        """Добавляет или обновляет метаданные файла в индексе"""
+        try:
+            await self.ensure_indexes()
+            listing = await asyncio.to_thread(build_listing, file_path)
+            await self.collection.update_one(
+                {"filename": os.path.basename(file_path)},
+                {"$set": {"listing": listing, "path": self.storage.relative(file_path), "indexed_at": datetime.now().isoformat()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при индексации файла транскрипции {file_path}: {e}")
+
+    async def list_page(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        phone: Optional[str] = None,
+        note_id: Optional[int] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Возвращает страницу транскрипций (сначала новые) и курсор следующей страницы.
+
+        :param date_from: дата начала периода в формате YYYY-MM-DD
+        :param date_to: дата окончания периода в формате YYYY-MM-DD (включительно)
+        """
+        await self.ensure_indexes()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        query: Dict[str, Any] = {"listing": {"$exists": True}}
+        if phone:
+            query["listing.phone"] = re.sub(r'[^\d]', '', phone)
+        if note_id:
+            query["listing.note_id"] = str(note_id)
+
+        created_range = {}
+        if date_from:
+            created_range["$gte"] = datetime.strptime(date_from, "%Y-%m-%d").strftime("%Y-%m-%d 00:00:00")
+        if date_to:
+            created_range["$lte"] = datetime.strptime(date_to, "%Y-%m-%d").strftime("%Y-%m-%d 23:59:59")
+        if created_range:
+            query["listing.created_at"] = created_range
+
+        if cursor:
+            cursor_created_at, cursor_filename = decode_cursor(cursor)
+            query["$or"] = [
+                {"listing.created_at": {"$lt": cursor_created_at}},
+                {"listing.created_at": cursor_created_at, "filename": {"$lt": cursor_filename}}
+            ]
+
+        documents = await self.collection.find(
+            query,
+            {"_id": 0, "filename": 1, "listing": 1}
+        ).sort(
+            [("listing.created_at", DESCENDING), ("filename", DESCENDING)]
+        ).limit(limit + 1).to_list(length=limit + 1)
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            last = documents[-1]
+            next_cursor = encode_cursor(last["listing"]["created_at"], last["filename"])
+
+        items = []
+        for document in documents:
+            listing = document["listing"]
+            filename = document["filename"]
+            items.append({
+                "filename": filename,
+                "size": listing.get("size"),
+                "created_at": listing.get("created_at"),
+                "phone": listing.get("phone"),
+                "note_id": listing.get("note_id"),
+                "preview": listing.get("preview", ""),
+                "download_url": f"/api/transcriptions/{filename}/download"
+            })
+        return items, next_cursor
+
+    async def rebuild(self, batch_size: int = 500) -> int:
+        """
+        Перестраивает индекс по содержимому директории с транскрипциями.
+        У записей о несуществующих файлах метаданные списка удаляются.
+
+        Найденные файлы помечаются ID перестроения (rebuild_id); устаревшими
+        считаются записи с другим ID, не проиндексированные во время обхода.
+        """
+        await self.ensure_indexes()
+        rebuild_id = uuid.uuid4().hex
+        started_at = datetime.now().isoformat()
+        operations = []
+        count = 0
+
+        for entry in self.storage.iter_files((".txt",)):
+            listing = await asyncio.to_thread(build_listing, entry.path)
+            operations.append(UpdateOne(
+                {"filename": entry.name},
+                {"$set": {
+                    "listing": listing,
+                    "path": self.storage.relative(entry.path),
+                    "rebuild_id": rebuild_id,
+                    "indexed_at": datetime.now().isoformat()
+                }},
+                upsert=True
+            ))
+            count += 1
+
+            if len(operations) >= batch_size:
+                await self.collection.bulk_write(operations, ordered=False)
+                operations = []
+
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+        stale = await self.collection.update_many(
+            {"listing": {"$exists": True}, "rebuild_id": {"$ne": rebuild_id}, "indexed_at": {"$not": {"$gte": started_at}}},
+            {"$unset": {"listing": ""}}
+        )
+        logger.info(f"Индекс транскрипций перестроен: {count} файлов, устаревших записей: {stale.modified_count}")
+        return count
+
+
+# Создаем экземпляр для использования в API
+transcription_index_service = TranscriptionIndexService()
+
+
+async def _main():
+    count = await transcription_index_service.rebuild()
+    print(f"Индекс транскрипций перестроен: {count} файлов в {transcription_index_service.transcription_dir}")
+
+
+if __name__ == "__main__":
+    # Разовое перестроение индекса: python -m app.services.transcription_index_service
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    asyncio.run(_main())
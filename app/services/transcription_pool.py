@@ -0,0 +1,92 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество одновременных обращений к ElevenLabs
+TRANSCRIPTION_MAX_WORKERS = int(os.getenv("TRANSCRIPTION_MAX_WORKERS", "4"))
+
+
+class TranscriptionPool:
+    """
+    Ограниченный пул потоков для синхронных вызовов speech-to-text.
+    Вызовы выполняются вне event loop, поэтому API остается отзывчивым
+    во время транскрибации.
+    """
+
+    def __init__(self, max_workers: int = TRANSCRIPTION_MAX_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="stt-worker"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _wrap(self, func: Callable, *args, **kwargs):
+        """Выполняет задачу в потоке пула и обновляет счетчики"""
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            result = func(*args, **kwargs)
+            with self._lock:
+                self._completed += 1
+            return result
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Ставит синхронную функцию в очередь пула и ожидает результат,
+        не блокируя event loop.
+        """
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._executor.submit(self._wrap, func, *args, **kwargs)
+        except RuntimeError:
+            # Пул уже остановлен - задача не была поставлена в очередь
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future: Future):
+        """Задача, отмененная до запуска (отмена ожидания, shutdown), покидает очередь"""
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает текущее состояние пула и глубину очереди"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+                "failed": self._failed
+            }
+
+    def shutdown(self, wait: bool = False):
+        """Останавливает пул при завершении приложения"""
+        logger.info(f"Остановка пула транскрибации: {self.stats()}")
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Создаем экземпляр для использования в приложении
+transcription_pool = TranscriptionPool()
@@ -1,17 +1,29 @@
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 import os
 import json
 # import re
 import time
 import logging
-# import asyncio
+import asyncio
 # import aiofiles
 from motor.motor_asyncio import AsyncIOMotorClient
 from ..settings.paths import AUDIO_DIR, TRANSCRIPTION_DIR
+from ..settings.storage import audio_storage
 from ..settings.auth import evenlabs
 from ..services.limits_service import LimitsService
+from ..services.transcription_pool import transcription_pool
+from ..services.stt_cache_service import stt_cache_service, compute_file_sha256
+from ..services.chunked_transcription import transcribe_chunked
+from ..services.audio_preprocessing import AUDIO_PREPROCESS, preprocess_for_stt, remap_response
+from ..utils.helpers import cleanup_temp_file
+from ..services.speaker_phrases_service import speaker_phrases_service
+from ..services.transcription_index_service import transcription_index_service
+from ..services.transcript_search_service import transcript_search_service
+from ..services.transcript_store import build_transcript, save_transcript, ROLE_MANAGER, ROLE_CLIENT, ROLE_OTHER
+from ..utils.segmenter import iter_utterances
+from ..utils.phrase_matcher import default_phrase_matcher
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +32,16 @@ logger = logging.getLogger(__name__)
 MONGO_URI = "mongodb://localhost:27017"
 DB_NAME = "medai"
 
-def detect_speaker_roles(dialogue, manager_name=None, client_name=None):
+# Модель ElevenLabs для распознавания речи
+STT_MODEL_ID = "scribe_v1"
+# Параллельная транскрибация длинных записей по фрагментам (по умолчанию выключена)
+TRANSCRIPTION_CHUNKED = os.getenv("TRANSCRIPTION_CHUNKED", "0").lower() in ("1", "true", "yes")
+
+# Представление клиники - проверяются, только если в реплике есть слово "клиника"
+CLINIC_INTRO_RE = re.compile(r'(это|здравствуйте|приветствую).*клиника')
+CLINIC_LISTENING_RE = re.compile(r'клиника.*слушает')
+
+def detect_speaker_roles(dialogue, manager_name=None, client_name=None, matcher=None):
     """
     Определяет, кто из говорящих является менеджером, а кто клиентом,
     используя эвристики и анализ текста.
@@ -28,41 +49,18 @@ def detect_speaker_roles(dialogue, manager_name=None, client_name=None):
     :param dialogue: список словарей с репликами (speaker, text)
     :param manager_name: имя менеджера, если известно
     :param client_name: имя клиента, если известно
+    :param matcher: скомпилированный набор фраз (PhraseMatcher), по умолчанию - общий
     :returns: (manager_speaker, client_speaker) - идентификаторы говорящих
     """
-    # Фразы, типичные для менеджера
-    manager_phrases = [
-        "клиника", "стоматология", 
-        "запись", "администратор", "как могу к вам обращаться",
-        "врач", "прием", "доктор", "стоматологическая клиника", "приглашаем",
-        "как вас зовут", "специалист", "услуги", "мы работаем",
-        "рассрочка", "помочь", "подобрать", "предложить",
-        "консультация", "спасибо за звонок", 
-        "всего доброго"
-    ]
-    
-    # Фразы, типичные для клиента
-    client_phrases = [
-        "сколько стоит", "цена", "дорого", "у меня проблема",
-        "больно", "болит зуб", "когда можно", "хочу", 
-        "у меня проблема", "подскажите", "я хотел", "мне нужно", "мне надо", "сколько будет",
-        "как попасть", "как записаться", "хочу записаться"
-    ]
-    
-    # Специальные маркеры сильного индикатора менеджера
-    strong_manager_markers = [
-        "администратор", "клиника", "стоматология", "я вас слушаю",
-        "чем могу помочь", "стоматологическая клиника", "медицинский центр"
-    ]
+    if matcher is None:
+        matcher = default_phrase_matcher
     
-    # Специальные маркеры сильного индикатора клиента
-    strong_client_markers = [
-        "хочу записаться", "меня беспокоит", "мне нужно", "у меня болит",
-        "подскажите пожалуйста", "сколько будет стоить"
-    ]
+    manager_name_lower = manager_name.lower() if manager_name else None
+    client_name_lower = client_name.lower() if client_name else None
     
     # Инициализируем счетчики для разных говорящих
     speakers = {}
+    greeting_found = False
     
     # Начальный анализ - собираем данные по всем говорящим
     for line in dialogue:
@@ -78,72 +76,61 @@ def detect_speaker_roles(dialogue, manager_name=None, client_name=None):
                 "lines_count": 0,
                 "words_count": 0
             }
+        stats = speakers[speaker]
         
         # Увеличиваем счетчик реплик
-        speakers[speaker]["lines_count"] += 1
+        stats["lines_count"] += 1
         # Считаем примерное количество слов
-        speakers[speaker]["words_count"] += len(text.split())
+        stats["words_count"] += len(text.split())
+        
+        # Находим все фразы реплики за один проход
+        found = matcher.find(text)
         
         # Проверяем, кто первым поздоровался
-        if "добрый день" in text.lower() or "здравствуйте" in text.lower() or "добрый" in text.lower() or "алло" in text.lower():
-            if not any(s["greeting_first"] for s in speakers.values()):
-                speakers[speaker]["greeting_first"] = True
-                # Первое приветствие обычно от менеджера
-                speakers[speaker]["manager_score"] += 3
-        
-        # Проверяем фразы менеджера
-        for phrase in manager_phrases:
-            if phrase in text.lower():
-                speakers[speaker]["manager_score"] += 1
-        
-        # Проверяем фразы клиента
-        for phrase in client_phrases:
-            if phrase in text.lower():
-                speakers[speaker]["client_score"] += 1
-        
-        # Проверяем сильные индикаторы менеджера
-        for marker in strong_manager_markers:
-            if marker in text.lower():
-                speakers[speaker]["manager_score"] += 5
-        
-        # Проверяем сильные индикаторы клиента
-        for marker in strong_client_markers:
-            if marker in text.lower():
-                speakers[speaker]["client_score"] += 5
+        if not greeting_found and matcher.has_any(found, "greetings"):
+            greeting_found = True
+            stats["greeting_first"] = True
+            # Первое приветствие обычно от менеджера
+            stats["manager_score"] += 3
+        
+        # Фразы и сильные индикаторы менеджера и клиента
+        manager_score, client_score = matcher.score(found)
+        stats["manager_score"] += manager_score
+        stats["client_score"] += client_score
                 
         # Особые эвристики для распознавания ролей
         
         # 1. Представление клиники - явный признак менеджера
-        if re.search(r'(это|здравствуйте|приветствую).*клиника', text.lower()) or re.search(r'клиника.*слушает', text.lower()):
-            speakers[speaker]["manager_score"] += 10
+        if "клиника" in found and (CLINIC_INTRO_RE.search(text) or CLINIC_LISTENING_RE.search(text)):
+            stats["manager_score"] += 10
             
         # 2. Представление по имени - обычно это делает менеджер
-        if "меня зовут" in text.lower() or "меня" in text.lower() and any(name in text.lower() for name in ["мария", "елена", "ольга", "анна", "екатерина"]):
-            speakers[speaker]["manager_score"] += 7
+        if "меня зовут" in found or "меня" in found and matcher.has_any(found, "manager_names"):
+            stats["manager_score"] += 7
         
         # 3. Вопрос о имени клиента - явный признак менеджера
-        if "как я могу к вам обращаться" in text.lower() or "как вас зовут" in text.lower() or "как могу обращаться" in text.lower():
-            speakers[speaker]["manager_score"] += 8
+        if matcher.has_any(found, "name_questions"):
+            stats["manager_score"] += 8
             
         # 4. Проверка на типичные названия клиник
-        if any(clinic in text.lower() for clinic in ["дентал", "смайл", "стома", "эли", "дент", "медикал"]):
-            speakers[speaker]["manager_score"] += 6
+        if matcher.has_any(found, "clinic_names"):
+            stats["manager_score"] += 6
         
         # Если говорящий упоминает имя менеджера
-        if manager_name and manager_name.lower() in text.lower():
+        if manager_name_lower and manager_name_lower in text:
             # Если говорящий говорит о себе в третьем лице
-            if "администратор" in text.lower() or "меня зовут" in text.lower():
-                speakers[speaker]["manager_score"] += 8
+            if "администратор" in found or "меня зовут" in found:
+                stats["manager_score"] += 8
             else:
-                speakers[speaker]["client_score"] += 2
+                stats["client_score"] += 2
         
         # Если говорящий упоминает имя клиента
-        if client_name and client_name.lower() in text.lower():
+        if client_name_lower and client_name_lower in text:
             # Если говорящий обращается к клиенту по имени
-            if "вас" in text.lower() or "вам" in text.lower():
-                speakers[speaker]["manager_score"] += 3
+            if "вас" in found or "вам" in found:
+                stats["manager_score"] += 3
             else:
-                speakers[speaker]["client_score"] += 5
+                stats["client_score"] += 5
     
     # Если у нас только один говорящий, не можем определить роли
     if len(speakers) < 2:
@@ -180,7 +167,7 @@ def detect_speaker_roles(dialogue, manager_name=None, client_name=None):
         last_text = dialogue[-1]["text"].lower()
         
         # Если последняя реплика содержит прощание, скорее всего это менеджер
-        if "всего доброго" in last_text or "до свидания" in last_text or "до свидан" in last_text:
+        if matcher.has_any(matcher.find(last_text), "farewells"):
             speakers[last_speaker]["manager_score"] += 2
     
     # Определяем роли на основе собранных данных
@@ -549,6 +536,85 @@ def detect_speaker_roles(dialogue, manager_name=None, client_name=None):
 #         except:
 #             logger.error(f"Не удалось записать информацию об ошибке в файл {output_path}")
 
+def convert_speech_to_text(audio_path: str, num_speakers: int = 2, diarize: bool = True) -> Dict[str, Any]:
+    """
+    Синхронный вызов ElevenLabs speech-to-text.
+    Выполняется в пуле транскрибации, возвращает ответ API в виде словаря.
+    """
+    # Инициализируем клиент EvenLabs
+    client = evenlabs()
+
+    # Открываем файл и отправляем его на транскрибацию
+    with open(audio_path, "rb") as audio_file:
+        response = client.speech_to_text.convert(
+            file=audio_file,
+            model_id=STT_MODEL_ID,
+            diarize=diarize,
+            num_speakers=num_speakers
+        )
+
+    # Преобразуем ответ в словарь
+    return response.dict()
+
+def stt_cache_model_id(chunked: bool, preprocess: bool) -> str:
+    """Идентификатор модели для кэша STT с учетом режима распознавания"""
+    return STT_MODEL_ID + (":pre" if preprocess else "") + (":chunked" if chunked else "")
+
+async def recognize_speech(
+    audio_path: str,
+    num_speakers: int = 2,
+    diarize: bool = True,
+    chunked: bool = False,
+    preprocess: bool = False
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Распознает речь в аудиофайле с учетом режима: при необходимости сжимает
+    запись и/или распознает её параллельно по фрагментам.
+    Временные метки ответа всегда соответствуют исходной записи.
+    
+    :returns: (ответ API, идентификатор модели для кэша)
+    """
+    prepared = None
+    if preprocess:
+        try:
+            prepared = await preprocess_for_stt(audio_path)
+        except Exception as e:
+            # Предобработка - оптимизация: при ошибке ffmpeg распознаем исходный файл
+            logger.error(f"Ошибка предобработки {os.path.basename(audio_path)}, отправляем исходный файл: {e}")
+    stt_path = prepared[0] if prepared else audio_path
+    
+    try:
+        response_dict = None
+        if chunked:
+            response_dict = await transcribe_chunked(
+                stt_path,
+                convert_speech_to_text,
+                num_speakers=num_speakers,
+                diarize=diarize
+            )
+        
+        if response_dict is None:
+            # Запись короткая, режим фрагментов выключен или ffmpeg недоступен - распознаем целиком
+            chunked = False
+            # Отправляем файл на транскрибацию в пуле потоков, чтобы не блокировать event loop
+            logger.info(f"Постановка в очередь транскрибации: {transcription_pool.stats()}")
+            response_dict = await transcription_pool.run(
+                convert_speech_to_text,
+                stt_path,
+                num_speakers=num_speakers,
+                diarize=diarize
+            )
+    finally:
+        if prepared:
+            cleanup_temp_file(prepared[0])
+    
+    if prepared:
+        # Возвращаем временные метки к исходной записи
+        _, offset_map, original_duration = prepared
+        response_dict = remap_response(response_dict, offset_map, original_duration)
+    
+    return response_dict, stt_cache_model_id(chunked, bool(prepared))
+
 async def transcribe_and_save(
         audio_path: str,
         output_path: str,
@@ -559,7 +625,10 @@ async def transcribe_and_save(
         client_name: Optional[str] = None,
         is_first_contact: bool = False,
         note_data: Optional[Dict[str, Any]] = None,
-        administrator_id: Optional[str] = None
+        administrator_id: Optional[str] = None,
+        chunked: Optional[bool] = None,
+        preprocess: Optional[bool] = None,
+        audio_hash: Optional[str] = None
     ):
         """
         Выполняет транскрибацию аудиофайла и сохраняет результат в текстовый файл.
@@ -574,25 +643,46 @@ async def transcribe_and_save(
         :param is_first_contact: Флаг первичного обращения
         :param note_data: Дополнительные данные о заметке
         :param administrator_id: ID администратора для обновления лимитов
+        :param chunked: Распознавать длинную запись параллельно по фрагментам
+                        (по умолчанию - значение TRANSCRIPTION_CHUNKED)
+        :param preprocess: Сжать запись перед отправкой в STT (моно, 16 кГц, без длинных пауз)
+                           (по умолчанию - значение AUDIO_PREPROCESS)
+        :param audio_hash: SHA-256 аудиофайла, если уже посчитан при скачивании
+        :returns: True, если транскрипция успешно сохранена
         """
         try:
             logger.info(f"Начало фоновой транскрибации файла: {audio_path}")
             start_time = time.time()
             
-            # Инициализируем клиент EvenLabs
-            client = evenlabs()
-            
-            # Открываем файл и отправляем его на транскрибацию
-            with open(audio_path, "rb") as audio_file:
-                response = client.speech_to_text.convert(
-                    file=audio_file, 
-                    model_id="scribe_v1",
+            # Хэш содержимого аудио - ключ кэша ответов STT
+            if not audio_hash:
+                audio_hash = await asyncio.to_thread(compute_file_sha256, audio_path)
+            logger.info(f"SHA-256 аудиофайла {os.path.basename(audio_path)}: {audio_hash}")
+            
+            if chunked is None:
+                chunked = TRANSCRIPTION_CHUNKED
+            if preprocess is None:
+                preprocess = AUDIO_PREPROCESS
+            # Ответы, полученные с предобработкой или по фрагментам, кэшируются отдельно;
+            # цельный ответ по исходному файлу, если он уже есть, подходит для любого режима
+            cache_model_id = stt_cache_model_id(chunked, preprocess)
+            
+            # Чтение и запись кэша (JSON полного ответа STT) выполняются вне event loop
+            response_dict = await asyncio.to_thread(stt_cache_service.get, audio_hash, cache_model_id, diarize, num_speakers)
+            if response_dict is None and cache_model_id != STT_MODEL_ID:
+                response_dict = await asyncio.to_thread(stt_cache_service.get, audio_hash, STT_MODEL_ID, diarize, num_speakers)
+            
+            if response_dict is not None:
+                logger.info(f"Ответ STT найден в кэше, повторное распознавание не требуется")
+            else:
+                response_dict, cache_model_id = await recognize_speech(
+                    audio_path,
+                    num_speakers=num_speakers,
                     diarize=diarize,
-                    num_speakers=num_speakers
+                    chunked=chunked,
+                    preprocess=preprocess
                 )
-            
-            # Преобразуем ответ в словарь
-            response_dict = response.dict()
+                await asyncio.to_thread(stt_cache_service.put, audio_hash, cache_model_id, diarize, num_speakers, response_dict)
             
             # Сохраняем полный ответ API для отладки
             debug_file_path = output_path + ".debug.json"
@@ -612,97 +702,8 @@ async def transcribe_and_save(
             # Получаем слова из ответа API
             words = response_dict.get("words", [])
             
-            # Собираем слова в предложения, основываясь на паузах между словами
-            sentences = []
-            current_sentence = []
-            current_speaker = None
-            current_start = 0
-            
-            # Параметры для определения пауз между предложениями
-            PAUSE_THRESHOLD = 0.7  # Порог паузы в секундах для разделения предложений
-            MAX_SENTENCE_DURATION = 10.0  # Максимальная длительность одного предложения в секундах
-            
-            for i, word in enumerate(words):
-                # Пропускаем пробелы
-                if word.get("type") == "spacing":
-                    continue
-                
-                # Получаем текущее слово
-                word_text = word.get("text", "")
-                word_start = word.get("start", 0)
-                word_end = word.get("end", 0)
-                word_speaker = word.get("speaker_id", "Unknown")
-                
-                # Определяем, является ли это начало новой реплики
-                is_new_sentence = False
-                
-                # Если это первое слово
-                if not current_sentence:
-                    is_new_sentence = True
-                    current_speaker = word_speaker
-                else:
-                    # Если сменился говорящий
-                    if word_speaker != current_speaker:
-                        is_new_sentence = True
-                    # Если длинная пауза между словами
-                    elif i > 0 and (word_start - words[i-1].get("end", 0)) > PAUSE_THRESHOLD:
-                        is_new_sentence = True
-                    # Если предложение слишком длинное
-                    elif word_end - current_start > MAX_SENTENCE_DURATION:
-                        is_new_sentence = True
-                    # Если в слове есть знак конца предложения и следующее слово начинается с большой буквы
-                    elif (word_text.endswith('.') or word_text.endswith('?') or word_text.endswith('!')) and i < len(words)-1:
-                        next_word = words[i+1].get("text", "")
-                        if next_word and next_word[0].isupper():
-                            is_new_sentence = True
-                
-                # Если это новое предложение, сохраняем предыдущее и начинаем новое
-                if is_new_sentence and current_sentence:
-                    # Формируем текст из слов
-                    text = " ".join([w.get("text", "") for w in current_sentence])
-                    # Время начала и конца предложения
-                    start_time = current_sentence[0].get("start", 0)
-                    end_time = current_sentence[-1].get("end", 0)
-                    # Определяем говорящего (берем наиболее частый speaker_id)
-                    speaker_counts = {}
-                    for w in current_sentence:
-                        sp = w.get("speaker_id", "Unknown")
-                        speaker_counts[sp] = speaker_counts.get(sp, 0) + 1
-                    most_common_speaker = max(speaker_counts.items(), key=lambda x: x[1])[0]
-                    
-                    # Добавляем предложение в список
-                    sentences.append({
-                        "speaker_id": most_common_speaker,
-                        "text": text,
-                        "start_time": start_time,
-                        "end_time": end_time
-                    })
-                    
-                    # Начинаем новое предложение
-                    current_sentence = [word]
-                    current_speaker = word_speaker
-                    current_start = word_start
-                else:
-                    # Продолжаем текущее предложение
-                    current_sentence.append(word)
-            
-            # Добавляем последнее предложение
-            if current_sentence:
-                text = " ".join([w.get("text", "") for w in current_sentence])
-                start_time = current_sentence[0].get("start", 0)
-                end_time = current_sentence[-1].get("end", 0)
-                speaker_counts = {}
-                for w in current_sentence:
-                    sp = w.get("speaker_id", "Unknown")
-                    speaker_counts[sp] = speaker_counts.get(sp, 0) + 1
-                most_common_speaker = max(speaker_counts.items(), key=lambda x: x[1])[0]
-                
-                sentences.append({
-                    "speaker_id": most_common_speaker,
-                    "text": text,
-                    "start_time": start_time,
-                    "end_time": end_time
-                })
+            # Собираем слова в предложения за один проход, основываясь на паузах между словами
+            sentences = list(iter_utterances(words))
             
             # Обработка для случая одного предложения и других специальных случаев...
             # (код из оригинальной функции для обработки различных особых случаев)
@@ -768,7 +769,8 @@ async def transcribe_and_save(
                 })
             
             # Применяем эвристики для определения ролей (менеджер vs клиент)
-            manager_speaker, client_speaker = detect_speaker_roles(initial_dialogue, manager_name, client_name)
+            matcher = await speaker_phrases_service.get_matcher((note_data or {}).get("client_id"))
+            manager_speaker, client_speaker = detect_speaker_roles(initial_dialogue, manager_name, client_name, matcher)
             
             logger.info(f"Определены роли: Менеджер = {manager_speaker}, Клиент = {client_speaker}")
             
@@ -782,52 +784,33 @@ async def transcribe_and_save(
                 original_speaker = line["speaker"]
                 if original_speaker == manager_speaker:
                     display_name = manager_display
+                    role = ROLE_MANAGER
                 elif original_speaker == client_speaker:
                     display_name = client_display
+                    role = ROLE_CLIENT
                 else:
                     display_name = f"Участник ({original_speaker})"
+                    role = ROLE_OTHER
                     
                 dialogue.append({
                     "speaker": display_name,
+                    "role": role,
                     "text": line["text"],
                     "start_time": line["start_time"],
                     "end_time": line["end_time"]
                 })
             
-            # Записываем диалог в файл
-            with open(output_path, "w", encoding="utf-8") as file:
-                # Добавляем заголовок с информацией о звонке
-                file.write(f"Транскрипция звонка\n")
-                file.write(f"Дата и время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                
-                if phone:
-                    file.write(f"Телефон: {phone}\n")
-                
-                if client_name:
-                    file.write(f"Клиент: {client_name}\n")
-                    
-                if manager_name:
-                    file.write(f"Менеджер: {manager_name}\n")
-                    
-                if is_first_contact:
-                    file.write("Тип: Первичное обращение\n")
-                    
-                file.write(f"Файл: {os.path.basename(audio_path)}\n")
-                
-                # Добавляем информацию о длительности
-                duration = response_dict.get("duration", 0)
-                minutes = int(duration) // 60
-                seconds = int(duration) % 60
-                file.write(f"Длительность: {minutes}:{seconds:02d}\n\n")
-                
-                # Записываем диалог
-                for line in dialogue:
-                    # Форматируем время в формате [MM:SS]
-                    start_min = int(line["start_time"]) // 60
-                    start_sec = int(line["start_time"]) % 60
-                    time_str = f"[{start_min:02d}:{start_sec:02d}]"
-                    
-                    file.write(f"{time_str} {line['speaker']}: {line['text']}\n\n")
+            # Записываем диалог в файл вместе со структурированной версией
+            transcript = build_transcript(
+                dialogue,
+                audio_filename=os.path.basename(audio_path),
+                duration=response_dict.get("duration", 0),
+                phone=phone,
+                client_name=client_name,
+                manager_name=manager_name,
+                is_first_contact=is_first_contact
+            )
+            save_transcript(output_path, transcript)
                     
             process_time = time.time() - start_time
             logger.info(f"Транскрипция завершена и сохранена в {output_path} (заняло {process_time:.2f} сек.)")
@@ -847,11 +830,19 @@ async def transcribe_and_save(
                         manager=manager_name,
                         phone=phone,
                         filename_audio=audio_filename,  # Передаем имя аудиофайла
-                        administrator_id=administrator_id  # Передаем ID администратора
+                        administrator_id=administrator_id,  # Передаем ID администратора
+                        audio_hash=audio_hash,
+                        audio_path=audio_storage.relative(audio_path)
                     )
                 except Exception as db_error:
                     logger.error(f"Ошибка при сохранении информации о транскрипции в базу данных: {db_error}")
             
+            # Добавляем файл в индекс списка транскрипций и в поисковый индекс
+            await transcription_index_service.index_file(output_path)
+            await transcript_search_service.index_transcript(output_path, transcript)
+            
+            return True
+            
         except Exception as e:
             logger.error(f"Ошибка при фоновой транскрибации: {str(e)}")
             import traceback
@@ -861,8 +852,12 @@ async def transcribe_and_save(
             try:
                 with open(output_path, "w", encoding="utf-8") as file:
                     file.write(f"Ошибка при транскрибации файла {audio_path}:\n\n{str(e)}")
+                await transcription_index_service.index_file(output_path)
+                await transcript_search_service.index_transcript(output_path)
             except:
-                logger.error(f"Не удалось записать информацию об ошибке в файл {output_path}")    
+                logger.error(f"Не удалось записать информацию об ошибке в файл {output_path}")
+            
+            return False
 
 
 async def save_transcription_info(
@@ -874,7 +869,9 @@ async def save_transcription_info(
     manager: Optional[str] = None,
     phone: Optional[str] = None,
     filename_audio: Optional[str] = None,
-    administrator_id: Optional[str] = None
+    administrator_id: Optional[str] = None,
+    audio_hash: Optional[str] = None,
+    audio_path: Optional[str] = None
 ):
     """
     Сохраняет информацию о транскрипции в MongoDB для последующего поиска.
@@ -892,18 +889,25 @@ async def save_transcription_info(
         
         if existing_record:
             # Обновляем существующую запись
+            update_fields = {
+                "lead_id": lead_id,
+                "contact_id": contact_id,
+                "note_id": note_id,
+                "client_id": client_id,
+                "manager": manager,
+                "phone": phone,
+                "filename_audio": filename_audio,
+                "updated_at": datetime.now().isoformat()
+            }
+            # Хэш аудио не затираем, если он не передан
+            if audio_hash:
+                update_fields["audio_hash"] = audio_hash
+            if audio_path:
+                update_fields["audio_path"] = audio_path
+            
             await collection.update_one(
                 {"_id": existing_record["_id"]},
-                {"$set": {
-                    "lead_id": lead_id,
-                    "contact_id": contact_id,
-                    "note_id": note_id,
-                    "client_id": client_id,
-                    "manager": manager,
-                    "phone": phone,
-                    "filename_audio": filename_audio,
-                    "updated_at": datetime.now().isoformat()
-                }}
+                {"$set": update_fields}
             )
             logger.info(f"Обновлена информация о транскрипции: {filename}")
         else:
@@ -917,6 +921,8 @@ async def save_transcription_info(
                 "phone": phone,
                 "filename": filename,
                 "filename_audio": filename_audio,
+                "audio_hash": audio_hash,
+                "audio_path": audio_path,
                 "created_at": datetime.now().isoformat(),
                 "updated_at": datetime.now().isoformat()
             }
@@ -0,0 +1,240 @@
+import re
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from .amocrm_client_registry import amocrm_clients
+from .amocrm_cache import amocrm_cache
+from .bulk_transcription_service import bulk_transcription_service, CALL_NOTE_ENTITIES
+from .call_ingest_service import find_call_link
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = "mongodb://localhost:27017"
+DB_NAME = "medai"
+
+# Сколько дней помнить принятые звонки для отсева повторов
+INGESTED_NOTES_TTL_DAYS = 7
+# Сколько раз повторно принимать звонок, скачивание или транскрибация которого не удались
+CALL_RETRY_LIMIT = 3
+
+# Состояния принятого звонка
+NOTE_CLAIMED = "claimed"
+NOTE_FAILED = "failed"
+
+# Типы заметок о звонках: в вебхуках AmoCRM числовые (10, 11), в API v4 - строковые
+CALL_NOTE_TYPES = {"10", "11", "call_in", "call_out"}
+# Сущности, заметки о звонках которых принимаются из вебхука: пакет
+# транскрибации запрашивает только заметки контактов и сделок
+WEBHOOK_ENTITIES = CALL_NOTE_ENTITIES
+
+_KEY_PARTS_RE = re.compile(r"[^\[\]]+")
+
+
+def parse_webhook_form(items: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Собирает поля вебхука AmoCRM вида contacts[note][0][note][id]=...
+    во вложенный словарь; числовые индексы остаются ключами-строками.
+    """
+    payload: Dict[str, Any] = {}
+    for key, value in items:
+        parts = _KEY_PARTS_RE.findall(key)
+        if not parts:
+            continue
+        node = payload
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[parts[-1]] = value
+    return payload
+
+
+def _webhook_note(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Заметка из вебхука в виде, близком к API v4: данные звонка
+    (LINK, PHONE, DURATION) из JSON в поле text переносятся в params.
+    """
+    note = dict(raw.get("note", raw))
+    params = note.get("params") if isinstance(note.get("params"), dict) else {}
+    text = note.get("text")
+    if not params and isinstance(text, str) and text.lstrip().startswith("{"):
+        try:
+            params = {key.lower(): value for key, value in json.loads(text).items()}
+        except (ValueError, AttributeError):
+            params = {}
+    note["params"] = params
+    return note
+
+
+class AmoCRMWebhookService:
+    """
+    Прием вебхуков AmoCRM.
+    Из событий добавления заметок выбираются звонки со ссылкой на запись,
+    повторы отсеиваются по коллекции ingested_call_notes (уникальный индекс
+    client_id + note_id, общий с синхронизацией звонков), новые звонки ставятся
+    одним пакетом транскрибации (bulk_transcribe). События изменения сделок
+    и контактов сбрасывают их записи в кэше AmoCRM.
+
+    Вебхук принимается, только если поддомен аккаунта в нем (account[subdomain])
+    совпадает с поддоменом AmoCRM клиники.
+
+    Если звонок не удалось скачать или транскрибировать, отметка переводится
+    в состояние failed: такой звонок можно принять снова (до CALL_RETRY_LIMIT
+    раз), и синхронизация звонков подбирает его при следующем запуске.
+    """
+
+    def __init__(self):
+        self.client = AsyncIOMotorClient(MONGO_URI)
+        self.db = self.client[DB_NAME]
+        self.ingested = self.db.ingested_call_notes
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.ingested.create_index([("client_id", ASCENDING), ("note_id", ASCENDING)], unique=True)
+        await self.ingested.create_index([("received_at", ASCENDING)], expireAfterSeconds=INGESTED_NOTES_TTL_DAYS * 24 * 3600)
+        self._indexes_ready = True
+
+    async def claim_note(self, client_id: str, note_id: int, source: str, entity_type: Optional[str] = None) -> bool:
+        """Отмечает звонок как принятый в обработку; False, если он уже был принят"""
+        await self.ensure_indexes()
+        # Повторный прием звонка, обработка которого не удалась
+        retried = await self.ingested.update_one(
+            {"client_id": client_id, "note_id": note_id, "status": NOTE_FAILED, "failures": {"$lt": CALL_RETRY_LIMIT}},
+            {"$set": {"status": NOTE_CLAIMED, "source": source, "received_at": datetime.utcnow()}}
+        )
+        if retried.modified_count:
+            return True
+
+        try:
+            result = await self.ingested.update_one(
+                {"client_id": client_id, "note_id": note_id},
+                {"$setOnInsert": {
+                    "status": NOTE_CLAIMED,
+                    "failures": 0,
+                    "source": source,
+                    "entity_type": entity_type,
+                    "received_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Тот же звонок одновременно принят другим запросом
+            return False
+        return result.upserted_id is not None
+
+    async def release_notes(self, client_id: str, note_ids: List[int]):
+        """Снимает отметку с звонков, которые не удалось поставить в очередь"""
+        await self.ingested.delete_many({"client_id": client_id, "note_id": {"$in": note_ids}})
+
+    async def mark_failed(self, client_id: str, note_ids: List[int], error: Optional[str] = None):
+        """
+        Отмечает, что звонки не удалось скачать или транскрибировать,
+        чтобы их можно было принять снова. Ошибки только логируются.
+        """
+        try:
+            await self.ingested.update_many(
+                {"client_id": client_id, "note_id": {"$in": note_ids}, "status": {"$ne": NOTE_FAILED}},
+                {"$set": {"status": NOTE_FAILED, "last_error": error}, "$inc": {"failures": 1}}
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось снять отметку с звонков {note_ids} клиники {client_id}: {e}")
+
+    async def retry_note_ids(self, client_id: str) -> List[int]:
+        """Звонки клиники, которые не удалось обработать и можно принять снова"""
+        await self.ensure_indexes()
+        cursor = self.ingested.find(
+            {"client_id": client_id, "status": NOTE_FAILED, "failures": {"$lt": CALL_RETRY_LIMIT}},
+            {"note_id": 1}
+        )
+        return [doc["note_id"] async for doc in cursor]
+
+    async def find_clinic(self, client_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.clinics.find_one({"client_id": client_id}, {"amocrm_subdomain": 1})
+
+    @staticmethod
+    def extract_call_notes(payload: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Заметки о звонках из событий note контактов и сделок: (тип сущности, заметка)"""
+        notes = []
+        for entity_type in WEBHOOK_ENTITIES:
+            events = (payload.get(entity_type) or {}).get("note") or {}
+            for raw in events.values():
+                if not isinstance(raw, dict):
+                    continue
+                note = _webhook_note(raw)
+                if str(note.get("note_type")) in CALL_NOTE_TYPES and str(note.get("id", "")).isdigit():
+                    notes.append((entity_type, note))
+        return notes
+
+    async def _invalidate_cache(self, client_id: str, payload: Dict[str, Any]):
+        """Сбрасывает кэш AmoCRM для измененных сущностей"""
+        for entity_type in ("leads", "contacts"):
+            for action in ("update", "delete", "status", "responsible"):
+                for event in ((payload.get(entity_type) or {}).get(action) or {}).values():
+                    if isinstance(event, dict) and event.get("id"):
+                        await amocrm_cache.invalidate(client_id, entity_type, event["id"])
+
+    async def handle(self, client_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Обрабатывает разобранный вебхук.
+
+        :raises LookupError: клиника не найдена
+        :raises PermissionError: в вебхуке нет аккаунта AmoCRM или он не относится к клинике
+        """
+        clinic = await self.find_clinic(client_id)
+        if not clinic:
+            raise LookupError(f"Клиника с client_id={client_id} не найдена")
+
+        subdomain = (payload.get("account") or {}).get("subdomain")
+        if not subdomain:
+            raise PermissionError("В вебхуке не указан аккаунт AmoCRM")
+        if not clinic.get("amocrm_subdomain"):
+            raise PermissionError(f"У клиники {client_id} не указан поддомен AmoCRM")
+        if subdomain != clinic["amocrm_subdomain"]:
+            raise PermissionError(f"Вебхук аккаунта {subdomain} не относится к клинике {client_id}")
+
+        await self._invalidate_cache(client_id, payload)
+
+        call_notes = self.extract_call_notes(payload)
+        summary = {"calls": len(call_notes), "accepted": 0, "duplicates": 0, "without_link": 0, "batch_id": None}
+        if not call_notes:
+            return summary
+
+        client = await amocrm_clients.get(client_id)
+        accepted = []
+        for entity_type, note in call_notes:
+            note_id = int(note["id"])
+            call_link = find_call_link(client, note)
+            if not call_link:
+                summary["without_link"] += 1
+                continue
+
+            if not await self.claim_note(client_id, note_id, "webhook", entity_type):
+                summary["duplicates"] += 1
+                continue
+
+            entity_id = note.get("element_id") or note.get("entity_id")
+            await amocrm_cache.invalidate(client_id, "notes", f"{entity_type}/{entity_id}")
+            accepted.append(note_id)
+
+        if accepted:
+            try:
+                summary["batch_id"] = await bulk_transcription_service.create_batch(client_id=client_id, note_ids=accepted)
+            except Exception:
+                await self.release_notes(client_id, accepted)
+                raise
+        summary["accepted"] = len(accepted)
+        logger.info(f"Вебхук клиники {client_id}: звонков {summary['calls']}, принято {len(accepted)}")
+        return summary
+
+
+# Создаем экземпляр для использования в API
+amocrm_webhook_service = AmoCRMWebhookService()
@@ -13,10 +13,19 @@ DATA_DIR = os.path.join(APP_DIR, "data")
 AUDIO_DIR = os.path.join(DATA_DIR, "audio")
 TRANSCRIPTION_DIR = os.path.join(DATA_DIR, "transcription")
 
+# Кэш ответов speech-to-text, адресуемый по хэшу аудио
+STT_CACHE_DIR = os.path.join(DATA_DIR, "stt_cache")
+
+# Полнотекстовый индекс транскрипций
+SEARCH_INDEX_DIR = os.path.join(DATA_DIR, "search")
+SEARCH_INDEX_PATH = os.path.join(SEARCH_INDEX_DIR, "transcriptions.sqlite3")
+
 # Создаем директории, если они не существуют
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(AUDIO_DIR, exist_ok=True)
 os.makedirs(TRANSCRIPTION_DIR, exist_ok=True)
+os.makedirs(STT_CACHE_DIR, exist_ok=True)
+os.makedirs(SEARCH_INDEX_DIR, exist_ok=True)
 
 # Удобная функция для логирования путей
 def print_paths():
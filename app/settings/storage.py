@@ -0,0 +1,174 @@
+import os
+import re
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Iterator, List, Optional, Tuple
+
+from .paths import AUDIO_DIR, TRANSCRIPTION_DIR, DATA_DIR
+
+# Директория с результатами анализа звонков
+ANALYSIS_DIR = os.path.join(DATA_DIR, "analysis")
+os.makedirs(ANALYSIS_DIR, exist_ok=True)
+
+# Раздел для файлов, клиника которых неизвестна
+COMMON_PARTITION = "common"
+# Как долго кэшируется список разделов клиник (сек.)
+PARTITIONS_TTL = 60
+
+# Дата в имени файла: note_123_20250301_120000.txt, 7999..._20250301_120000_analysis.txt
+_FILENAME_DATE_RE = re.compile(r'_(\d{4})(\d{2})(\d{2})_\d{6}')
+_UNSAFE_CHARS_RE = re.compile(r'[^\w\-]')
+
+
+def date_from_filename(filename: str) -> Optional[datetime]:
+    """Извлекает дату из имени файла, если она там есть"""
+    match = _FILENAME_DATE_RE.search(filename)
+    if not match:
+        return None
+    try:
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        return None
+
+
+class StorageResolver:
+    """
+    Расположение файлов в хранилище: <корень>/<клиника>/YYYY/MM/DD/<имя файла>.
+    Так ни одна директория не разрастается до сотен тысяч файлов.
+
+    Новые файлы размещаются через path_for, существующие находятся через locate
+    по имени файла: дата берется из имени, поэтому проверяется по одному пути
+    на клинику. Файлы старой плоской структуры (в корне) тоже находятся.
+    Файлы без даты в имени (call_123.mp3) находятся через alocate по каталогу,
+    подключенному set_lookup.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._partitions: List[str] = []
+        self._partitions_loaded_at = 0.0
+        self._lookup: Optional[Callable[[str, Optional[str]], Awaitable[Optional[str]]]] = None
+
+    def set_lookup(self, lookup: Callable[[str, Optional[str]], Awaitable[Optional[str]]]):
+        """Подключает поиск пути по имени файла и клинике в каталоге (для alocate)"""
+        self._lookup = lookup
+
+    @staticmethod
+    def partition_name(clinic_id: Optional[str]) -> str:
+        """Имя раздела клиники, безопасное для файловой системы"""
+        if not clinic_id:
+            return COMMON_PARTITION
+        return _UNSAFE_CHARS_RE.sub("_", str(clinic_id)) or COMMON_PARTITION
+
+    def relative_dir(self, clinic_id: Optional[str] = None, when: Optional[datetime] = None) -> str:
+        when = when or datetime.now()
+        return os.path.join(self.partition_name(clinic_id), f"{when:%Y}", f"{when:%m}", f"{when:%d}")
+
+    def partition_dir(self, clinic_id: Optional[str] = None, when: Optional[datetime] = None) -> str:
+        """Директория раздела (создается при необходимости)"""
+        directory = os.path.join(self.root, self.relative_dir(clinic_id, when))
+        os.makedirs(directory, exist_ok=True)
+        partition = self.partition_name(clinic_id)
+        if self._partitions_loaded_at and partition not in self._partitions:
+            self._partitions.append(partition)
+        return directory
+
+    def path_for(self, filename: str, clinic_id: Optional[str] = None, when: Optional[datetime] = None) -> str:
+        """
+        Путь для нового файла. Если дата не указана, используется дата
+        из имени файла, а если её там нет - текущая.
+        """
+        filename = os.path.basename(filename)
+        when = when or date_from_filename(filename)
+        return os.path.join(self.partition_dir(clinic_id, when), filename)
+
+    def partition_of(self, path: str) -> Optional[str]:
+        """Раздел клиники, в котором лежит файл (None для общего раздела и плоской структуры)"""
+        parts = self.relative(path).split(os.sep)
+        if len(parts) < 2 or parts[0] in (COMMON_PARTITION, os.pardir):
+            return None
+        return parts[0]
+
+    def relative(self, path: str) -> str:
+        """Путь относительно корня хранилища (для хранения в базе)"""
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def absolute(self, relative_path: str) -> Optional[str]:
+        """Абсолютный путь по относительному; пути за пределами хранилища отвергаются"""
+        path = os.path.abspath(os.path.join(self.root, relative_path))
+        if os.path.commonpath([path, os.path.abspath(self.root)]) != os.path.abspath(self.root):
+            return None
+        return path
+
+    def partitions(self) -> List[str]:
+        """Список разделов клиник (кэшируется на PARTITIONS_TTL секунд)"""
+        now = time.monotonic()
+        if now - self._partitions_loaded_at > PARTITIONS_TTL:
+            with os.scandir(self.root) as entries:
+                self._partitions = [entry.name for entry in entries if entry.is_dir()]
+            self._partitions_loaded_at = now
+        return self._partitions
+
+    def locate(self, name: str, clinic_id: Optional[str] = None) -> Optional[str]:
+        """
+        Находит существующий файл по имени или относительному пути.
+        Возвращает абсолютный путь или None.
+        """
+        if not name:
+            return None
+
+        # Относительный путь внутри хранилища
+        if os.sep in name or "/" in name:
+            path = self.absolute(name)
+            return path if path and os.path.isfile(path) else None
+
+        # Файл старой плоской структуры
+        legacy_path = os.path.join(self.root, name)
+        if os.path.isfile(legacy_path):
+            return legacy_path
+
+        when = date_from_filename(name)
+        if not when:
+            return None
+
+        candidates = [self.partition_name(clinic_id)] if clinic_id else []
+        candidates += [p for p in self.partitions() if p not in candidates]
+        for partition in candidates:
+            path = os.path.join(self.root, partition, f"{when:%Y}", f"{when:%m}", f"{when:%d}", name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    async def alocate(self, name: str, clinic_id: Optional[str] = None) -> Optional[str]:
+        """
+        Как locate, но файлы, которые нельзя найти по имени (без даты в имени),
+        ищутся в подключенном каталоге среди файлов клиники clinic_id.
+        """
+        path = self.locate(name, clinic_id)
+        if path or not name or not self._lookup:
+            return path
+        return await self._lookup(os.path.basename(name), clinic_id)
+
+    def iter_files(self, suffixes: Tuple[str, ...]) -> Iterator[os.DirEntry]:
+        """Обходит все файлы хранилища (в том числе плоской структуры) с указанными окончаниями"""
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith(suffixes):
+                        yield entry
+
+    def iter_legacy_files(self) -> Iterator[os.DirEntry]:
+        """Файлы старой плоской структуры (лежащие прямо в корне)"""
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield entry
+
+
+# Хранилища для аудио, транскрипций и результатов анализа
+audio_storage = StorageResolver(AUDIO_DIR)
+transcription_storage = StorageResolver(TRANSCRIPTION_DIR)
+analysis_storage = StorageResolver(ANALYSIS_DIR)
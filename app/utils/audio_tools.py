@@ -0,0 +1,126 @@
+import os
+import re
+import shutil
+import asyncio
+import logging
+from typing import List, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Исполняемые файлы ffmpeg (можно переопределить через переменные окружения)
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+
+# Параметры поиска тишины: уровень шума в дБ и минимальная длительность паузы
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_DURATION = 0.4
+
+_SILENCE_START_RE = re.compile(r'silence_start:\s*(-?[\d.]+)')
+_SILENCE_END_RE = re.compile(r'silence_end:\s*(-?[\d.]+)')
+
+
+def is_ffmpeg_available() -> bool:
+    """Проверяет, установлены ли ffmpeg и ffprobe"""
+    return shutil.which(FFMPEG_BIN) is not None and shutil.which(FFPROBE_BIN) is not None
+
+
+async def _run(*args: str) -> Tuple[int, bytes, bytes]:
+    """Запускает внешнюю команду без блокировки event loop"""
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    return process.returncode, stdout, stderr
+
+
+async def probe_duration(audio_path: str) -> float:
+    """Возвращает длительность аудиофайла в секундах"""
+    code, stdout, stderr = await _run(
+        FFPROBE_BIN, "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        audio_path
+    )
+    if code != 0:
+        raise RuntimeError(f"ffprobe завершился с ошибкой: {stderr.decode(errors='ignore')[-500:]}")
+    return float(stdout.decode().strip() or 0)
+
+
+def parse_silences(ffmpeg_output: str, duration: Optional[float] = None) -> List[Tuple[float, float]]:
+    """
+    Разбирает вывод фильтра silencedetect в список интервалов тишины (start, end).
+    Незакрытый интервал в конце файла закрывается длительностью записи.
+    """
+    silences = []
+    current_start = None
+    for line in ffmpeg_output.splitlines():
+        match = _SILENCE_START_RE.search(line)
+        if match:
+            current_start = max(float(match.group(1)), 0.0)
+            continue
+        match = _SILENCE_END_RE.search(line)
+        if match and current_start is not None:
+            silences.append((current_start, float(match.group(1))))
+            current_start = None
+
+    if current_start is not None and duration:
+        silences.append((current_start, duration))
+    return silences
+
+
+async def detect_silences(
+    audio_path: str,
+    noise_db: float = SILENCE_NOISE_DB,
+    min_duration: float = SILENCE_MIN_DURATION,
+    duration: Optional[float] = None
+) -> List[Tuple[float, float]]:
+    """Находит интервалы тишины в аудиофайле с помощью ffmpeg silencedetect"""
+    code, _, stderr = await _run(
+        FFMPEG_BIN, "-hide_banner", "-nostats", "-i", audio_path,
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_duration}",
+        "-f", "null", "-"
+    )
+    if code != 0:
+        raise RuntimeError(f"ffmpeg silencedetect завершился с ошибкой: {stderr.decode(errors='ignore')[-500:]}")
+    return parse_silences(stderr.decode(errors="ignore"), duration)
+
+
+async def extract_segment(audio_path: str, output_path: str, start: float, end: float):
+    """
+    Вырезает фрагмент [start, end) в отдельный mp3-файл.
+    Фрагмент перекодируется, чтобы границы не смещались к ближайшему кадру.
+    """
+    code, _, stderr = await _run(
+        FFMPEG_BIN, "-hide_banner", "-nostats", "-y",
+        "-ss", f"{start:.3f}", "-i", audio_path,
+        "-t", f"{max(end - start, 0):.3f}",
+        "-vn", "-c:a", "libmp3lame", "-q:a", "4",
+        output_path
+    )
+    if code != 0:
+        raise RuntimeError(f"ffmpeg не смог вырезать фрагмент {start:.1f}-{end:.1f}: {stderr.decode(errors='ignore')[-500:]}")
+
+
+async def render_segments(
+    audio_path: str,
+    output_path: str,
+    segments: List[Tuple[float, float]],
+    sample_rate: int = 16000,
+    bitrate: str = "32k"
+):
+    """
+    Собирает из записи только указанные интервалы, сводит в моно,
+    понижает частоту дискретизации и кодирует в mp3 с заданным битрейтом.
+    """
+    selection = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in segments)
+    code, _, stderr = await _run(
+        FFMPEG_BIN, "-hide_banner", "-nostats", "-y", "-i", audio_path,
+        "-vn", "-af", f"aselect='{selection}',asetpts=N/SR/TB",
+        "-ac", "1", "-ar", str(sample_rate),
+        "-c:a", "libmp3lame", "-b:a", bitrate,
+        output_path
+    )
+    if code != 0:
+        raise RuntimeError(f"ffmpeg не смог подготовить аудио: {stderr.decode(errors='ignore')[-500:]}")
@@ -0,0 +1,98 @@
+import os
+import uuid
+import hashlib
+import logging
+from dataclasses import dataclass
+
+import aiofiles
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Размер блока при потоковом скачивании
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Максимальный размер записи звонка (байт)
+MAX_AUDIO_DOWNLOAD_SIZE = int(os.getenv("MAX_AUDIO_DOWNLOAD_SIZE", str(200 * 1024 * 1024)))
+# Сколько байт HTML-ответа сохранять для отладки
+ERROR_BODY_LIMIT = 64 * 1024
+
+_HTML_SIGNATURES = (b"<!doctype", b"<html", b"<?xml", b"<head", b"<body")
+
+
+def looks_like_html(content_type: str, head: bytes) -> bool:
+    """Проверяет по Content-Type и первым байтам, что вместо аудио пришла HTML-страница"""
+    if content_type.lower().startswith(("text/html", "application/xhtml")):
+        return True
+    return head.lstrip()[:16].lower().startswith(_HTML_SIGNATURES)
+
+
+class DownloadError(Exception):
+    """
+    Ошибка потокового скачивания.
+    reason: html, too_large, too_small; для html в body - начало ответа.
+    """
+
+    def __init__(self, message: str, reason: str, size: int = 0, body: bytes = b""):
+        super().__init__(message)
+        self.reason = reason
+        self.size = size
+        self.body = body
+
+
+@dataclass
+class DownloadResult:
+    path: str
+    size: int
+    sha256: str
+    content_type: str
+
+
+async def stream_to_file(
+    response: aiohttp.ClientResponse,
+    file_path: str,
+    max_size: int = MAX_AUDIO_DOWNLOAD_SIZE,
+    min_size: int = 1,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE
+) -> DownloadResult:
+    """
+    Сохраняет тело ответа в файл блоками: в памяти держится один блок,
+    SHA-256 и размер считаются по ходу записи. Запись идет во временный файл
+    рядом с целевым, который переименовывается только после успешного скачивания,
+    поэтому оборванная загрузка не оставляет битого файла.
+
+    :raises DownloadError: HTML вместо аудио, превышен max_size или получено меньше min_size байт
+    """
+    content_type = response.headers.get("Content-Type", "")
+    if response.content_length is not None and response.content_length > max_size:
+        raise DownloadError(
+            f"Размер файла {response.content_length} байт превышает лимит {max_size} байт",
+            "too_large", size=response.content_length
+        )
+
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                if size == 0 and looks_like_html(content_type, chunk):
+                    body = chunk + await response.content.read(max(0, ERROR_BODY_LIMIT - len(chunk)))
+                    raise DownloadError("Получен HTML вместо аудио", "html", size=len(body), body=body)
+
+                size += len(chunk)
+                if size > max_size:
+                    raise DownloadError(f"Размер файла превышает лимит {max_size} байт", "too_large", size=size)
+
+                sha256.update(chunk)
+                await f.write(chunk)
+
+        if size < min_size:
+            raise DownloadError(f"Получено слишком мало данных: {size} байт", "too_small", size=size)
+
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    logger.info(f"Скачано {size} байт в {file_path}")
+    return DownloadResult(path=file_path, size=size, sha256=sha256.hexdigest(), content_type=content_type)
@@ -0,0 +1,126 @@
+import re
+from typing import Dict, List, Iterable, Optional, Set, Tuple
+
+# Списки фраз по умолчанию для определения ролей говорящих
+DEFAULT_SPEAKER_PHRASES: Dict[str, List[str]] = {
+    # Фразы, типичные для менеджера
+    "manager_phrases": [
+        "клиника", "стоматология",
+        "запись", "администратор", "как могу к вам обращаться",
+        "врач", "прием", "доктор", "стоматологическая клиника", "приглашаем",
+        "как вас зовут", "специалист", "услуги", "мы работаем",
+        "рассрочка", "помочь", "подобрать", "предложить",
+        "консультация", "спасибо за звонок",
+        "всего доброго"
+    ],
+    # Фразы, типичные для клиента
+    "client_phrases": [
+        "сколько стоит", "цена", "дорого", "у меня проблема",
+        "больно", "болит зуб", "когда можно", "хочу",
+        "у меня проблема", "подскажите", "я хотел", "мне нужно", "мне надо", "сколько будет",
+        "как попасть", "как записаться", "хочу записаться"
+    ],
+    # Специальные маркеры сильного индикатора менеджера
+    "strong_manager_markers": [
+        "администратор", "клиника", "стоматология", "я вас слушаю",
+        "чем могу помочь", "стоматологическая клиника", "медицинский центр"
+    ],
+    # Специальные маркеры сильного индикатора клиента
+    "strong_client_markers": [
+        "хочу записаться", "меня беспокоит", "мне нужно", "у меня болит",
+        "подскажите пожалуйста", "сколько будет стоить"
+    ],
+    # Приветствия (первое приветствие обычно от менеджера)
+    "greetings": ["добрый день", "здравствуйте", "добрый", "алло"],
+    # Типичные имена администраторов при представлении
+    "manager_names": ["мария", "елена", "ольга", "анна", "екатерина"],
+    # Вопрос об имени клиента
+    "name_questions": ["как я могу к вам обращаться", "как вас зовут", "как могу обращаться"],
+    # Типичные названия клиник
+    "clinic_names": ["дентал", "смайл", "стома", "эли", "дент", "медикал"],
+    # Прощания в последней реплике
+    "farewells": ["всего доброго", "до свидания", "до свидан"],
+}
+
+# Веса списков фраз: (очки менеджера, очки клиента) за каждое вхождение фразы в список
+PHRASE_WEIGHTS: Dict[str, Tuple[int, int]] = {
+    "manager_phrases": (1, 0),
+    "client_phrases": (0, 1),
+    "strong_manager_markers": (5, 0),
+    "strong_client_markers": (0, 5),
+}
+
+# Служебные фразы, на которые опираются эвристики; всегда входят в автомат
+SERVICE_PHRASES = ["меня зовут", "меня", "администратор", "клиника", "вас", "вам"]
+
+
+class PhraseMatcher:
+    """
+    Скомпилированный набор фраз для определения ролей говорящих.
+
+    Все фразы объединены в одно регулярное выражение с просмотром вперед,
+    поэтому текст реплики сканируется один раз. Альтернативы отсортированы
+    по убыванию длины: в каждой позиции находится самая длинная фраза,
+    а все фразы, являющиеся её префиксами, добавляются из заранее
+    посчитанной таблицы. Результат совпадает с проверкой `phrase in text`
+    для каждой фразы по отдельности.
+    """
+
+    def __init__(self, phrases: Optional[Dict[str, Iterable[str]]] = None):
+        config = dict(DEFAULT_SPEAKER_PHRASES)
+        if phrases:
+            config.update({key: list(value) for key, value in phrases.items() if value is not None})
+
+        self.groups: Dict[str, frozenset] = {
+            key: frozenset(p.lower() for p in values if p)
+            for key, values in config.items()
+        }
+
+        # Суммарный вес каждой фразы с учетом повторов в списках
+        self.weights: Dict[str, Tuple[int, int]] = {}
+        for key, (manager_weight, client_weight) in PHRASE_WEIGHTS.items():
+            for phrase in config.get(key, []):
+                if not phrase:
+                    continue
+                phrase = phrase.lower()
+                m, c = self.weights.get(phrase, (0, 0))
+                self.weights[phrase] = (m + manager_weight, c + client_weight)
+
+        all_phrases: Set[str] = set(SERVICE_PHRASES)
+        for values in self.groups.values():
+            all_phrases.update(values)
+
+        ordered = sorted(all_phrases, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(p) for p in ordered) + "))")
+        # Для каждой фразы - все фразы набора, которые являются её префиксами
+        self._expansion: Dict[str, Tuple[str, ...]] = {
+            p: tuple(q for q in ordered if p.startswith(q)) for p in ordered
+        }
+
+    def find(self, text: str) -> Set[str]:
+        """Возвращает множество фраз, встречающихся в тексте (текст в нижнем регистре)"""
+        found: Set[str] = set()
+        expansion = self._expansion
+        for match in self._pattern.finditer(text):
+            found.update(expansion[match.group(1)])
+        return found
+
+    def score(self, found: Set[str]) -> Tuple[int, int]:
+        """Считает очки менеджера и клиента по найденным фразам"""
+        manager_score = 0
+        client_score = 0
+        weights = self.weights
+        for phrase in found:
+            weight = weights.get(phrase)
+            if weight:
+                manager_score += weight[0]
+                client_score += weight[1]
+        return manager_score, client_score
+
+    def has_any(self, found: Set[str], group: str) -> bool:
+        """Проверяет, найдена ли хотя бы одна фраза из группы"""
+        return not self.groups.get(group, frozenset()).isdisjoint(found)
+
+
+# Набор фраз по умолчанию, компилируется один раз при импорте
+default_phrase_matcher = PhraseMatcher()
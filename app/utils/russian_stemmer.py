@@ -0,0 +1,145 @@
+import re
+from functools import lru_cache
+from typing import List
+
+# Стеммер для русского языка по алгоритму Snowball (Портер)
+# https://snowballstem.org/algorithms/russian/stemmer.html
+
+_VOWELS = "аеиоуыэюя"
+
+_PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+_PERFECTIVE_GERUND_2 = ("ывшись", "ившись", "ывши", "ивши", "ыв", "ив")
+_REFLEXIVE = ("ся", "сь")
+_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому",
+    "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею"
+)
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_VERB_1 = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+_VERB_2 = (
+    "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено",
+    "ует", "уют", "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым",
+    "ен", "ят", "ит", "ыт", "ую", "ю"
+)
+_NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях",
+    "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой", "ий", "ям", "ем", "ам", "ом",
+    "ах", "ях", "ию", "ью", "ия", "ья",
+    "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я"
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _sorted(endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+_PERFECTIVE_GERUND_1 = _sorted(_PERFECTIVE_GERUND_1)
+_PERFECTIVE_GERUND_2 = _sorted(_PERFECTIVE_GERUND_2)
+_ADJECTIVE = _sorted(_ADJECTIVE)
+_PARTICIPLE_1 = _sorted(_PARTICIPLE_1)
+_PARTICIPLE_2 = _sorted(_PARTICIPLE_2)
+_VERB_1 = _sorted(_VERB_1)
+_VERB_2 = _sorted(_VERB_2)
+_NOUN = _sorted(_NOUN)
+
+
+def _regions(word: str):
+    """Возвращает начала областей RV и R2"""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    r2 = next_region(r1)
+    return rv, r2
+
+
+def _strip(word: str, rv: int, endings, preceded_by_a: bool = False):
+    """
+    Удаляет самое длинное окончание из endings, лежащее в области RV.
+    Для окончаний первой группы требуется предшествующая "а" или "я".
+    Возвращает новое слово или None, если окончание не найдено.
+    """
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            if preceded_by_a:
+                position = len(word) - len(ending) - 1
+                if position < rv or word[position] not in "ая":
+                    continue
+            return word[:-len(ending)]
+    return None
+
+
+@lru_cache(maxsize=50000)
+def stem(word: str) -> str:
+    """Возвращает основу русского слова (слово должно быть в нижнем регистре)"""
+    word = word.replace("ё", "е")
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1: деепричастие совершенного вида, иначе возвратность и
+    # прилагательное/причастие, глагол или существительное
+    result = _strip(word, rv, _PERFECTIVE_GERUND_1, True) or _strip(word, rv, _PERFECTIVE_GERUND_2)
+    if result is not None:
+        word = result
+    else:
+        word = _strip(word, rv, _REFLEXIVE) or word
+
+        result = _strip(word, rv, _ADJECTIVE)
+        if result is not None:
+            word = _strip(result, rv, _PARTICIPLE_1, True) or _strip(result, rv, _PARTICIPLE_2) or result
+        else:
+            result = _strip(word, rv, _VERB_1, True) or _strip(word, rv, _VERB_2)
+            if result is not None:
+                word = result
+            else:
+                word = _strip(word, rv, _NOUN) or word
+
+    # Шаг 2: окончание "и"
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательное окончание в R2
+    for ending in _DERIVATIONAL:
+        if word.endswith(ending) and len(word) - len(ending) >= r2:
+            word = word[:-len(ending)]
+            break
+
+    # Шаг 4: "нн" -> "н", превосходная степень, мягкий знак
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        result = _strip(word, rv, _SUPERLATIVE)
+        if result is not None:
+            word = result
+            if word.endswith("нн") and len(word) - 2 >= rv:
+                word = word[:-1]
+        elif word.endswith("ь") and len(word) - 1 >= rv:
+            word = word[:-1]
+
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на слова в нижнем регистре"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def stem_text(text: str) -> List[str]:
+    """Возвращает основы всех слов текста"""
+    return [stem(token) for token in tokenize(text)]
@@ -0,0 +1,94 @@
+from typing import Dict, Any, Iterable, Iterator
+
+# Порог паузы в секундах для разделения предложений
+PAUSE_THRESHOLD = 0.7
+# Максимальная длительность одного предложения в секундах
+MAX_SENTENCE_DURATION = 10.0
+# Знаки конца предложения
+SENTENCE_END_CHARS = (".", "?", "!")
+
+
+def iter_utterances(
+    words: Iterable[Dict[str, Any]],
+    pause_threshold: float = PAUSE_THRESHOLD,
+    max_sentence_duration: float = MAX_SENTENCE_DURATION
+) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково собирает слова из ответа STT в реплики (предложения).
+
+    Новая реплика начинается при смене говорящего, паузе больше pause_threshold,
+    превышении max_sentence_duration или если слово заканчивается знаком
+    конца предложения, а следующий элемент потока начинается с заглавной буквы.
+    Паузы и заглавная буква проверяются по соседним элементам исходного потока,
+    включая элементы типа "spacing" - так же, как в прежней реализации.
+
+    Работает за один проход с просмотром на один элемент вперед и отдает
+    реплики по мере готовности: {"speaker_id", "text", "start_time", "end_time"}.
+    """
+    texts = []  # Буфер текстов текущей реплики, переиспользуется
+    current_speaker = None
+    current_start = 0
+    sentence_start = 0
+    sentence_end = 0
+    prev_end = None  # Конец предыдущего элемента потока (включая spacing)
+
+    iterator = iter(words)
+    word = next(iterator, None)
+
+    while word is not None:
+        next_word = next(iterator, None)
+
+        # Пропускаем пробелы, но учитываем их при расчете пауз
+        if word.get("type") == "spacing":
+            prev_end = word.get("end", 0)
+            word = next_word
+            continue
+
+        word_text = word.get("text", "")
+        word_start = word.get("start", 0)
+        word_end = word.get("end", 0)
+        word_speaker = word.get("speaker_id", "Unknown")
+
+        # Определяем, является ли это начало новой реплики
+        if not texts:
+            is_new_sentence = True
+            current_speaker = word_speaker
+        elif word_speaker != current_speaker:
+            is_new_sentence = True
+        elif prev_end is not None and (word_start - prev_end) > pause_threshold:
+            is_new_sentence = True
+        elif word_end - current_start > max_sentence_duration:
+            is_new_sentence = True
+        elif word_text.endswith(SENTENCE_END_CHARS) and next_word is not None:
+            following = next_word.get("text", "")
+            is_new_sentence = bool(following) and following[0].isupper()
+        else:
+            is_new_sentence = False
+
+        if is_new_sentence and texts:
+            yield {
+                "speaker_id": current_speaker,
+                "text": " ".join(texts),
+                "start_time": sentence_start,
+                "end_time": sentence_end
+            }
+            texts.clear()
+            current_speaker = word_speaker
+            current_start = word_start
+
+        if not texts:
+            sentence_start = word_start
+        texts.append(word_text)
+        sentence_end = word_end
+
+        prev_end = word_end
+        word = next_word
+
+    # Отдаем последнюю реплику
+    if texts:
+        yield {
+            "speaker_id": current_speaker,
+            "text": " ".join(texts),
+            "start_time": sentence_start,
+            "end_time": sentence_end
+        }
@@ -0,0 +1,169 @@
+"""
+Микробенчмарк сегментации слов STT в реплики.
+
+Генерирует синтетический поток слов для часового разговора (в формате ответа
+ElevenLabs, с элементами "spacing"), сравнивает результат потокового сегментатора
+с прежней реализацией из transcribe_and_save и выводит время работы.
+
+Запуск из корня проекта:
+    python -m benchmarks.segmenter_benchmark [--minutes 60] [--repeat 5]
+"""
+import argparse
+import random
+import time
+
+from app.utils.segmenter import iter_utterances, PAUSE_THRESHOLD, MAX_SENTENCE_DURATION
+
+VOCABULARY = [
+    "здравствуйте", "клиника", "запись", "врач", "хочу", "записаться", "на", "прием",
+    "сколько", "стоит", "лечение", "зуба", "подскажите", "пожалуйста", "когда", "можно",
+    "завтра", "утром", "вечером", "спасибо", "да", "нет", "конечно", "хорошо"
+]
+
+
+def generate_words(minutes: int, seed: int = 42):
+    """Генерирует синтетический поток слов длительностью minutes минут"""
+    rnd = random.Random(seed)
+    words = []
+    t = 0.0
+    speaker = "speaker_0"
+    capitalize = True
+    total = minutes * 60
+
+    while t < total:
+        # Смена говорящего примерно раз в 12 слов
+        if rnd.random() < 0.08:
+            speaker = "speaker_1" if speaker == "speaker_0" else "speaker_0"
+            capitalize = True
+
+        text = rnd.choice(VOCABULARY)
+        if capitalize:
+            text = text.capitalize()
+            capitalize = False
+        if rnd.random() < 0.1:
+            text += rnd.choice([".", "?", "!"])
+            capitalize = True
+
+        duration = rnd.uniform(0.15, 0.6)
+        words.append({"text": text, "start": t, "end": t + duration, "type": "word", "speaker_id": speaker})
+        t += duration
+
+        # Пробел между словами; иногда с длинной паузой после него
+        gap = rnd.uniform(0.02, 0.2)
+        words.append({"text": " ", "start": t, "end": t + gap, "type": "spacing", "speaker_id": speaker})
+        t += gap
+        if rnd.random() < 0.05:
+            t += rnd.uniform(0.8, 2.0)
+
+    return words
+
+
+def legacy_segment(words):
+    """Прежняя реализация сборки предложений из transcribe_and_save (для сравнения)"""
+    sentences = []
+    current_sentence = []
+    current_speaker = None
+    current_start = 0
+
+    for i, word in enumerate(words):
+        if word.get("type") == "spacing":
+            continue
+
+        word_text = word.get("text", "")
+        word_start = word.get("start", 0)
+        word_end = word.get("end", 0)
+        word_speaker = word.get("speaker_id", "Unknown")
+
+        is_new_sentence = False
+
+        if not current_sentence:
+            is_new_sentence = True
+            current_speaker = word_speaker
+        else:
+            if word_speaker != current_speaker:
+                is_new_sentence = True
+            elif i > 0 and (word_start - words[i-1].get("end", 0)) > PAUSE_THRESHOLD:
+                is_new_sentence = True
+            elif word_end - current_start > MAX_SENTENCE_DURATION:
+                is_new_sentence = True
+            elif (word_text.endswith('.') or word_text.endswith('?') or word_text.endswith('!')) and i < len(words)-1:
+                next_word = words[i+1].get("text", "")
+                if next_word and next_word[0].isupper():
+                    is_new_sentence = True
+
+        if is_new_sentence and current_sentence:
+            text = " ".join([w.get("text", "") for w in current_sentence])
+            start_time = current_sentence[0].get("start", 0)
+            end_time = current_sentence[-1].get("end", 0)
+            speaker_counts = {}
+            for w in current_sentence:
+                sp = w.get("speaker_id", "Unknown")
+                speaker_counts[sp] = speaker_counts.get(sp, 0) + 1
+            most_common_speaker = max(speaker_counts.items(), key=lambda x: x[1])[0]
+
+            sentences.append({
+                "speaker_id": most_common_speaker,
+                "text": text,
+                "start_time": start_time,
+                "end_time": end_time
+            })
+
+            current_sentence = [word]
+            current_speaker = word_speaker
+            current_start = word_start
+        else:
+            current_sentence.append(word)
+
+    if current_sentence:
+        text = " ".join([w.get("text", "") for w in current_sentence])
+        start_time = current_sentence[0].get("start", 0)
+        end_time = current_sentence[-1].get("end", 0)
+        speaker_counts = {}
+        for w in current_sentence:
+            sp = w.get("speaker_id", "Unknown")
+            speaker_counts[sp] = speaker_counts.get(sp, 0) + 1
+        most_common_speaker = max(speaker_counts.items(), key=lambda x: x[1])[0]
+
+        sentences.append({
+            "speaker_id": most_common_speaker,
+            "text": text,
+            "start_time": start_time,
+            "end_time": end_time
+        })
+
+    return sentences
+
+
+def measure(func, words, repeat):
+    """Возвращает лучшее время из repeat запусков и результат"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(words)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сегментации слов в реплики")
+    parser.add_argument("--minutes", type=int, default=60, help="Длительность синтетического разговора")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов")
+    args = parser.parse_args()
+
+    words = generate_words(args.minutes)
+    print(f"Элементов в потоке: {len(words)} ({args.minutes} мин.)")
+
+    legacy_time, legacy_result = measure(legacy_segment, words, args.repeat)
+    stream_time, stream_result = measure(lambda w: list(iter_utterances(w)), words, args.repeat)
+
+    if legacy_result != stream_result:
+        raise SystemExit("Результаты сегментации отличаются от прежней реализации")
+
+    print(f"Реплик: {len(stream_result)}")
+    print(f"Прежняя реализация:  {legacy_time * 1000:.1f} мс")
+    print(f"Потоковый сегментатор: {stream_time * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
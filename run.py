@@ -2,7 +2,12 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
-from app.routers import admin, amocrm, transcription, analysis, reports, call_records
+from app.routers import admin, amocrm, transcription, analysis, reports, call_records, jobs
+from app.services.transcription_pool import transcription_pool
+from app.services.download_client import download_client
+from app.services.amocrm_client_registry import amocrm_clients
+from app.services.amocrm_cache import amocrm_cache
+from app.services.amocrm_rate_limiter import amocrm_rate_limiter
 
 from app.settings.paths import print_paths
 # Выводим информацию о путях при запуске
@@ -54,6 +59,7 @@ app.include_router(transcription.router)
 app.include_router(analysis.router)
 app.include_router(reports.router)
 app.include_router(call_records.router)
+app.include_router(jobs.router)
 
 # Эндпоинт для проверки статуса API
 @app.get("/api/status")
@@ -61,9 +67,35 @@ async def get_status():
     return {
         "success": True,
         "message": "API работает нормально",
-        "data": {"version": "1.0.0"}
+        "data": {
+            "version": "1.0.0",
+            "transcription_pool": transcription_pool.stats(),
+            "amocrm_clients": amocrm_clients.stats(),
+            "amocrm_cache": amocrm_cache.stats(),
+            "amocrm_rate_limiter": amocrm_rate_limiter.stats()
+        }
     }
 
+# Все запросы клиентов AmoCRM проходят через общий ограничитель частоты
+@app.on_event("startup")
+async def install_amocrm_rate_limiter():
+    amocrm_rate_limiter.install()
+
+# Останавливаем пул транскрибации при завершении приложения
+@app.on_event("shutdown")
+async def shutdown_transcription_pool():
+    transcription_pool.shutdown()
+
+# Закрываем общую сессию скачивания записей
+@app.on_event("shutdown")
+async def shutdown_download_client():
+    await download_client.close()
+
+
+@app.on_event("shutdown")
+async def shutdown_amocrm_clients():
+    await amocrm_clients.close_all()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("run:app", host="127.0.0.1", port=8000)
\ No newline at end of file
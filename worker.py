@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import signal
+
+from app.services.job_worker import JobWorker
+from app.services.download_client import download_client
+from app.services.amocrm_client_registry import amocrm_clients
+from app.services.amocrm_rate_limiter import amocrm_rate_limiter
+from app.services.call_sync_service import call_sync_service, CALL_SYNC_ENABLED
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    # Все запросы клиентов AmoCRM проходят через общий ограничитель частоты
+    amocrm_rate_limiter.install()
+    worker = JobWorker()
+    stopping = asyncio.Event()
+
+    def stop():
+        worker.stop()
+        stopping.set()
+
+    # Корректно завершаем работу по SIGINT/SIGTERM
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except NotImplementedError:
+            pass
+
+    # Периодическая синхронизация новых звонков из AmoCRM
+    scheduler = asyncio.ensure_future(call_sync_service.run_scheduler(stopping)) if CALL_SYNC_ENABLED else None
+
+    try:
+        await worker.run()
+    finally:
+        stopping.set()
+        if scheduler:
+            await scheduler
+        await download_client.close()
+        await amocrm_clients.close_all()
+
+
+if __name__ == "__main__":
+    # Запуск: python worker.py
+    asyncio.run(main())